@@ -0,0 +1,193 @@
+"""
+Process-wide MCP session and agents for the MIDAS app.
+
+The Neptune MCP server is started once per process (lazily, on the first question) instead of once per
+question, and its tools and the graph schema are kept warm. A periodic health check restarts the server
+when it stops responding.
+"""
+
+import queue
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+
+from strands import Agent
+
+SCHEMA_TOOL_NAME = "get_graph_schema"
+# seconds between health checks of the MCP server, and before the cached schema is fetched again
+HEALTH_CHECK_INTERVAL = 60
+SCHEMA_TTL = 3600
+# agents answering questions at the same time, each one is reused for later questions
+DEFAULT_MAX_AGENTS = 4
+
+BASE_SYSTEM_PROMPT = """You are a helpful assistant that explores biomedical knowledge graphs.
+Provide clear, concise answers without excessive markdown formatting."""
+FETCH_SCHEMA_PROMPT = "Always fetch the schema first to ensure correct labels and property names."
+CACHED_SCHEMA_PROMPT = """Use the graph schema below for labels and property names. Only fetch the schema again if a query \
+fails because of a label or property name.
+
+Graph schema:
+{schema}"""
+
+
+def get_tool_result_text(tool_result: dict) -> str:
+    return "\n".join(content["text"] for content in tool_result.get("content", []) if "text" in content)
+
+def ignore_agent_events(**kwargs):
+    pass
+
+def create_strands_agent(tools: list, system_prompt: str):
+    return Agent(tools=tools, system_prompt=system_prompt, callback_handler=ignore_agent_events)
+
+
+class AgentService:
+    """
+    Owns the MCP client and a pool of agents built on its tools, shared by every session of the app.
+    create_mcp_client returns a new, unstarted strands MCPClient, it's called again on restarts.
+    """
+    def __init__(self, create_mcp_client, create_agent=create_strands_agent, max_agents: int = DEFAULT_MAX_AGENTS,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL, schema_ttl: float = SCHEMA_TTL,
+                 local_tools: list = None, local_tools_prompt: str = None):
+        self.create_mcp_client = create_mcp_client
+        self.create_agent = create_agent
+        # tools answered in process (e.g. from precomputed graph statistics), given to the agents with the MCP tools
+        self.local_tools = local_tools or []
+        self.local_tools_prompt = local_tools_prompt
+        self.health_check_interval = health_check_interval
+        self.schema_ttl = schema_ttl
+        self.lock = threading.RLock()
+        self.agent_slots = threading.BoundedSemaphore(max_agents)
+        self.idle_agents = queue.LifoQueue()
+        self.mcp_client = None
+        self.tools = None
+        self.schema = None
+        self.schema_loaded_at = None
+        self.health_checked_at = None
+        # agents built before a restart or a schema refresh are discarded instead of reused
+        self.generation = 0
+        self.restarts = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self.mcp_client is not None
+
+    def start(self):
+        with self.lock:
+            if self.is_running:
+                return
+            mcp_client = self.create_mcp_client()
+            mcp_client.start()
+            self.mcp_client = mcp_client
+            self.tools = mcp_client.list_tools_sync()
+            self.health_checked_at = time.monotonic()
+            self.refresh_schema()
+
+    def stop(self):
+        with self.lock:
+            if self.mcp_client is not None:
+                try:
+                    self.mcp_client.stop(None, None, None)
+                except Exception as e:
+                    print(f"Error stopping the MCP client: {e}")
+            self.mcp_client = None
+            self.tools = None
+            self.generation += 1
+
+    def restart(self):
+        with self.lock:
+            print("Restarting the MCP client")
+            self.stop()
+            self.restarts += 1
+            self.start()
+
+    def refresh_schema(self):
+        """Fetch the graph schema through the MCP server, it's included in the agents' system prompt."""
+        with self.lock:
+            if any(getattr(tool, "tool_name", None) == SCHEMA_TOOL_NAME for tool in self.tools):
+                try:
+                    tool_result = self.mcp_client.call_tool_sync(tool_use_id=str(uuid.uuid4()),
+                                                                 name=SCHEMA_TOOL_NAME, arguments={})
+                    self.schema = get_tool_result_text(tool_result) if tool_result.get("status") == "success" \
+                        else None
+                except Exception as e:
+                    print(f"Could not fetch the graph schema: {e}")
+                    self.schema = None
+            self.schema_loaded_at = time.monotonic()
+            self.generation += 1
+
+    def check_health(self, force: bool = False):
+        """Start the MCP client if needed, restart it if it stopped responding, and refresh a stale schema."""
+        with self.lock:
+            if not self.is_running:
+                self.start()
+                return
+            now = time.monotonic()
+            if force or now - self.health_checked_at >= self.health_check_interval:
+                self.health_checked_at = now
+                try:
+                    self.tools = self.mcp_client.list_tools_sync()
+                except Exception as e:
+                    print(f"MCP client health check failed: {e}")
+                    self.restart()
+                    return
+            if now - self.schema_loaded_at >= self.schema_ttl:
+                self.refresh_schema()
+
+    def get_system_prompt(self) -> str:
+        system_prompt = BASE_SYSTEM_PROMPT
+        if self.local_tools_prompt:
+            system_prompt = f"{system_prompt}\n{self.local_tools_prompt}"
+        if self.schema:
+            return f"{system_prompt}\n{CACHED_SCHEMA_PROMPT.format(schema=self.schema)}"
+        return f"{system_prompt}\n{FETCH_SCHEMA_PROMPT}"
+
+    @contextmanager
+    def get_agent(self):
+        """Borrow an idle agent (or build one) for a single question."""
+        with self.agent_slots:
+            agent, generation = None, None
+            while agent is None:
+                try:
+                    agent, generation = self.idle_agents.get_nowait()
+                except queue.Empty:
+                    break
+                if generation != self.generation:
+                    agent = None
+            if agent is None:
+                with self.lock:
+                    generation = self.generation
+                    agent = self.create_agent(self.tools + self.local_tools, self.get_system_prompt())
+            # answers don't depend on the previous questions of other sessions
+            agent.messages = []
+            yield agent
+            self.idle_agents.put((agent, generation))
+
+    def ask(self, question: str, callback_handler=None):
+        """
+        Answer a question with a pooled agent.
+        callback_handler receives the agent's streaming events (text deltas as data=..., tool calls as
+        current_tool_use=...) while the answer is generated.
+        """
+        self.check_health()
+        try:
+            with self.get_agent() as agent:
+                agent.callback_handler = callback_handler or ignore_agent_events
+                return agent(question)
+        except Exception:
+            # a dead MCP server shows up as a failed tool call, retry once on a restarted server
+            generation = self.generation
+            self.check_health(force=True)
+            if self.generation == generation:
+                raise
+            with self.get_agent() as agent:
+                agent.callback_handler = callback_handler or ignore_agent_events
+                return agent(question)
+
+    def get_status(self) -> dict:
+        return {"running": self.is_running,
+                "tools": len(self.tools or []),
+                "schema_cached": self.schema is not None,
+                "restarts": self.restarts,
+                "idle_agents": self.idle_agents.qsize()}
@@ -0,0 +1,130 @@
+"""
+Shared cache of the agent's answers for the MIDAS app.
+
+Answers are stored in sqlite on local disk, keyed by the normalized question text and the version of the
+loaded graph, so a reload of the graph never serves answers about the previous graph.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+
+from midas.util import get_data_output_directory_path
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10_000
+# expired entries are deleted every this many inserts, and least recently used ones as soon as there are too many
+EVICT_EVERY_INSERTS = 100
+UNKNOWN_GRAPH_VERSION = "unknown"
+NON_WORD_PATTERN = re.compile(r"[^\w\s']+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def get_answer_cache_path() -> Path:
+    return get_data_output_directory_path() / "answer_cache.sqlite"
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace, so trivially different phrasings share an answer."""
+    question = NON_WORD_PATTERN.sub(" ", question.lower())
+    return WHITESPACE_PATTERN.sub(" ", question).strip()
+
+
+class AnswerCache:
+    """
+    Persistent sqlite cache of answers by (graph version, normalized question).
+    Entries expire after ttl_seconds, and the least recently used entries are evicted past max_entries, as
+    answers are added and on evict().
+    Thread safe, one instance is shared by the sessions and the background workers of the app.
+    """
+    def __init__(self,
+                 cache_path: Path = None,
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.cache_path = Path(cache_path) if cache_path else get_answer_cache_path()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.inserts_since_eviction = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.cache_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS answer_cache (
+                                       graph_version TEXT NOT NULL,
+                                       question_key TEXT NOT NULL,
+                                       question TEXT NOT NULL,
+                                       answer TEXT NOT NULL,
+                                       created_at REAL NOT NULL,
+                                       last_used_at REAL NOT NULL,
+                                       PRIMARY KEY (graph_version, question_key)) WITHOUT ROWID""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS answer_cache_last_used ON answer_cache (last_used_at)")
+        self.connection.commit()
+
+    def get(self, question: str, graph_version: str) -> str | None:
+        now = time.time()
+        question_key = normalize_question(question)
+        with self.lock:
+            row = self.connection.execute("SELECT answer FROM answer_cache "
+                                          "WHERE graph_version = ? AND question_key = ? AND created_at >= ?",
+                                          [graph_version, question_key, now - self.ttl_seconds]).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE answer_cache SET last_used_at = ? "
+                                    "WHERE graph_version = ? AND question_key = ?",
+                                    [now, graph_version, question_key])
+            self.connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, question: str, graph_version: str, answer: str):
+        now = time.time()
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO answer_cache "
+                                    "(graph_version, question_key, question, answer, created_at, last_used_at) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)",
+                                    [graph_version, normalize_question(question), question, answer, now, now])
+            self.inserts_since_eviction += 1
+            # the app runs for weeks, so the bounds are kept while it answers, not only when it starts
+            if self.inserts_since_eviction >= EVICT_EVERY_INSERTS or self.get_entry_count() > self.max_entries:
+                self.evict_entries()
+            self.connection.commit()
+
+    def get_entry_count(self) -> int:
+        return self.connection.execute("SELECT count(*) FROM answer_cache").fetchone()[0]
+
+    def evict_entries(self, current_graph_version: str = None) -> int:
+        # the caller holds the lock and commits
+        evicted = self.connection.execute("DELETE FROM answer_cache WHERE created_at < ?",
+                                          [time.time() - self.ttl_seconds]).rowcount
+        if current_graph_version is not None:
+            evicted += self.connection.execute("DELETE FROM answer_cache WHERE graph_version != ?",
+                                               [current_graph_version]).rowcount
+        entry_count = self.get_entry_count()
+        if entry_count > self.max_entries:
+            evicted += self.connection.execute(
+                "DELETE FROM answer_cache WHERE (graph_version, question_key) IN "
+                "(SELECT graph_version, question_key FROM answer_cache ORDER BY last_used_at LIMIT ?)",
+                [entry_count - self.max_entries]).rowcount
+        self.inserts_since_eviction = 0
+        return evicted
+
+    def evict(self, current_graph_version: str = None) -> int:
+        """Delete expired entries, the answers about other graph versions, and the least recently used past max_entries."""
+        with self.lock:
+            evicted = self.evict_entries(current_graph_version)
+            self.connection.commit()
+            return evicted
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            entry_count = self.get_entry_count()
+        return {"cache_path": str(self.cache_path), "entries": entry_count, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
@@ -2,9 +2,30 @@ import streamlit as st
 import boto3
 import os
 from mcp import stdio_client, StdioServerParameters
-from strands import Agent
 from strands.tools.mcp import MCPClient
 
+from agent_service import AgentService
+from answer_cache import UNKNOWN_GRAPH_VERSION, AnswerCache
+from graph_stats_tool import GRAPH_STATS_PROMPT, create_graph_stats_tool
+from query_jobs import QUEUED, QueryJobRunner
+from midas.graph_stats import get_graph_stats_path, load_graph_stats
+from midas.name_index import NameIndex, get_name_index_path
+from midas.query_cache import GraphVersionStore, GraphVersionTracker
+
+GRAPH_ID = "goldenKG"
+NEPTUNE_HOST = "midas-dev-2510021802.cluster-c7j2zglv4rfb.us-east-1.neptune.amazonaws.com"
+# the sample questions are answered in the background when the app starts and served from the answer cache
+SAMPLE_QUESTIONS = [
+    "What's in the database?",
+    "Show me hub genes",
+    "Find cancer diseases",
+    "Node degree distribution",
+    "Tell me about gene BRCA1"
+]
+# questions a session can have queued or running at once, the worker pool is shared by all sessions
+MAX_ACTIVE_JOBS_PER_SESSION = 3
+HISTORY_PAGE_SIZE = 5
+
 # Page configuration
 st.set_page_config(
     page_title="MIDAS Graph Explorer",
@@ -115,52 +136,110 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize session state
-if 'agent' not in st.session_state:
-    st.session_state.agent = None
-if 'mcp_client' not in st.session_state:
-    st.session_state.mcp_client = None
 if 'history' not in st.session_state:
     st.session_state.history = []
-if 'is_processing' not in st.session_state:
-    st.session_state.is_processing = False
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = []
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 
-def initialize_agent():
-    """Initialize the Neptune MCP client and agent"""
-    try:
-        # Set AWS configuration
-        profile_name = "default"
-        os.environ["AWS_PROFILE"] = profile_name
-        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
-        boto3.setup_default_session(profile_name=profile_name)
-        
-        # Create MCP client
-        mcp_client = MCPClient(lambda: stdio_client(StdioServerParameters(
-            command="uvx",
-            args=["awslabs.amazon-neptune-mcp-server@latest"],
-            env={"NEPTUNE_ENDPOINT": "neptune-db://midas-dev-2510021802.cluster-c7j2zglv4rfb.us-east-1.neptune.amazonaws.com"},
-        )))
-        
-        st.session_state.mcp_client = mcp_client
-        return True
-    except Exception as e:
-        st.error(f"Failed to initialize: {str(e)}")
-        return False
+def create_mcp_client():
+    """Create the Neptune MCP client"""
+    # Set AWS configuration
+    profile_name = "default"
+    os.environ["AWS_PROFILE"] = profile_name
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+    boto3.setup_default_session(profile_name=profile_name)
+    
+    return MCPClient(lambda: stdio_client(StdioServerParameters(
+        command="uvx",
+        args=["awslabs.amazon-neptune-mcp-server@latest"],
+        env={"NEPTUNE_ENDPOINT": f"neptune-db://{NEPTUNE_HOST}"},
+    )))
+
+@st.cache_resource
+def load_graph_stats_artifact():
+    """Load the graph statistics computed by the pipeline once, shared by all sessions"""
+    graph_stats_path = get_graph_stats_path(GRAPH_ID)
+    return load_graph_stats(graph_stats_path) if graph_stats_path.exists() else None
+
+@st.cache_resource
+def get_agent_service():
+    """One MCP server, schema cache and agent pool for the whole app process, started on first use"""
+    graph_stats = load_graph_stats_artifact()
+    if graph_stats is None:
+        return AgentService(create_mcp_client)
+    return AgentService(create_mcp_client, local_tools=[create_graph_stats_tool(graph_stats)],
+                        local_tools_prompt=GRAPH_STATS_PROMPT)
 
-def query_agent(question):
-    """Query the agent and return response"""
+@st.cache_resource
+def load_name_index():
+    """Load the name index built by the pipeline once, shared by all sessions"""
+    name_index_path = get_name_index_path(GRAPH_ID)
+    return NameIndex.load(name_index_path) if name_index_path.exists() else None
+
+@st.cache_resource
+def get_graph_version_tracker():
+    """Reads the graph version the load scripts write for the cluster, at most once a minute"""
     try:
-        with st.session_state.mcp_client:
-            tools = st.session_state.mcp_client.list_tools_sync()
-            agent = Agent(
-                tools=tools,
-                system_prompt="""You are a helpful assistant that explores biomedical knowledge graphs. 
-                Always fetch the schema first to ensure correct labels and property names.
-                Provide clear, concise answers without excessive markdown formatting."""
-            )
-            response = agent(question)
-            return response
+        return GraphVersionTracker(GraphVersionStore(NEPTUNE_HOST))
     except Exception as e:
-        return f"Error: {str(e)}"
+        print(f"Graph version unavailable, cached answers are only kept until they expire: {e}")
+        return None
+
+def read_graph_version(graph_version_tracker):
+    if graph_version_tracker is None:
+        return UNKNOWN_GRAPH_VERSION
+    graph_version_tracker.check()
+    return graph_version_tracker.graph_version or UNKNOWN_GRAPH_VERSION
+
+def get_graph_version():
+    return read_graph_version(get_graph_version_tracker())
+
+@st.cache_resource
+def get_answer_cache():
+    """Answers shared by every session, on local disk"""
+    answer_cache = AnswerCache()
+    graph_version = get_graph_version()
+    answer_cache.evict(graph_version if graph_version != UNKNOWN_GRAPH_VERSION else None)
+    return answer_cache
+
+@st.cache_resource
+def get_job_runner():
+    """Worker pool answering the questions of every session in the background"""
+    agent_service = get_agent_service()
+    answer_cache = get_answer_cache()
+    graph_version_tracker = get_graph_version_tracker()
+    
+    def answer_question(question, callback_handler=None):
+        # the version is read before asking, so an answer is never cached under a version loaded after it
+        graph_version = read_graph_version(graph_version_tracker)
+        response = str(agent_service.ask(question, callback_handler=callback_handler))
+        answer_cache.set(question, graph_version, response)
+        return response
+    
+    return QueryJobRunner(answer_question)
+
+@st.cache_resource
+def precompute_sample_answers():
+    """Answer the sample questions that aren't cached yet in the background, once per app process"""
+    answer_cache = get_answer_cache()
+    graph_version = get_graph_version()
+    return [get_job_runner().submit(question) for question in SAMPLE_QUESTIONS
+            if answer_cache.get(question, graph_version) is None]
+
+def ask_question(question):
+    """Answer from the answer cache when possible, otherwise queue the question for the agent"""
+    cached_answer = get_answer_cache().get(question, get_graph_version())
+    if cached_answer is not None:
+        st.session_state.history.append({"question": question, "response": cached_answer, "cached": True})
+        st.session_state.history_page = 0
+    elif len(st.session_state.jobs) >= MAX_ACTIVE_JOBS_PER_SESSION:
+        st.warning(f"Please wait for one of your {MAX_ACTIVE_JOBS_PER_SESSION} running questions to finish.")
+    else:
+        st.session_state.jobs.append(get_job_runner().submit(question))
+
+precompute_sample_answers()
 
 # Header
 st.markdown('<h1 style="margin-bottom: 0px;">MIDAS</h1>', unsafe_allow_html=True)
@@ -174,17 +253,36 @@ with st.sidebar:
     
     st.markdown("---")
     st.markdown("### Sample Questions")
-    st.markdown("""
-    - What's in the database?
-    - Show me hub genes
-    - Find cancer diseases
-    - Node degree distribution
-    - Tell me about gene BRCA1
-    """)
+    for sample_question in SAMPLE_QUESTIONS:
+        if st.button(sample_question, key=f"sample_{sample_question}", use_container_width=True):
+            ask_question(sample_question)
+    
+    # Graph overview from the precomputed statistics, without querying Neptune
+    graph_stats = load_graph_stats_artifact()
+    if graph_stats is not None:
+        st.markdown("---")
+        st.markdown("### Graph Statistics")
+        nodes_column, edges_column = st.columns(2)
+        nodes_column.metric("Nodes", f"{graph_stats['node_count']:,}")
+        edges_column.metric("Edges", f"{graph_stats['edge_count']:,}")
+        st.markdown("\n".join(f"- {category.removeprefix('biolink:')}: {count:,}"
+                               for category, count in graph_stats["nodes_by_primary_category"].items()))
+    
+    # Offline name lookup, answered from the local name index without querying Neptune
+    name_index = load_name_index()
+    if name_index is not None:
+        st.markdown("---")
+        st.markdown("### Look Up")
+        lookup = st.text_input("Disease, drug or gene name:", key="lookup_input")
+        if lookup:
+            for match in name_index.search(lookup, limit=8):
+                category = match["categories"][0] if match["categories"] else ""
+                st.markdown(f"**{match['name']}**  \n`{match['id']}` {category}")
     
     st.markdown("---")
     if st.button("Clear History", use_container_width=True):
         st.session_state.history = []
+        st.session_state.history_page = 0
         st.rerun()
 
 # Main content
@@ -198,42 +296,72 @@ question = st.text_input(
     key="question_input"
 )
 
-if st.button("Search", disabled=st.session_state.is_processing):
+if st.button("Search"):
     if question:
-        st.session_state.is_processing = True
-        try:
-            if st.session_state.mcp_client is None:
-                with st.spinner("Initializing connection..."):
-                    initialize_agent()
-            
-            with st.spinner("Analyzing..."):
-                response = query_agent(question)
-                st.session_state.history.append({
-                    "question": question,
-                    "response": response
-                })
-        finally:
-            st.session_state.is_processing = False
-            st.rerun()
+        ask_question(question)
+
+def show_result(question, response, cached=False):
+    with st.container():
+        # Question
+        st.markdown(f'**Q: {question}**')
+        if cached:
+            st.caption("Cached answer")
+        st.markdown("")  # spacing
+        
+        # Response with markdown rendering
+        st.markdown(response)
+
+@st.fragment(run_every=0.5)
+def show_active_jobs():
+    """Stream the answers of this session's running questions, without re-running the whole page"""
+    finished_jobs = [job for job in st.session_state.jobs if job.is_finished]
+    if finished_jobs:
+        for job in finished_jobs:
+            st.session_state.history.append({
+                "question": job.question,
+                "response": job.response if job.error is None else f"Error: {job.error}"
+            })
+        st.session_state.jobs = [job for job in st.session_state.jobs if not job.is_finished]
+        st.session_state.history_page = 0
+        st.rerun()
+    
+    for job in reversed(st.session_state.jobs):
+        if job.status == QUEUED:
+            show_result(job.question, "_Queued..._")
+            continue
+        partial_response = job.get_partial_response()
+        tool_names = job.get_tool_names()
+        if tool_names:
+            partial_response = f"_Tools used: {', '.join(tool_names)}_\n\n{partial_response}"
+        show_result(job.question, partial_response or "_Analyzing..._")
 
 # Display results
-if st.session_state.history:
+if st.session_state.jobs or st.session_state.history:
     st.markdown("---")
     st.markdown("### Results")
     
-    # Show most recent result first
-    for i, item in enumerate(reversed(st.session_state.history)):
-        with st.container():
-            # Question
-            st.markdown(f'**Q: {item["question"]}**')
-            st.markdown("")  # spacing
-            
-            # Response with markdown rendering
-            response_text = str(item["response"])
-            st.markdown(response_text)
-        
-        if i < len(st.session_state.history) - 1:
-            st.markdown("")  # spacing between cards
+    if st.session_state.jobs:
+        show_active_jobs()
+    
+    # Show most recent result first, one page at a time
+    history = st.session_state.history
+    page_count = max(1, -(-len(history) // HISTORY_PAGE_SIZE))
+    page = min(st.session_state.history_page, page_count - 1)
+    page_end = len(history) - page * HISTORY_PAGE_SIZE
+    for item in reversed(history[max(0, page_end - HISTORY_PAGE_SIZE):page_end]):
+        show_result(item["question"], str(item["response"]), cached=item.get("cached", False))
+        st.markdown("")  # spacing between cards
+    
+    if page_count > 1:
+        newer_column, page_column, older_column = st.columns([1, 2, 1])
+        if newer_column.button("Newer", disabled=page == 0, use_container_width=True):
+            st.session_state.history_page = page - 1
+            st.rerun()
+        page_column.markdown(f"<p style='text-align: center;'>Page {page + 1} of {page_count}</p>",
+                             unsafe_allow_html=True)
+        if older_column.button("Older", disabled=page >= page_count - 1, use_container_width=True):
+            st.session_state.history_page = page + 1
+            st.rerun()
 else:
     st.markdown("""
     <div class="welcome-box">
@@ -241,4 +369,3 @@ else:
         <p>Ask questions about the biomedical knowledge graph. Try "What's in the database?" or check sample questions in the sidebar.</p>
     </div>
     """, unsafe_allow_html=True)
-
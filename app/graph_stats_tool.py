@@ -0,0 +1,47 @@
+"""
+Agent tool answering graph statistics questions from the statistics artifact written by the pipeline
+(midas.graph_stats), so counts, hubs and degree distributions don't need aggregate queries against Neptune.
+"""
+
+import json
+
+from strands import tool
+
+GRAPH_STATS_PROMPT = """For node and edge counts, counts per category, predicate or knowledge source, degree \
+distributions and hub (most connected) nodes, use the get_graph_statistics tool. It answers from statistics \
+precomputed when the graph was built, without querying the database."""
+GRAPH_STATS_SECTIONS = {
+    "counts": ["node_count", "edge_count", "dangling_edges", "nodes_by_category", "nodes_by_primary_category"],
+    "predicates": ["edges_by_predicate"],
+    "sources": ["edges_by_source", "edges_by_source_and_predicate"],
+    "degrees": ["degree", "degree_by_category"],
+    "hubs": ["hubs_by_category"]
+}
+PER_CATEGORY_SECTIONS = ["degree_by_category", "hubs_by_category"]
+
+
+def get_graph_stats_section(graph_stats: dict, section: str, category: str = None) -> dict:
+    if section not in GRAPH_STATS_SECTIONS:
+        return {"error": f"Unknown section {section}, expected one of {', '.join(GRAPH_STATS_SECTIONS)}"}
+    section_stats = {key: graph_stats[key] for key in GRAPH_STATS_SECTIONS[section]}
+    if category:
+        for key in PER_CATEGORY_SECTIONS:
+            if key in section_stats:
+                section_stats[key] = {category: section_stats[key].get(category)}
+    return section_stats
+
+def create_graph_stats_tool(graph_stats: dict):
+    @tool
+    def get_graph_statistics(section: str, category: str = None) -> str:
+        """
+        Get precomputed statistics of the knowledge graph.
+
+        Args:
+            section: counts (nodes and edges, nodes per category), predicates (edges per predicate),
+                sources (edges per knowledge source), degrees (degree summaries and histograms)
+                or hubs (highest degree nodes per category)
+            category: optional biolink category, e.g. biolink:Gene, to restrict degrees and hubs to
+        """
+        return json.dumps(get_graph_stats_section(graph_stats, section, category))
+
+    return get_graph_statistics
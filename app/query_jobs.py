@@ -0,0 +1,80 @@
+"""
+Background execution of agent questions for the MIDAS app.
+
+Questions run on a process-wide worker pool instead of inside the Streamlit script run, so a long question
+doesn't block the page, and the agent's streaming events are collected on the job as it runs.
+"""
+
+import itertools
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+DEFAULT_MAX_WORKERS = 4
+
+
+class QueryJob:
+    """One question, its streamed partial answer and tool calls, and its final response or error."""
+    job_ids = itertools.count(1)
+
+    def __init__(self, question: str):
+        self.id = next(QueryJob.job_ids)
+        self.question = question
+        self.status = QUEUED
+        self.text_chunks = []
+        # tool use id -> tool name, in call order
+        self.tool_calls = {}
+        self.response = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def get_partial_response(self) -> str:
+        return "".join(self.text_chunks)
+
+    def get_tool_names(self) -> list:
+        return list(self.tool_calls.values())
+
+    def handle_agent_event(self, **kwargs):
+        """Callback handler for the agent, called from the worker thread for every streaming event."""
+        if "data" in kwargs:
+            self.text_chunks.append(kwargs["data"])
+        tool_use = kwargs.get("current_tool_use")
+        if tool_use and tool_use.get("toolUseId") and tool_use.get("name"):
+            self.tool_calls[tool_use["toolUseId"]] = tool_use["name"]
+
+
+class QueryJobRunner:
+    """
+    Runs QueryJobs on a thread pool shared by every session of the app.
+    answer_question(question, callback_handler) returns the agent's response, e.g. AgentService.ask.
+    """
+    def __init__(self, answer_question, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.answer_question = answer_question
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="midas-query")
+
+    def submit(self, question: str) -> QueryJob:
+        job = QueryJob(question)
+        self.executor.submit(self.run, job)
+        return job
+
+    def run(self, job: QueryJob):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.response = str(self.answer_question(job.question, callback_handler=job.handle_agent_event))
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
@@ -3,35 +3,107 @@
 Simple Neptune Agent - A straightforward agent for querying Neptune database
 """
 
+import argparse
 import json
-import subprocess
 from typing import Dict, Any
 
+import numpy as np
+
+from midas.graph_stats import get_degree_histogram, get_degree_summary, get_graph_stats_path, load_graph_stats
+from midas.local_graph import LocalGraph, load_local_graph
+from midas.name_index import NameIndex, get_name_index_path
+from midas.neptune_client import NeptuneClient, NeptuneQueryError
+from midas.query_cache import CachedQueryRunner, GraphVersionStore, GraphVersionTracker, QueryCache
+
+DISEASE_CATEGORY = "biolink:Disease"
+DRUG_CATEGORY = "biolink:SmallMolecule"
+
+# Query templates take their values as parameters, so Neptune can reuse the query plans and the
+# results can be cached by (template, parameters)
+DRUGS_FOR_DISEASE_QUERY = """
+MATCH (d)-[r]-(drug)
+WHERE toLower(d.name) CONTAINS $disease_name
+AND d:biolink:Disease
+AND drug:biolink:SmallMolecule
+RETURN d.name as disease, drug.name as drug, type(r) as relationship_type
+LIMIT 20
+"""
+
+DISEASE_INFO_QUERY = """
+MATCH (d)
+WHERE toLower(d.name) CONTAINS $disease_name
+AND d:biolink:Disease
+RETURN d.name as name, d.description as description, d.equivalent_identifiers as identifiers
+LIMIT 5
+"""
+
+DRUG_INFO_QUERY = """
+MATCH (drug)
+WHERE toLower(drug.name) CONTAINS $drug_name
+AND drug:biolink:SmallMolecule
+RETURN drug.name as name, drug.description as description, drug.equivalent_identifiers as identifiers
+LIMIT 5
+"""
+
+# With a name index the nodes are matched locally and looked up by id, instead of scanning every name in Neptune
+DRUGS_FOR_DISEASE_IDS_QUERY = """
+MATCH (d)-[r]-(drug)
+WHERE id(d) IN $disease_ids
+AND drug:biolink:SmallMolecule
+RETURN d.name as disease, drug.name as drug, type(r) as relationship_type
+LIMIT 20
+"""
+
+DISEASE_INFO_BY_IDS_QUERY = """
+MATCH (d)
+WHERE id(d) IN $disease_ids
+RETURN d.name as name, d.description as description, d.equivalent_identifiers as identifiers
+"""
+
+DRUG_INFO_BY_IDS_QUERY = """
+MATCH (drug)
+WHERE id(drug) IN $drug_ids
+RETURN drug.name as name, drug.description as description, drug.equivalent_identifiers as identifiers
+"""
+
+# Live fallbacks when there is no statistics artifact for the loaded graph
+NODE_COUNT_QUERY = "MATCH (n) RETURN count(n) as total_nodes"
+EDGE_COUNT_QUERY = "MATCH ()-[r]->() RETURN count(r) as total_edges"
+HUB_NODES_QUERY = """
+MATCH (n)-[r]-()
+WHERE $category IN labels(n)
+RETURN id(n) as id, n.name as name, count(r) as degree
+ORDER BY degree DESC
+LIMIT $limit
+"""
+DEGREE_DISTRIBUTION_QUERY = """
+MATCH (n)
+OPTIONAL MATCH (n)-[r]-()
+WITH n, count(r) as degree
+RETURN degree, count(n) as nodes
+ORDER BY degree
+"""
+
 class NeptuneAgent:
-    def __init__(self, endpoint: str, region: str = "us-east-1"):
+    def __init__(self, endpoint: str, region: str = "us-east-1", sign: bool = True, cache: QueryCache = None,
+                 name_index: NameIndex = None, graph_stats: Dict[str, Any] = None, version_store=None):
         self.endpoint = endpoint
         self.region = region
+        self.name_index = name_index
+        # precomputed by the pipeline (midas.graph_stats), answers count, hub and degree questions without Neptune
+        self.graph_stats = graph_stats
+        # one pooled, signed HTTP session for all queries instead of an awscurl process per query
+        self.client = NeptuneClient(endpoint, region=region, sign=sign)
+        # cached results are dropped when the load scripts write a new graph version to the version store
+        self.query_runner = CachedQueryRunner(self.client, cache,
+                                              GraphVersionTracker(version_store) if version_store else None)
     
-    def execute_query(self, query: str) -> Dict[str, Any]:
+    def execute_query(self, query: str, parameters: Dict[str, Any] = None, use_cache: bool = True) -> Dict[str, Any]:
         """Execute a query on the Neptune database"""
         try:
-            cmd = [
-                'awscurl',
-                '--service', 'neptune-db',
-                '--region', self.region,
-                f"{self.endpoint}/openCypher",
-                '-X', 'POST',
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps({"query": query})
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                return {"success": True, "data": json.loads(result.stdout)}
-            else:
-                return {"success": False, "error": result.stderr}
-                
+            return {"success": True, "data": self.query_runner.execute_query(query, parameters, use_cache=use_cache)}
+        except NeptuneQueryError as e:
+            return {"success": False, "error": e.response_text or str(e)}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -43,72 +115,194 @@ class NeptuneAgent:
             "CALL db.propertyKeys()"
         ]
         
+        # the schema queries are independent, so they run concurrently over the pooled connections
         schema_info = {}
-        for query in queries:
-            result = self.execute_query(query)
-            if result["success"]:
-                schema_info[query] = result["data"]
-            else:
-                schema_info[query] = {"error": result["error"]}
+        try:
+            for query, result in zip(queries, self.query_runner.execute_queries(queries)):
+                schema_info[query] = result
+        except NeptuneQueryError:
+            for query in queries:
+                result = self.execute_query(query)
+                if result["success"]:
+                    schema_info[query] = result["data"]
+                else:
+                    schema_info[query] = {"error": result["error"]}
         
         return json.dumps(schema_info, indent=2)
     
+    def find_node_ids(self, name: str, category: str, limit: int) -> list:
+        """Ids of the nodes matching a name in the name index, empty without an index"""
+        if self.name_index is None:
+            return []
+        return self.name_index.get_node_ids(name, limit=limit, categories=[category])
+    
     def find_drugs_for_disease(self, disease_name: str) -> Dict[str, Any]:
         """Find drugs associated with a specific disease"""
-        # Find drugs related to the disease
-        drug_query = f"""
-        MATCH (d)-[r]-(drug)
-        WHERE toLower(d.name) CONTAINS '{disease_name.lower()}'
-        AND d:biolink:Disease
-        AND drug:biolink:SmallMolecule
-        RETURN d.name as disease, drug.name as drug, type(r) as relationship_type
-        LIMIT 20
-        """
-        
-        return self.execute_query(drug_query)
+        disease_ids = self.find_node_ids(disease_name, DISEASE_CATEGORY, limit=20)
+        if disease_ids:
+            return self.execute_query(DRUGS_FOR_DISEASE_IDS_QUERY, {"disease_ids": disease_ids})
+        return self.execute_query(DRUGS_FOR_DISEASE_QUERY, {"disease_name": disease_name.lower()})
     
     def get_disease_info(self, disease_name: str) -> Dict[str, Any]:
         """Get detailed information about a disease"""
-        query = f"""
-        MATCH (d)
-        WHERE toLower(d.name) CONTAINS '{disease_name.lower()}'
-        AND d:biolink:Disease
-        RETURN d.name as name, d.description as description, d.equivalent_identifiers as identifiers
-        LIMIT 5
-        """
-        
-        return self.execute_query(query)
+        disease_ids = self.find_node_ids(disease_name, DISEASE_CATEGORY, limit=5)
+        if disease_ids:
+            return self.execute_query(DISEASE_INFO_BY_IDS_QUERY, {"disease_ids": disease_ids})
+        return self.execute_query(DISEASE_INFO_QUERY, {"disease_name": disease_name.lower()})
     
     def get_drug_info(self, drug_name: str) -> Dict[str, Any]:
         """Get detailed information about a drug"""
-        query = f"""
-        MATCH (drug)
-        WHERE toLower(drug.name) CONTAINS '{drug_name.lower()}'
-        AND drug:biolink:SmallMolecule
-        RETURN drug.name as name, drug.description as description, drug.equivalent_identifiers as identifiers
-        LIMIT 5
-        """
-        
-        return self.execute_query(query)
+        drug_ids = self.find_node_ids(drug_name, DRUG_CATEGORY, limit=5)
+        if drug_ids:
+            return self.execute_query(DRUG_INFO_BY_IDS_QUERY, {"drug_ids": drug_ids})
+        return self.execute_query(DRUG_INFO_QUERY, {"drug_name": drug_name.lower()})
+    
+    def get_graph_statistics(self) -> Dict[str, Any]:
+        """Get node and edge counts, per category, predicate and knowledge source"""
+        if self.graph_stats:
+            return {"success": True, "data": {key: self.graph_stats[key] for key in
+                                              ["node_count", "edge_count", "nodes_by_category",
+                                               "edges_by_predicate", "edges_by_source"]}}
+        try:
+            node_counts, edge_counts = self.query_runner.execute_queries([NODE_COUNT_QUERY, EDGE_COUNT_QUERY])
+        except NeptuneQueryError as e:
+            return {"success": False, "error": e.response_text or str(e)}
+        return {"success": True, "data": {"node_count": node_counts["results"][0]["total_nodes"],
+                                          "edge_count": edge_counts["results"][0]["total_edges"]}}
+    
+    def get_hub_nodes(self, category: str = "biolink:Gene", limit: int = 10) -> Dict[str, Any]:
+        """Get the highest degree nodes of a category"""
+        if self.graph_stats and category in self.graph_stats["hubs_by_category"]:
+            return {"success": True, "data": {"results": self.graph_stats["hubs_by_category"][category][:limit]}}
+        return self.execute_query(HUB_NODES_QUERY, {"category": category, "limit": limit})
+    
+    def get_degree_distribution(self, category: str = None) -> Dict[str, Any]:
+        """Get degree summary statistics and a histogram with power of two bins, overall or for a category"""
+        if self.graph_stats:
+            degree_stats = self.graph_stats["degree_by_category"].get(category) if category \
+                else self.graph_stats["degree"]
+            if degree_stats is not None:
+                return {"success": True, "data": degree_stats}
+        return self.execute_query(DEGREE_DISTRIBUTION_QUERY)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Query cache hits, misses and the graph version the cache is valid for"""
+        return self.query_runner.get_stats()
+
+    def close(self):
+        self.client.close()
+
+class LocalGraphAgent:
+    """
+    The NeptuneAgent API answered from an in-memory copy of the merged graph (midas.local_graph), for
+    development, CI and offline analysis without a Neptune cluster. Results have the same shape as NeptuneAgent's.
+    """
+    def __init__(self, local_graph: LocalGraph, name_index: NameIndex = None):
+        self.local_graph = local_graph
+        self.name_index = name_index
+
+    def execute_query(self, query: str, parameters: Dict[str, Any] = None, use_cache: bool = True) -> Dict[str, Any]:
+        return {"success": False, "error": "openCypher queries need the Neptune backend"}
+
+    def get_schema(self) -> str:
+        graph = self.local_graph
+        return json.dumps({"labels": [graph.categories[code] for code in range(len(graph.categories))],
+                           "relationshipTypes": [graph.predicates[code] for code in range(len(graph.predicates))],
+                           "propertyKeys": ["name", "description", "equivalent_identifiers",
+                                            "primary_knowledge_source"]}, indent=2)
+
+    def find_nodes(self, name: str, category: str, limit: int) -> list:
+        """Nodes matching a name, by the name index when there is one, otherwise by a scan of the names"""
+        if self.name_index is None:
+            return self.local_graph.match_nodes(categories=[category], name_contains=name, limit=limit)
+        nodes = [self.local_graph.get_node_by_id(node_id) for node_id in
+                 self.name_index.get_node_ids(name, limit=limit, categories=[category])]
+        return [node for node in nodes if node is not None]
+
+    def find_drugs_for_disease(self, disease_name: str) -> Dict[str, Any]:
+        results = []
+        for disease in self.find_nodes(disease_name, DISEASE_CATEGORY, limit=20):
+            if len(results) >= 20:
+                break
+            for neighbor in self.local_graph.get_neighbors(disease["id"], categories=[DRUG_CATEGORY],
+                                                           limit=20 - len(results)):
+                results.append({"disease": disease["name"], "drug": neighbor["name"],
+                                "relationship_type": neighbor["predicate"]})
+        return {"success": True, "data": {"results": results}}
+
+    def get_node_info(self, name: str, category: str) -> Dict[str, Any]:
+        return {"success": True, "data": {"results": [
+            {"name": node["name"], "description": node["description"],
+             "identifiers": node["equivalent_identifiers"]} for node in self.find_nodes(name, category, limit=5)]}}
+
+    def get_disease_info(self, disease_name: str) -> Dict[str, Any]:
+        return self.get_node_info(disease_name, DISEASE_CATEGORY)
+
+    def get_drug_info(self, drug_name: str) -> Dict[str, Any]:
+        return self.get_node_info(drug_name, DRUG_CATEGORY)
+
+    def get_graph_statistics(self) -> Dict[str, Any]:
+        graph = self.local_graph
+        category_counts = np.diff(graph.category_nodes.offsets)
+        predicate_counts = np.diff(graph.predicate_offsets)
+        source_counts = np.bincount(graph.edge_sources, minlength=len(graph.sources))
+        return {"success": True, "data": {
+            "node_count": graph.node_count,
+            "edge_count": graph.edge_count,
+            "nodes_by_category": {graph.categories[code]: int(count) for code, count in enumerate(category_counts)},
+            "edges_by_predicate": {graph.predicates[code]: int(count) for code, count in enumerate(predicate_counts)},
+            "edges_by_source": {graph.sources[code]: int(count) for code, count in enumerate(source_counts)}}}
+
+    def get_hub_nodes(self, category: str = "biolink:Gene", limit: int = 10) -> Dict[str, Any]:
+        node_indices = self.local_graph.get_category_node_indices(category)
+        degrees = self.local_graph.get_degrees()
+        hub_indices = node_indices[np.argsort(-degrees[node_indices], kind="stable")[:limit]]
+        return {"success": True, "data": {"results": [
+            {"id": self.local_graph.node_ids[index], "name": self.local_graph.node_names[index],
+             "degree": int(degrees[index])} for index in hub_indices]}}
+
+    def get_degree_distribution(self, category: str = None) -> Dict[str, Any]:
+        degrees = self.local_graph.get_degrees()
+        if category:
+            degrees = degrees[self.local_graph.get_category_node_indices(category)]
+        return {"success": True, "data": {**get_degree_summary(degrees), "histogram": get_degree_histogram(degrees)}}
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        # nothing to cache, every query is answered in memory
+        return {"hits": 0, "misses": 0, "graph_version": None}
+
+    def close(self):
+        pass
 
 def main():
     """Main function to demonstrate the agent"""
-    # Initialize the agent
-    agent = NeptuneAgent("https://midas-test.cluster-c7j2zglv4rfb.us-east-1.neptune.amazonaws.com:8182")
+    parser = argparse.ArgumentParser(description="Demonstrate the knowledge graph agent")
+    parser.add_argument("--backend", choices=["neptune", "local"], default="neptune",
+                        help="Query Neptune, or an in-memory copy of the merged graph in data_output/kgs")
+    parser.add_argument("--graph-id", default="goldenKG")
+    args = parser.parse_args()
+
+    # Initialize the agent, with the name index and statistics of the loaded graph when they have been built
+    name_index_path = get_name_index_path(args.graph_id)
+    name_index = NameIndex.load(name_index_path) if name_index_path.exists() else None
+    if args.backend == "local":
+        agent = LocalGraphAgent(load_local_graph(args.graph_id), name_index=name_index)
+    else:
+        graph_stats_path = get_graph_stats_path(args.graph_id)
+        graph_stats = load_graph_stats(graph_stats_path) if graph_stats_path.exists() else None
+        endpoint = "https://midas-test.cluster-c7j2zglv4rfb.us-east-1.neptune.amazonaws.com:8182"
+        agent = NeptuneAgent(endpoint, name_index=name_index, graph_stats=graph_stats,
+                             version_store=GraphVersionStore(endpoint))
     
     print("🔍 Neptune Knowledge Graph Agent")
     print("=" * 50)
     
     # Test 1: Get basic stats
     print("\n1. Database Statistics:")
-    stats_query = "MATCH (n) RETURN count(n) as total_nodes"
-    stats_result = agent.execute_query(stats_query)
+    stats_result = agent.get_graph_statistics()
     if stats_result["success"]:
-        print(f"   Total nodes: {stats_result['data']['results'][0]['total_nodes']}")
-    
-    edge_stats = agent.execute_query("MATCH ()-[r]->() RETURN count(r) as total_edges")
-    if edge_stats["success"]:
-        print(f"   Total edges: {edge_stats['data']['results'][0]['total_edges']}")
+        print(f"   Total nodes: {stats_result['data']['node_count']}")
+        print(f"   Total edges: {stats_result['data']['edge_count']}")
     
     # Test 2: Find Huntington disease
     print("\n2. Searching for Huntington disease:")
@@ -142,7 +336,14 @@ def main():
     schema = agent.get_schema()
     print("   Schema information retrieved (see full schema in output)")
     
+    print("\n5. Query cache:")
+    agent.get_disease_info("Huntington")
+    cache_stats = agent.get_cache_stats()
+    print(f"   Hits: {cache_stats['hits']}, misses: {cache_stats['misses']}, "
+          f"graph version: {cache_stats['graph_version']}")
+    
     print("\n✅ Agent demonstration complete!")
+    agent.close()
 
 if __name__ == "__main__":
     main()
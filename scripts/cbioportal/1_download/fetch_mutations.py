@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+# Get the directory of this script
+script_dir = Path(__file__).resolve().parent
+# Navigate to config.json location relative to script
+config_dir = script_dir.parent
+# Load config
+with open(config_dir/'config.json') as config_file:
+    config = json.load(config_file)
+# Access paths from config
+downloads_dir = Path(config["relevant_paths"]["downloads"])
+
+CBIOPORTAL_API_URL = "https://www.cbioportal.org/api"
+# Only these profiles hold mutation calls, other alteration types (CNA, expression, ...) have no mutations endpoint data
+MUTATION_PROFILE_TYPE = "MUTATION_EXTENDED"
+# Sample lists of this category contain the samples that were sequenced for mutations
+MUTATION_SAMPLE_LIST_CATEGORY = "all_cases_with_mutation_data"
+DEFAULT_WORKERS = 8
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 2
+# kept next to the mutations directory, so the extractor's mutations/*.json glob doesn't pick it up
+STATE_FILE_NAME = ".download_state.json"
+# the state is saved after this many downloads too, so a killed run keeps most of its progress
+SAVE_STATE_EVERY = 50
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `capacity` requests."""
+    def __init__(self, rate: float, capacity: int = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DownloadState:
+    """
+    Remembers which files were completely downloaded along with their ETag / Last-Modified headers,
+    so reruns can skip or cheaply revalidate them instead of downloading everything again.
+    """
+    def __init__(self, state_path: Path, save_every: int = SAVE_STATE_EVERY):
+        self.state_path = state_path
+        self.save_every = save_every
+        self.unsaved_count = 0
+        self.files = {}
+        if state_path.exists():
+            with open(state_path) as state_file:
+                self.files = json.load(state_file)
+
+    def get(self, file_path: Path) -> dict | None:
+        entry = self.files.get(file_path.name)
+        # the entry only counts if the file it describes is still there
+        if entry and file_path.exists() and file_path.stat().st_size == entry["size"]:
+            return entry
+        return None
+
+    def set(self, file_path: Path, response: httpx.Response):
+        self.files[file_path.name] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": file_path.stat().st_size
+        }
+        self.unsaved_count += 1
+        if self.unsaved_count >= self.save_every:
+            self.save()
+
+    def save(self):
+        temp_state_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(temp_state_path, "w") as state_file:
+            json.dump(self.files, state_file, indent=2)
+        os.replace(temp_state_path, self.state_path)
+        self.unsaved_count = 0
+
+
+class CBioPortalDownloader:
+    def __init__(self,
+                 output_dir: Path,
+                 base_url: str = CBIOPORTAL_API_URL,
+                 workers: int = DEFAULT_WORKERS,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 revalidate: bool = True):
+        self.output_dir = output_dir
+        self.mutations_dir = output_dir / "mutations"
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.revalidate = revalidate
+        self.mutations_state = None
+        self.counts = {"downloaded": 0, "not_modified": 0, "skipped": 0, "not_found": 0, "failed": 0}
+
+    async def request(self, client: httpx.AsyncClient, url: str, params: dict = None, headers: dict = None,
+                      output_path: Path = None) -> httpx.Response:
+        """
+        GET a url, retrying timeouts, 429 and 5xx with exponential backoff.
+        With output_path the body is streamed into output_path + .part and only renamed once complete.
+        """
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.rate_limiter.acquire()
+            try:
+                async with client.stream("GET", url, params=params, headers=headers) as response:
+                    if response.status_code == 429 or response.status_code >= 500:
+                        retry_after = response.headers.get("Retry-After", "")
+                        if retry_after.isdigit():
+                            raise RetryAfter(int(retry_after))
+                        raise httpx.HTTPStatusError(f"{response.status_code} from {url}",
+                                                    request=response.request, response=response)
+                    if output_path is None or response.status_code != 200:
+                        await response.aread()
+                        return response
+                    partial_path = output_path.with_name(output_path.name + ".part")
+                    last_chunk = b""
+                    with open(partial_path, "wb") as output_file:
+                        async for chunk in response.aiter_bytes():
+                            output_file.write(chunk)
+                            if chunk.strip():
+                                last_chunk = chunk
+                    # the responses are json arrays, anything else was cut off mid transfer
+                    if not last_chunk.rstrip().endswith(b"]"):
+                        raise httpx.ReadError(f"Truncated response from {url}", request=response.request)
+                    os.replace(partial_path, output_path)
+                    return response
+            except RetryAfter as e:
+                backoff = e.seconds
+                error = e
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                backoff = BACKOFF_SECONDS * 2 ** (attempt - 1) + random.uniform(0, 1)
+                error = e
+            if attempt < MAX_ATTEMPTS:
+                logger.warning(f"Request to {url} failed ({error!r}), retrying in {backoff:.1f}s "
+                               f"(attempt {attempt}/{MAX_ATTEMPTS})")
+                await asyncio.sleep(backoff)
+        raise DownloadFailed(f"Request to {url} failed after {MAX_ATTEMPTS} attempts: {error!r}")
+
+    async def get_json(self, client: httpx.AsyncClient, path: str) -> list:
+        response = await self.request(client, f"{self.base_url}{path}", headers={"accept": "application/json"})
+        response.raise_for_status()
+        return response.json()
+
+    async def get_mutation_requests(self, client: httpx.AsyncClient, study_id: str) -> list:
+        """Return the (molecularProfileId, sampleListId) pairs of a study that can actually hold mutations."""
+        molecular_profiles, sample_lists = await asyncio.gather(
+            self.get_json(client, f"/studies/{study_id}/molecular-profiles"),
+            self.get_json(client, f"/studies/{study_id}/sample-lists"))
+        mutation_profiles = [profile["molecularProfileId"] for profile in molecular_profiles
+                             if profile.get("molecularAlterationType") == MUTATION_PROFILE_TYPE]
+        mutation_sample_lists = [sample_list["sampleListId"] for sample_list in sample_lists
+                                 if sample_list.get("category") == MUTATION_SAMPLE_LIST_CATEGORY]
+        if not mutation_sample_lists:
+            # older studies don't always categorize their lists, fall back to the conventional names
+            conventional_names = {f"{study_id}_sequenced", f"{study_id}_all"}
+            mutation_sample_lists = [sample_list["sampleListId"] for sample_list in sample_lists
+                                     if sample_list["sampleListId"] in conventional_names][:1]
+        return [(profile_id, sample_list_id) for profile_id in mutation_profiles
+                for sample_list_id in mutation_sample_lists]
+
+    async def download_mutations(self, client: httpx.AsyncClient, molecular_profile_id: str, sample_list_id: str):
+        output_path = self.mutations_dir / f"{molecular_profile_id}_{sample_list_id}.json"
+        state_entry = self.mutations_state.get(output_path)
+        headers = {"accept": "application/json"}
+        if state_entry:
+            if not self.revalidate:
+                self.counts["skipped"] += 1
+                return
+            if state_entry["etag"]:
+                headers["If-None-Match"] = state_entry["etag"]
+            if state_entry["last_modified"]:
+                headers["If-Modified-Since"] = state_entry["last_modified"]
+
+        try:
+            response = await self.request(client,
+                                          f"{self.base_url}/molecular-profiles/{molecular_profile_id}/mutations",
+                                          params={"sampleListId": sample_list_id},
+                                          headers=headers,
+                                          output_path=output_path)
+        except DownloadFailed as e:
+            logger.error(str(e))
+            self.counts["failed"] += 1
+            return
+
+        if response.status_code == 304:
+            self.counts["not_modified"] += 1
+        elif response.status_code == 200:
+            self.mutations_state.set(output_path, response)
+            self.counts["downloaded"] += 1
+            logger.info(f"Downloaded mutations for {molecular_profile_id} with sample list {sample_list_id}")
+        elif response.status_code == 404:
+            self.counts["not_found"] += 1
+        else:
+            logger.error(f"Unexpected {response.status_code} for {molecular_profile_id}/{sample_list_id}")
+            self.counts["failed"] += 1
+
+    async def worker(self, client: httpx.AsyncClient, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            try:
+                await job(client)
+            except Exception as e:
+                logger.error(f"Download job failed: {e!r}")
+                self.counts["failed"] += 1
+            finally:
+                queue.task_done()
+
+    async def run(self, study_ids: list = None):
+        self.mutations_dir.mkdir(parents=True, exist_ok=True)
+        self.mutations_state = DownloadState(self.output_dir / STATE_FILE_NAME)
+        limits = httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(60, read=600), limits=limits) as client:
+            studies = await self.get_json(client, "/studies")
+            with open(self.output_dir / "all_studies.json", "w") as studies_file:
+                json.dump(studies, studies_file)
+            if not study_ids:
+                study_ids = [study["studyId"] for study in studies]
+            with open(self.output_dir / "study_ids.txt", "w") as study_ids_file:
+                study_ids_file.write("\n".join(study_ids) + "\n")
+
+            queue = asyncio.Queue()
+            workers = [asyncio.create_task(self.worker(client, queue)) for _ in range(self.workers)]
+
+            async def queue_study(client, study_id):
+                # a study's metadata requests are jobs too, so the worker pool bounds every request
+                for molecular_profile_id, sample_list_id in await self.get_mutation_requests(client, study_id):
+                    queue.put_nowait(lambda client, profile_id=molecular_profile_id, list_id=sample_list_id:
+                                     self.download_mutations(client, profile_id, list_id))
+
+            for study_id in study_ids:
+                queue.put_nowait(lambda client, study_id=study_id: queue_study(client, study_id))
+            try:
+                await queue.join()
+            finally:
+                for worker_task in workers:
+                    worker_task.cancel()
+                self.mutations_state.save()
+        logger.info(f"Download summary: {self.counts}")
+        return self.counts
+
+
+class RetryAfter(Exception):
+    def __init__(self, seconds: int):
+        super().__init__(f"server asked to retry after {seconds}s")
+        self.seconds = seconds
+
+class DownloadFailed(Exception):
+    pass
+
+
+def get_cbioportal_stand_in_handler(studies: dict, mutations: dict, last_modified: str):
+    class CBioPortalStandInHandler(BaseHTTPRequestHandler):
+        # (path, status) of every request, to check what the downloader asked for
+        requests = []
+
+        def log_message(self, format, *args):
+            pass
+
+        def is_not_modified(self, etag: str) -> bool:
+            # If-None-Match takes precedence over If-Modified-Since, like on the real API
+            if "If-None-Match" in self.headers:
+                return self.headers["If-None-Match"] == etag
+            if_modified_since = self.headers.get("If-Modified-Since")
+            return bool(if_modified_since) and \
+                parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+
+        def send_json(self, response_json, path: str):
+            response_body = json.dumps(response_json).encode()
+            etag = f'"{hashlib.sha256(response_body).hexdigest()[:16]}"'
+            status = 304 if self.is_not_modified(etag) else 200
+            self.requests.append((path, status))
+            self.send_response(status)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            if status == 304:
+                self.end_headers()
+                return
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response_body)))
+            self.end_headers()
+            self.wfile.write(response_body)
+
+        def send_not_found(self, path: str):
+            self.requests.append((path, 404))
+            self.send_error(404)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path_parts = url.path.strip("/").split("/")
+            if path_parts == ["studies"]:
+                self.send_json([{"studyId": study_id} for study_id in studies], url.path)
+            elif len(path_parts) == 3 and path_parts[0] == "studies" and path_parts[1] in studies and \
+                    path_parts[2] in ("molecular-profiles", "sample-lists"):
+                self.send_json(studies[path_parts[1]][path_parts[2]], url.path)
+            elif len(path_parts) == 3 and path_parts[0] == "molecular-profiles" and path_parts[2] == "mutations":
+                sample_list_id = parse_qs(url.query).get("sampleListId", [""])[0]
+                mutation_key = (path_parts[1], sample_list_id)
+                if mutation_key in mutations:
+                    self.send_json(mutations[mutation_key], f"{url.path}?sampleListId={sample_list_id}")
+                else:
+                    self.send_not_found(f"{url.path}?sampleListId={sample_list_id}")
+            else:
+                self.send_not_found(url.path)
+
+    return CBioPortalStandInHandler
+
+def serve_cbioportal_stand_in(studies: dict, mutations: dict, host: str = "127.0.0.1",
+                              port: int = 8080) -> ThreadingHTTPServer:
+    """
+    A local stand-in for the cBioPortal API, for testing the downloader without cbioportal.org.
+    studies maps study ids to {"molecular-profiles": [...], "sample-lists": [...]}, mutations maps
+    (molecularProfileId, sampleListId) to the list of mutations. Responses carry an ETag and Last-Modified
+    header and conditional requests for unchanged data get a 304.
+    Use it with CBioPortalDownloader(output_dir, base_url=f"http://{host}:{port}").
+    """
+    return ThreadingHTTPServer((host, port),
+                               get_cbioportal_stand_in_handler(studies, mutations, formatdate(usegmt=True)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Download cBioPortal mutation data')
+    parser.add_argument('--output-dir', default=str(downloads_dir / "cbioportal" / "current"),
+                        help='Directory to download into, reruns reuse and revalidate its contents')
+    parser.add_argument('--base-url', default=CBIOPORTAL_API_URL, help='cBioPortal API base url')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of concurrent downloads')
+    parser.add_argument('--rate', type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help='Maximum average number of requests per second')
+    parser.add_argument('--no-revalidate', action='store_true',
+                        help='Skip files that were already downloaded without checking if they changed')
+    parser.add_argument('--studies', nargs='*', help='Only download these study IDs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    downloader = CBioPortalDownloader(Path(args.output_dir),
+                                      base_url=args.base_url,
+                                      workers=args.workers,
+                                      requests_per_second=args.rate,
+                                      revalidate=not args.no_revalidate)
+    asyncio.run(downloader.run(study_ids=args.studies))
@@ -1,9 +1,13 @@
+import asyncio
+import codecs
 import json
 import logging
 import glob
 import os
-import requests
+import random
+import httpx
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Get the directory of this script
@@ -19,17 +23,38 @@ output_dir = Path(config["relevant_paths"]["generated_datasets"])
 log_path = Path(config["relevant_paths"]["logs"])
 mapping_dir = script_dir.parent / "mapping"
 
-# Create parent directories if needed
-os.makedirs(os.path.dirname(log_path), exist_ok=True)
+# MyGene.info accepts up to 1000 IDs per query
+MYGENE_QUERY_URL = "https://mygene.info/v3/query"
+MYGENE_BATCH_SIZE = 1000
+MYGENE_CONCURRENCY = 4
+MYGENE_MAX_ATTEMPTS = 5
+MYGENE_BACKOFF_SECONDS = 2
+SYMBOL_CACHE_PATH = output_dir / "cache" / "entrez_gene_symbols.json"
+
+# Mutation files are read in chunks of this many bytes
+READ_SIZE = 1024 * 1024
+
+# ijson's C backend is the fastest way to stream the arrays, fall back to the stdlib decoder without it
+try:
+    import ijson
+    STREAM_ERRORS = (OSError, ValueError, AttributeError, ijson.JSONError)
+except ImportError:
+    ijson = None
+    STREAM_ERRORS = (OSError, ValueError, AttributeError)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    filename=log_path,
-    filemode="w"
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging():
+    # Create parent directories if needed
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filename=log_path,
+        filemode="w"
+    )
+
 def load_study_mapping(json_file):
     """Load the study ID to DOID mapping from JSON file."""
     logger.info(f"Loading study ID mapping from {json_file}")
@@ -45,58 +70,193 @@ def load_study_mapping(json_file):
         logger.error(f"Invalid JSON in mapping file: {e}")
         raise
 
-def map_entrez_to_gene_names(entrez_ids):
+def load_symbol_cache(cache_path):
+    """Load the persistent Entrez Gene ID -> gene symbol cache."""
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, 'r') as f:
+            return {int(entrez_id): symbol for entrez_id, symbol in json.load(f).items()}
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable gene symbol cache {cache_path}: {e}")
+        return {}
+
+def save_symbol_cache(cache_path, symbol_cache):
+    os.makedirs(cache_path.parent, exist_ok=True)
+    temp_cache_path = cache_path.with_suffix('.tmp')
+    with open(temp_cache_path, 'w') as f:
+        json.dump({str(entrez_id): symbol for entrez_id, symbol in sorted(symbol_cache.items())}, f)
+    os.replace(temp_cache_path, cache_path)
+
+async def query_mygene_batch(client, semaphore, entrez_ids):
+    """
+    Query one batch of Entrez IDs, retrying transient failures with exponential backoff.
+    Returns an empty list if the batch keeps failing so only this batch falls back to placeholders.
+    """
+    params = {
+        'q': ','.join(str(eid) for eid in entrez_ids),
+        'scopes': 'entrezgene',
+        'fields': 'symbol,name',
+        'species': 'human'
+    }
+    for attempt in range(1, MYGENE_MAX_ATTEMPTS + 1):
+        try:
+            async with semaphore:
+                response = await client.post(MYGENE_QUERY_URL, data=params)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise httpx.HTTPStatusError(f"MyGene.info returned {response.status_code}",
+                                            request=response.request, response=response)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 429 and e.response.status_code < 500:
+                logger.error(f"MyGene.info rejected a batch of {len(entrez_ids)} IDs: {e}")
+                return []
+            error = e
+        except httpx.TransportError as e:
+            error = e
+        if attempt < MYGENE_MAX_ATTEMPTS:
+            backoff = MYGENE_BACKOFF_SECONDS * 2 ** (attempt - 1) + random.uniform(0, 1)
+            logger.warning(f"MyGene.info batch of {len(entrez_ids)} IDs failed ({error!r}), "
+                           f"retrying in {backoff:.1f}s (attempt {attempt}/{MYGENE_MAX_ATTEMPTS})")
+            await asyncio.sleep(backoff)
+    logger.error(f"MyGene.info batch of {len(entrez_ids)} IDs failed after {MYGENE_MAX_ATTEMPTS} attempts")
+    return []
+
+async def fetch_gene_symbols(entrez_ids):
+    """Look up gene symbols in bounded batches sent concurrently over a pooled connection."""
+    batches = [entrez_ids[i:i + MYGENE_BATCH_SIZE] for i in range(0, len(entrez_ids), MYGENE_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(MYGENE_CONCURRENCY)
+    limits = httpx.Limits(max_connections=MYGENE_CONCURRENCY, max_keepalive_connections=MYGENE_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        batch_results = await asyncio.gather(*[query_mygene_batch(client, semaphore, batch) for batch in batches])
+
+    symbols = {}
+    for results in batch_results:
+        for result in results:
+            if 'symbol' in result:
+                symbols[int(result['query'])] = result['symbol']
+    return symbols
+
+def map_entrez_to_gene_names(entrez_ids, cache_path=None):
     """
     Map Entrez Gene IDs to gene symbols using MyGene.info API.
-    Handles batch requests efficiently.
+    Resolved symbols are kept in a local cache so later runs only query new IDs.
     """
     if not entrez_ids:
         return {}
-    
-    logger.info(f"Mapping {len(entrez_ids)} Entrez Gene IDs to gene symbols")
-    
-    # Convert to strings for API
-    entrez_ids_str = [str(eid) for eid in entrez_ids]
-    
+
+    cache_path = cache_path or SYMBOL_CACHE_PATH
+    symbol_cache = load_symbol_cache(cache_path)
+    uncached_ids = sorted({int(eid) for eid in entrez_ids if int(eid) not in symbol_cache})
+    logger.info(f"Mapping {len(entrez_ids)} Entrez Gene IDs to gene symbols "
+                f"({len(entrez_ids) - len(uncached_ids)} cached, {len(uncached_ids)} to query)")
+
+    if uncached_ids:
+        symbol_cache.update(asyncio.run(fetch_gene_symbols(uncached_ids)))
+        save_symbol_cache(cache_path, symbol_cache)
+
+    mapping = {}
+    unmapped_count = 0
+    for eid in entrez_ids:
+        if int(eid) in symbol_cache:
+            mapping[int(eid)] = symbol_cache[int(eid)]
+        else:
+            mapping[int(eid)] = f"ENTREZ:{eid}"
+            unmapped_count += 1
+
+    logger.info(f"Successfully mapped {len(mapping) - unmapped_count} gene IDs")
+    if unmapped_count > 0:
+        logger.warning(f"{unmapped_count} gene IDs could not be mapped to symbols")
+
+    return mapping
+
+def iterate_json_array(f, read_size=READ_SIZE):
+    """
+    Yield the elements of a top-level JSON array one at a time, holding only a small
+    window of the file in memory.
+    """
+    if ijson:
+        yield from ijson.items(f, 'item')
+        return
+
+    decoder = json.JSONDecoder()
+    # keeps the bytes of a character split across two chunks until the rest of it is read
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ""
+    position = 0
+    in_array = False
+    end_of_file = False
+
+    def read_more():
+        nonlocal buffer, position, end_of_file
+        chunk = f.read(read_size)
+        if not chunk:
+            end_of_file = True
+        if isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk, final=end_of_file)
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    while True:
+        # skip whitespace, the opening bracket and separators between elements
+        while position < len(buffer) and (buffer[position] in ' \t\r\n,' or (not in_array and buffer[position] == '[')):
+            if buffer[position] == '[':
+                in_array = True
+            position += 1
+        if position >= len(buffer):
+            if end_of_file:
+                if in_array:
+                    raise json.JSONDecodeError("Unterminated array", buffer, position)
+                return
+            read_more()
+            continue
+        if not in_array:
+            raise json.JSONDecodeError("Expected a JSON array", buffer, position)
+        if buffer[position] == ']':
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if end_of_file:
+                raise
+            read_more()
+            continue
+        # an element ending exactly at the end of the buffer may be a truncated number
+        if end == len(buffer) and not end_of_file:
+            read_more()
+            continue
+        yield element
+        position = end
+
+def extract_file_keys(json_file):
+    """
+    Stream one mutation file and return its unique (entrezGeneId, chr, studyId) keys in first-seen order.
+    Runs in a worker process, so errors are returned to be logged by the parent.
+    """
+    file_keys = OrderedDict()
+    file_records = 0
     try:
-        url = "https://mygene.info/v3/query"
-        params = {
-            'q': ','.join(entrez_ids_str),
-            'scopes': 'entrezgene',
-            'fields': 'symbol,name',
-            'species': 'human'
-        }
-        
-        response = requests.post(url, data=params, timeout=30)
-        response.raise_for_status()
-        results = response.json()
-        
-        mapping = {}
-        unmapped_count = 0
-        
-        for result in results:
-            query = result.get('query')
-            if 'symbol' in result:
-                mapping[int(query)] = result['symbol']
-            else:
-                mapping[int(query)] = f"ENTREZ:{query}"
-                unmapped_count += 1
-        
-        logger.info(f"Successfully mapped {len(mapping) - unmapped_count} gene IDs")
-        if unmapped_count > 0:
-            logger.warning(f"{unmapped_count} gene IDs could not be mapped to symbols")
-        
-        return mapping
-    
-    except requests.RequestException as e:
-        logger.error(f"Error calling MyGene.info API: {e}")
-        logger.warning("Falling back to using Entrez IDs as gene names")
-        return {int(eid): f"ENTREZ:{eid}" for eid in entrez_ids_str}
+        with open(json_file, 'rb') as f:
+            for record in iterate_json_array(f):
+                file_records += 1
+                entrez_gene_id = record.get('entrezGeneId')
+                study_id = record.get('studyId')
+                chr_val = record.get('chr')
+
+                if not entrez_gene_id or not study_id or not chr_val:
+                    continue
+                file_keys[(int(entrez_gene_id), chr_val, study_id)] = None
+    except STREAM_ERRORS as e:
+        # a truncated or malformed file is skipped entirely
+        return json_file, [], 0, str(e)
+    return json_file, list(file_keys), file_records, None
 
-def extract_gene_info(json_pattern, mapping_json, output_json):
+def extract_gene_info(json_pattern, mapping_json, output_json, workers=None):
     """
     Extract entrezGeneId, chr, and DOID from multiple JSON files,
     map gene symbols, and write to output JSON.
+    Files are streamed in parallel worker processes so peak memory doesn't depend on file size.
     """
     logger.info(f"Starting extraction from files matching: {json_pattern}")
     
@@ -104,7 +264,7 @@ def extract_gene_info(json_pattern, mapping_json, output_json):
     study_mapping = load_study_mapping(mapping_json)
     
     # Find all matching JSON files
-    json_files = glob.glob(str(json_pattern))
+    json_files = sorted(glob.glob(str(json_pattern)))
     if not json_files:
         logger.error(f"No files found matching pattern: {json_pattern}")
         raise FileNotFoundError(f"No files found matching: {json_pattern}")
@@ -117,37 +277,25 @@ def extract_gene_info(json_pattern, mapping_json, output_json):
     all_entrez_ids = set()
     total_records = 0
     
-    for json_file in json_files:
-        logger.info(f"Processing: {json_file}")
-        try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-            
-            file_records = len(data)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # results come back in file order so the output is deterministic
+        for json_file, file_keys, file_records, error in executor.map(extract_file_keys, json_files):
+            if error:
+                logger.error(f"Error processing {json_file}: {error}")
+                continue
             total_records += file_records
-            
-            for record in data:
-                entrez_gene_id = record.get('entrezGeneId')
-                study_id = record.get('studyId')
-                chr_val = record.get('chr')
-                
-                if not entrez_gene_id or not study_id or not chr_val:
-                    continue
-                
+
+            for entrez_gene_id, chr_val, study_id in file_keys:
                 all_entrez_ids.add(entrez_gene_id)
-                
+
                 doid = study_mapping.get(study_id)
                 if doid:
                     key = (entrez_gene_id, chr_val, doid)
                     extracted_data[key] = None
                 else:
                     unmapped_studies.add(study_id)
-            
+
             logger.info(f"  Processed {file_records} records from {Path(json_file).name}")
-        
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.error(f"Error processing {json_file}: {e}")
-            continue
     
     logger.info(f"Total records processed: {total_records}")
     logger.info(f"Unique gene-chr-doid combinations: {len(extracted_data)}")
@@ -181,7 +329,9 @@ def extract_gene_info(json_pattern, mapping_json, output_json):
 
 
 if __name__ == "__main__":
-    JSON_PATTERN = downloads_dir / "current" / "mutations" / "*.json"
+    configure_logging()
+    # where 1_download/fetch_mutations.py downloads to by default (its --output-dir)
+    JSON_PATTERN = downloads_dir / "cbioportal" / "current" / "mutations" / "*.json"
     MAPPING_JSON = mapping_dir / "merged.json"
     OUTPUT_JSON = output_dir / "current" / "all-chr-gene-doid-info.json"
     
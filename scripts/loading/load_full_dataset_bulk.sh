@@ -139,6 +139,10 @@ else
     exit 1
 fi
 
+# Mark the new graph version, so query results cached before this load are invalidated
+uv run python src/midas/query_cache.py --endpoint "https://$CLUSTER_ENDPOINT:8182" --region $REGION \
+    || echo "Could not write the graph version, cached query results expire after their TTL"
+
 echo ""
 echo "=== Data Loading Complete ==="
 echo "Verifying counts..."
@@ -246,6 +246,11 @@ while true; do
     sleep 10
 done
 
+# Mark the new graph version, so query results cached before this load are invalidated
+log_info "Writing graph version..."
+uv run python src/midas/query_cache.py --endpoint "https://$NEPTUNE_ENDPOINT:8182" --region "$REGION" \
+    || log_warning "Could not write the graph version, cached query results expire after their TTL"
+
 echo ""
 echo "================================================"
 log_success "goldenKG_v2 load completed successfully!"
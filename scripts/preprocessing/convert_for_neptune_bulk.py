@@ -106,7 +106,11 @@ def convert_for_neptune_bulk(input_file, output_file, file_type):
                     })
 
 def create_test_files(input_file, output_file, file_type, limit=100):
-    """Create test files with limited records."""
+    """
+    Create test files with the first records of a file.
+    These are skewed towards whichever source comes first and the edges don't match the nodes,
+    use create_sampled_test_files for a representative, closed subgraph.
+    """
     
     with open(input_file, 'r', encoding='utf-8') as infile:
         with open(output_file, 'w', encoding='utf-8', newline='') as outfile:
@@ -180,6 +184,11 @@ def create_test_files(input_file, output_file, file_type, limit=100):
                     })
                     count += 1
 
+def create_sampled_test_files(nodes_input_file, edges_input_file, output_dir, fraction):
+    """Sample a closed subgraph of a merged KGX graph, stratified by node category, as KGX and Neptune CSV."""
+    from midas.sampling import sample_graph
+    return sample_graph(nodes_input_file, edges_input_file, output_dir, "sample", fraction=fraction)
+
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='Convert files for Neptune bulk loading')
@@ -187,10 +196,25 @@ if __name__ == '__main__':
     parser.add_argument('--output', required=True, help='Output file path')
     parser.add_argument('--type', choices=['nodes', 'edges'], required=True, help='File type')
     parser.add_argument('--test', type=int, help='Create test file with limited records')
+    parser.add_argument('--shard-rows', type=int, help='Split the output into files of at most this many rows (KGX input only)')
+    parser.add_argument('--sample', type=float,
+                        help='Sample this fraction of a merged KGX graph: --input is the nodes file, '
+                             '--edges-input the edges file and --output the output directory')
+    parser.add_argument('--edges-input', help='KGX edges file for --sample')
     
     args = parser.parse_args()
     
-    if args.test:
+    if args.sample:
+        if not args.edges_input:
+            parser.error('--sample requires --edges-input')
+        print(f"Sampling {args.sample:.2%} of the graph...")
+        create_sampled_test_files(args.input, args.edges_input, args.output, args.sample)
+    elif args.input.endswith(('.jsonl', '.parquet')) and not args.test:
+        # merged KGX input is transcoded in a single pass, see midas.neptune_csv
+        from midas.neptune_csv import convert_kgx_file_to_neptune_csv
+        print("Converting KGX file...")
+        convert_kgx_file_to_neptune_csv(args.input, args.type, args.output, max_rows_per_file=args.shard_rows)
+    elif args.test:
         print(f"Creating test file with {args.test} records...")
         create_test_files(args.input, args.output, args.type, args.test)
     else:
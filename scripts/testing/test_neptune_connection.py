@@ -4,7 +4,8 @@ Test Neptune connection and basic queries
 """
 
 import json
-import subprocess
+
+from midas.neptune_client import NeptuneClient, NeptuneQueryError
 
 def test_neptune_connection():
     """Test basic Neptune connection and queries"""
@@ -12,20 +13,14 @@ def test_neptune_connection():
     NEPTUNE_ENDPOINT = "https://midas-test.cluster-c7j2zglv4rfb.us-east-1.neptune.amazonaws.com:8182"
     REGION = "us-east-1"
     
+    client = NeptuneClient(NEPTUNE_ENDPOINT, region=REGION)
+    
     def execute_query(query):
         """Execute a query on Neptune"""
-        cmd = [
-            'awscurl',
-            '--service', 'neptune-db',
-            '--region', REGION,
-            f"{NEPTUNE_ENDPOINT}/openCypher",
-            '-X', 'POST',
-            '-H', 'Content-Type: application/json',
-            '-d', json.dumps({"query": query})
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        return result.returncode == 0, result.stdout, result.stderr
+        try:
+            return True, json.dumps(client.execute_query(query)), ""
+        except NeptuneQueryError as e:
+            return False, "", str(e)
     
     print("Testing Neptune connection...")
     
@@ -0,0 +1,288 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from datetime import datetime, timezone
+from pathlib import Path
+
+import click
+
+from midas.convert_data import get_source_data_path
+from midas.instrumentation import count_records, get_rss_mb
+from midas.synthetic_data import DEFAULT_SEED, SYNTHETIC_SOURCES, format_scale, generate_source_data, parse_scale
+from midas.util import DATA_DIRECTORY_VARIABLE, DATA_OUTPUT_DIRECTORY_VARIABLE, get_data_output_directory_path, \
+    get_kg_output_directory_path, get_source_kgx_files, get_source_normalized_files
+
+BENCHMARK_GRAPH_ID = "benchmarkKG"
+BENCHMARK_STAGES = ["convert", "normalize", "merge", "metadata", "csv"]
+# stages that run once per source, the others run once for the merged graph
+SOURCE_STAGES = ["convert", "normalize"]
+# normalization is mostly waiting on the Node Normalizer and ClinGen services, it's only timed when asked for
+DEFAULT_STAGES = ["convert", "merge", "metadata", "csv"]
+DEFAULT_SCALES = ["10k", "100k", "1M"]
+DEFAULT_REGRESSION_THRESHOLD = 0.1
+# shorter stages vary more than this between runs on the same commit
+DEFAULT_MIN_SECONDS = 1.0
+LOG_TAIL_LINES = 20
+
+
+def get_benchmark_directory_path() -> Path:
+    benchmark_dir = get_data_output_directory_path() / "benchmarks"
+    benchmark_dir.mkdir(exist_ok=True)
+    return benchmark_dir
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def get_graph_files(graph_id: str = BENCHMARK_GRAPH_ID) -> dict:
+    graph_dir = get_kg_output_directory_path() / graph_id
+    return {"nodes": graph_dir / f"{graph_id}_nodes.jsonl",
+            "edges": graph_dir / f"{graph_id}_edges.jsonl",
+            "metadata": graph_dir / f"{graph_id}_metadata.json",
+            "nodes_csv": graph_dir / f"{graph_id}_nodes.csv",
+            "edges_csv": graph_dir / f"{graph_id}_edges.csv"}
+
+def get_stage_files(stage: str, sources: list, source: str = None) -> tuple:
+    """The input and output files of a benchmark stage."""
+    graph_files = get_graph_files()
+    if stage == "convert":
+        return [get_source_data_path(source)], get_source_kgx_files(source)
+    if stage == "normalize":
+        return get_source_kgx_files(source), get_source_normalized_files(source)
+    if stage == "merge":
+        return [file_path for source in sources for file_path in get_source_normalized_files(source)], \
+            [graph_files["nodes"], graph_files["edges"]]
+    if stage == "metadata":
+        return [graph_files["nodes"], graph_files["edges"]], [graph_files["metadata"]]
+    return [graph_files["nodes"], graph_files["edges"]], [graph_files["nodes_csv"], graph_files["edges_csv"]]
+
+def run_stage(stage: str, sources: list, source: str = None):
+    # imported here, in the stage process, so loading ORION (and the biolink model merging fetches) counts
+    # towards the stages and the harness itself can compare results without it
+    from midas.convert_data import convert_source
+    from midas.kgx_converter import convert_kgx_to_csv
+    from midas.merge import merge as merge_sources
+    from midas.metadata import generate_metadata
+    from midas.normalize import normalize_source
+
+    if stage == "convert":
+        convert_source(source)
+    elif stage == "normalize":
+        normalize_source(source)
+    elif stage == "merge":
+        graph_dir = get_kg_output_directory_path() / BENCHMARK_GRAPH_ID
+        graph_dir.mkdir(exist_ok=True)
+        merge_sources(BENCHMARK_GRAPH_ID, sources, output_dir=graph_dir)
+    elif stage == "metadata":
+        graph_files = get_graph_files()
+        generate_metadata(BENCHMARK_GRAPH_ID, graph_files["nodes"], graph_files["edges"])
+    elif stage == "csv":
+        graph_files = get_graph_files()
+        convert_kgx_to_csv(nodes_input_file=graph_files["nodes"], edges_input_file=graph_files["edges"],
+                           nodes_output_file=graph_files["nodes_csv"], edges_output_file=graph_files["edges_csv"])
+
+def measure_stage(stage: str, sources: list, workspace_dir: Path, source: str = None) -> dict:
+    """
+    Run a stage in its own process against the workspace, so its peak RSS isn't mixed up with the other
+    stages. wait4 reports the peak RSS and CPU time of the stage process and the worker processes it waited for.
+    """
+    stage_name = f"{stage}:{source}" if source else stage
+    environment = dict(os.environ)
+    environment[DATA_DIRECTORY_VARIABLE] = str(workspace_dir / "data")
+    environment[DATA_OUTPUT_DIRECTORY_VARIABLE] = str(workspace_dir / "data_output")
+    # the stage process imports midas from the same place as this one
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, [str(Path(__file__).parent.parent),
+                                                              environment.get("PYTHONPATH")]))
+    command = [sys.executable, "-m", "midas.benchmark", "stage", stage, *[f"--sources={source}" for source in sources]]
+    if source:
+        command.append(f"--source={source}")
+    log_file_path = workspace_dir / "logs" / f"{stage_name.replace(':', '_')}.log"
+    log_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    start_time = time.perf_counter()
+    with open(log_file_path, "w") as log_file:
+        stage_process = subprocess.Popen(command, env=environment, stdout=log_file, stderr=subprocess.STDOUT)
+        _, wait_status, rusage = os.wait4(stage_process.pid, 0)
+        stage_process.returncode = os.waitstatus_to_exitcode(wait_status)
+    seconds = time.perf_counter() - start_time
+    if stage_process.returncode != 0:
+        log_tail = "".join(log_file_path.read_text().splitlines(keepends=True)[-LOG_TAIL_LINES:])
+        raise click.ClickException(f"Benchmark stage {stage_name} failed, see {log_file_path}:\n{log_tail}")
+
+    input_files, output_files = get_stage_files(stage, sources, source)
+    output_records = [count_records(file_path) for file_path in output_files]
+    output_records = sum(output_records) if all(count is not None for count in output_records) else None
+    return {"stage": stage_name,
+            "seconds": round(seconds, 3),
+            "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 3),
+            "peak_rss_mb": get_rss_mb(rusage.ru_maxrss),
+            "input_bytes": sum(file_path.stat().st_size for file_path in input_files if file_path.exists()),
+            "output_bytes": sum(file_path.stat().st_size for file_path in output_files if file_path.exists()),
+            "output_records": output_records,
+            "records_per_second": round(output_records / seconds) if output_records and seconds else None}
+
+def skip_normalization(source: str):
+    # synthetic ids are already in their normalized form, merge reads the converted files as they are
+    for kgx_file, normalized_file in zip(get_source_kgx_files(source), get_source_normalized_files(source)):
+        shutil.copyfile(kgx_file, normalized_file)
+
+def run_benchmark_scale(record_count: int, sources: list, stages: list, workspace_dir: Path,
+                        seed: int = DEFAULT_SEED) -> list:
+    previous_environment = {key: os.environ.get(key) for key in [DATA_DIRECTORY_VARIABLE,
+                                                                  DATA_OUTPUT_DIRECTORY_VARIABLE]}
+    os.environ[DATA_DIRECTORY_VARIABLE] = str(workspace_dir / "data")
+    os.environ[DATA_OUTPUT_DIRECTORY_VARIABLE] = str(workspace_dir / "data_output")
+    try:
+        for source in sources:
+            generate_source_data(source, record_count, seed=seed)
+        results = []
+        for stage in BENCHMARK_STAGES:
+            stage_sources = sources if stage in SOURCE_STAGES else [None]
+            for source in stage_sources:
+                if stage in stages:
+                    stage_result = measure_stage(stage, sources, workspace_dir, source=source)
+                    print(f"{format_scale(record_count)} {stage_result['stage']}: {stage_result['seconds']:.2f}s, "
+                          f"peak RSS {stage_result['peak_rss_mb']:.0f}MB, {stage_result['output_records']} records")
+                    results.append({"scale": format_scale(record_count), "records_per_source": record_count,
+                                    **stage_result})
+                elif stage == "normalize":
+                    skip_normalization(source)
+        return results
+    finally:
+        for key, value in previous_environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def run_benchmark(scales: list, sources: list, stages: list, output_file: Path = None, seed: int = DEFAULT_SEED,
+                  keep_workspace: bool = False) -> dict:
+    """
+    Generate synthetic source data at each scale (records per source) and time the pipeline stages on it,
+    writing the results to a json file that can be compared with the results of another commit.
+    """
+    benchmark_dir = get_benchmark_directory_path()
+    commit = get_git_commit()
+    created_at = datetime.now(timezone.utc)
+    benchmark = {"commit": commit,
+                 "created_at": created_at.isoformat(timespec="seconds"),
+                 "python": platform.python_version(),
+                 "platform": platform.platform(),
+                 "cpu_count": os.cpu_count(),
+                 "sources": sources,
+                 "stages": stages,
+                 "seed": seed,
+                 "results": []}
+    output_file = Path(output_file) if output_file else \
+        benchmark_dir / f"benchmark_{(commit or 'unknown')[:12]}_{created_at:%Y%m%dT%H%M%S}.json"
+    for record_count in sorted(parse_scale(scale) for scale in scales):
+        workspace_dir = benchmark_dir / "workspace" / format_scale(record_count)
+        if workspace_dir.exists():
+            shutil.rmtree(workspace_dir)
+        try:
+            benchmark["results"].extend(run_benchmark_scale(record_count, sources, stages, workspace_dir, seed=seed))
+        finally:
+            if not keep_workspace:
+                shutil.rmtree(workspace_dir, ignore_errors=True)
+        # write after every scale, so the smaller scales are kept if a larger one fails or is interrupted
+        with open(output_file, "w") as benchmark_file:
+            json.dump(benchmark, benchmark_file, indent=4)
+    print(f"Wrote benchmark results to {output_file}")
+    return benchmark
+
+def compare_benchmarks(baseline: dict, current: dict, threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+                       min_seconds: float = DEFAULT_MIN_SECONDS) -> list:
+    """
+    Stage results present in both benchmarks, with their time and peak RSS ratios (current / baseline)
+    and whether either grew by more than the threshold. Stages faster than min_seconds in both
+    benchmarks aren't flagged for time, they are mostly noise.
+    """
+    baseline_results = {(result["scale"], result["stage"]): result for result in baseline["results"]}
+    comparisons = []
+    for result in current["results"]:
+        baseline_result = baseline_results.get((result["scale"], result["stage"]))
+        if baseline_result is None:
+            continue
+        seconds_ratio = result["seconds"] / baseline_result["seconds"] if baseline_result["seconds"] else None
+        rss_ratio = result["peak_rss_mb"] / baseline_result["peak_rss_mb"] if baseline_result["peak_rss_mb"] else None
+        slower = seconds_ratio is not None and seconds_ratio > 1 + threshold and \
+            max(result["seconds"], baseline_result["seconds"]) >= min_seconds
+        larger = rss_ratio is not None and rss_ratio > 1 + threshold
+        comparisons.append({"scale": result["scale"], "stage": result["stage"],
+                            "baseline_seconds": baseline_result["seconds"], "seconds": result["seconds"],
+                            "seconds_ratio": seconds_ratio,
+                            "baseline_peak_rss_mb": baseline_result["peak_rss_mb"],
+                            "peak_rss_mb": result["peak_rss_mb"],
+                            "peak_rss_ratio": rss_ratio,
+                            "regression": slower or larger})
+    return comparisons
+
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option('--scales', '-n', 'scales', multiple=True, default=DEFAULT_SCALES, show_default=True,
+              help='Records per source to benchmark at, e.g. 10k, 1M or 100M (repeatable).')
+@click.option('--sources', '-s', 'sources', multiple=True, default=SYNTHETIC_SOURCES, show_default=True)
+@click.option('--stages', 'stages', multiple=True, default=DEFAULT_STAGES, show_default=True,
+              help=f'Stages to time, of {", ".join(BENCHMARK_STAGES)}. Without normalize, the converted files '
+                   f'are merged as they are.')
+@click.option('--output', '-o', 'output_file', default=None, type=click.Path(path_type=Path),
+              help='Results file, defaults to data_output/benchmarks/benchmark_<commit>_<time>.json.')
+@click.option('--seed', default=DEFAULT_SEED, show_default=True)
+@click.option('--keep-workspace', is_flag=True, default=False,
+              help='Keep the synthetic data and the stage outputs and logs in data_output/benchmarks/workspace.')
+def run(scales: tuple, sources: tuple, stages: tuple, output_file: Path, seed: int, keep_workspace: bool):
+    """Time the pipeline stages on synthetic data at several scales."""
+    unknown_stages = set(stages) - set(BENCHMARK_STAGES)
+    if unknown_stages:
+        raise click.BadParameter(f"Unknown stages {sorted(unknown_stages)}, expected {BENCHMARK_STAGES}")
+    run_benchmark(list(scales), list(sources), list(stages), output_file=output_file, seed=seed,
+                  keep_workspace=keep_workspace)
+
+@cli.command()
+@click.argument('baseline_file', type=click.Path(exists=True, path_type=Path))
+@click.argument('current_file', type=click.Path(exists=True, path_type=Path))
+@click.option('--threshold', default=DEFAULT_REGRESSION_THRESHOLD, show_default=True,
+              help='Relative growth in time or peak RSS that counts as a regression.')
+@click.option('--min-seconds', default=DEFAULT_MIN_SECONDS, show_default=True,
+              help='Ignore time regressions of stages shorter than this.')
+def compare(baseline_file: Path, current_file: Path, threshold: float, min_seconds: float):
+    """Compare two benchmark results files, exiting with an error if any stage regressed."""
+    with open(baseline_file) as baseline_json, open(current_file) as current_json:
+        baseline, current = json.load(baseline_json), json.load(current_json)
+    click.echo(f"Baseline {baseline['commit']} ({baseline['created_at']}), "
+               f"current {current['commit']} ({current['created_at']})")
+    comparisons = compare_benchmarks(baseline, current, threshold=threshold, min_seconds=min_seconds)
+    for comparison in comparisons:
+        seconds_change = f"{comparison['seconds_ratio'] - 1:+.0%}" if comparison["seconds_ratio"] else "n/a"
+        rss_change = f"{comparison['peak_rss_ratio'] - 1:+.0%}" if comparison["peak_rss_ratio"] else "n/a"
+        click.echo(f"{'REGRESSION ' if comparison['regression'] else ''}{comparison['scale']} {comparison['stage']}: "
+                   f"{comparison['baseline_seconds']:.2f}s -> {comparison['seconds']:.2f}s ({seconds_change}), "
+                   f"peak RSS {comparison['baseline_peak_rss_mb']:.0f}MB -> {comparison['peak_rss_mb']:.0f}MB "
+                   f"({rss_change})")
+    regressions = [comparison for comparison in comparisons if comparison["regression"]]
+    if regressions:
+        raise click.ClickException(f"{len(regressions)} of {len(comparisons)} stage results regressed "
+                                   f"by more than {threshold:.0%}")
+
+@cli.command(hidden=True)
+@click.argument('stage', type=click.Choice(BENCHMARK_STAGES))
+@click.option('--sources', 'sources', multiple=True)
+@click.option('--source', default=None)
+def stage(stage: str, sources: tuple, source: str):
+    """Run one stage, in the process measure_stage starts for it."""
+    run_stage(stage, list(sources), source=source)
+
+if __name__ == "__main__":
+    cli()
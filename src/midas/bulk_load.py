@@ -0,0 +1,500 @@
+"""
+Neptune bulk loads of the sharded openCypher CSV files written by neptune_csv.py (--shard-rows).
+
+Every shard is uploaded to S3 and loaded as its own load job, so a failed shard is retried on its own instead
+of rerunning the whole load. Node shards are uploaded and queued concurrently, and edge shards are queued once
+every node shard has loaded, because an edge needs both of its nodes. All outstanding load ids are polled
+concurrently with exponential backoff. The records listed in a failed load's errorLogs are written to a retry
+file and loaded again, and the finished shards are recorded in a state file so a rerun skips them. Malformed
+records and edges whose nodes aren't in the graph are counted as rejected records instead of retried.
+"""
+
+import asyncio
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+from midas.neptune_client import (DEFAULT_REGION, AsyncNeptuneClient, NeptuneQueryError,
+                                  get_opencypher_stand_in_handler)
+from midas.neptune_csv import NEPTUNE_FILES_INDEX_SUFFIX
+from midas.query_cache import GraphVersionError, GraphVersionStore, LocalGraphVersionStore, set_graph_version
+from midas.util import get_kg_output_directory_path
+
+LOAD_NOT_STARTED = "LOAD_NOT_STARTED"
+LOAD_IN_QUEUE = "LOAD_IN_QUEUE"
+LOAD_IN_PROGRESS = "LOAD_IN_PROGRESS"
+LOAD_COMPLETED = "LOAD_COMPLETED"
+LOAD_FAILED = "LOAD_FAILED"
+UNFINISHED_LOAD_STATUSES = {LOAD_NOT_STARTED, LOAD_IN_QUEUE, LOAD_IN_PROGRESS}
+LOAD_ERROR_COUNTS = ["parsingErrors", "datatypeMismatchErrors", "insertErrors"]
+# record errors that loading the same rows again won't fix, e.g. PARSING_ERROR
+PERMANENT_ERROR_MARKERS = ("PARSING", "DATATYPE")
+# edge shards load after every node shard loaded, so an edge whose nodes are missing then never loads
+MISSING_VERTEX_ERROR_MARKER = "FROM_OR_TO_VERTEX_ARE_MISSING"
+
+# shard states in the state file
+SHARD_LOADED = "loaded"
+SHARD_FAILED = "failed"
+
+# Neptune queues at most 64 load jobs, leave room for loads started elsewhere
+DEFAULT_MAX_QUEUED_LOADS = 32
+DEFAULT_MAX_ATTEMPTS = 3
+# seconds, the poll interval of a load doubles after every poll up to the maximum
+DEFAULT_POLL_INTERVAL = 2
+DEFAULT_MAX_POLL_INTERVAL = 60
+DEFAULT_PARALLELISM = "HIGH"
+ERRORS_PER_PAGE = 100
+MAX_ERROR_RECORDS = 100_000
+BULK_LOAD_STATE_SUFFIX = "_bulk_load.json"
+
+
+def get_neptune_files_index_path(graph_id: str) -> Path:
+    return get_kg_output_directory_path() / graph_id / "neptune" / f"{graph_id}{NEPTUNE_FILES_INDEX_SUFFIX}"
+
+def load_neptune_files_index(index_file_path) -> dict:
+    with open(index_file_path) as index_file:
+        return json.load(index_file)
+
+def is_permanent_error(error_log: dict, kind: str) -> bool:
+    error_code = error_log.get("errorCode", "")
+    if kind == "edges" and MISSING_VERTEX_ERROR_MARKER in error_code:
+        return True
+    return any(marker in error_code for marker in PERMANENT_ERROR_MARKERS)
+
+def get_file_signature(file_path) -> dict:
+    # a regenerated shard is loaded again even if a previous run loaded a shard with the same name
+    file_stat = os.stat(file_path)
+    return {"size": file_stat.st_size, "modified": file_stat.st_mtime}
+
+def write_retry_file(source_file, record_numbers: set, retry_file):
+    """Copy the header and the given records (1-based, after the header) of a CSV shard to a retry file."""
+    with open(source_file, newline="", encoding="utf-8") as source, \
+            open(retry_file, "w", newline="", encoding="utf-8") as retry:
+        reader = csv.reader(source)
+        writer = csv.writer(retry)
+        writer.writerow(next(reader))
+        writer.writerows(row for record_number, row in enumerate(reader, start=1) if record_number in record_numbers)
+
+
+class S3ObjectStore:
+    """Uploads shards to s3://bucket/prefix/ for the bulk loader."""
+    def __init__(self, bucket: str, prefix: str = "", region: str = DEFAULT_REGION):
+        # boto3 is only needed for real loads, not for the local stand-in
+        import boto3
+        self.s3_client = boto3.client("s3", region_name=region)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def upload_file(self, file_path, key: str) -> str:
+        object_key = f"{self.prefix}/{key}" if self.prefix else key
+        # upload_file switches to concurrent multipart uploads for large shards
+        self.s3_client.upload_file(str(file_path), self.bucket, object_key)
+        return f"s3://{self.bucket}/{object_key}"
+
+
+class LocalObjectStore:
+    """A local stand-in for S3, uploaded files are copied to a directory."""
+    bucket = "local-stand-in"
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def upload_file(self, file_path, key: str) -> str:
+        shutil.copyfile(file_path, self.directory / key)
+        return f"s3://{self.bucket}/{key}"
+
+    def get_local_path(self, source_uri: str) -> Path:
+        return self.directory / urlparse(source_uri).path.lstrip("/")
+
+
+class BulkLoader:
+    """
+    Loads node and edge shards through the Neptune bulk loader API (POST /loader, GET /loader/<load id>).
+    object_store uploads a shard and returns its s3:// uri, S3ObjectStore or LocalObjectStore.
+    """
+    def __init__(self,
+                 client: AsyncNeptuneClient,
+                 object_store,
+                 iam_role_arn: str,
+                 region: str = DEFAULT_REGION,
+                 state_file=None,
+                 max_queued_loads: int = DEFAULT_MAX_QUEUED_LOADS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 max_poll_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                 parallelism: str = DEFAULT_PARALLELISM):
+        self.client = client
+        self.object_store = object_store
+        self.iam_role_arn = iam_role_arn
+        self.region = region
+        self.state_file = Path(state_file) if state_file else None
+        self.max_queued_loads = max_queued_loads
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.parallelism = parallelism
+        # shard path -> shard result, from previous runs and this one
+        self.state = {}
+        if self.state_file and self.state_file.exists():
+            with open(self.state_file) as state_in:
+                self.state = json.load(state_in)
+
+    def save_state(self):
+        if self.state_file:
+            with open(self.state_file, "w") as state_out:
+                json.dump(self.state, state_out, indent=4)
+
+    def get_load_request(self, source: str, kind: str) -> dict:
+        load_request = {
+            "source": source,
+            "format": "opencypher",
+            "iamRoleArn": self.iam_role_arn,
+            "region": self.region,
+            "failOnError": "FALSE",
+            "parallelism": self.parallelism,
+            "updateSingleCardinalityProperties": "FALSE",
+            "queueRequest": "TRUE"
+        }
+        if kind == "edges":
+            load_request["userProvidedEdgeIds"] = "FALSE"
+        return load_request
+
+    async def submit_load(self, source: str, kind: str) -> str:
+        delay = self.poll_interval
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = await self.client.request("POST", "/loader",
+                                                     json_body=self.get_load_request(source, kind))
+                return response["payload"]["loadId"]
+            except NeptuneQueryError as e:
+                # throttling and a full load queue are transient
+                if attempt == self.max_attempts:
+                    raise
+                print(f"Submitting {source} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+    async def wait_for_load(self, load_id: str, name: str) -> dict:
+        """Poll a load until it finishes and return its overallStatus."""
+        interval = self.poll_interval
+        last_progress = None
+        while True:
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+            try:
+                response = await self.client.request("GET", f"/loader/{load_id}")
+            except NeptuneQueryError as e:
+                print(f"Polling load {load_id} ({name}) failed: {e}")
+                continue
+            overall_status = response["payload"]["overallStatus"]
+            progress = (overall_status["status"], overall_status.get("totalRecords", 0))
+            if progress != last_progress:
+                print(f"{name}: {progress[0]}, {progress[1]} records")
+                last_progress = progress
+            if overall_status["status"] not in UNFINISHED_LOAD_STATUSES:
+                return overall_status
+
+    async def get_load_errors(self, load_id: str) -> list:
+        error_logs = []
+        page = 1
+        while len(error_logs) < MAX_ERROR_RECORDS:
+            response = await self.client.request(
+                "GET", f"/loader/{load_id}?details=true&errors=true&page={page}&errorsPerPage={ERRORS_PER_PAGE}")
+            page_error_logs = response["payload"].get("errors", {}).get("errorLogs", [])
+            error_logs.extend(page_error_logs)
+            if len(page_error_logs) < ERRORS_PER_PAGE:
+                break
+            page += 1
+        return error_logs
+
+    async def load_shard(self, shard_path, kind: str, load_slots: asyncio.Semaphore) -> dict:
+        shard_path = Path(shard_path)
+        file_signature = get_file_signature(shard_path)
+        previous_result = self.state.get(str(shard_path))
+        if previous_result and previous_result["file"] == file_signature:
+            if previous_result["status"] == SHARD_LOADED:
+                print(f"{shard_path.name}: loaded by a previous run, skipping")
+                return previous_result
+            # resume a failed shard from the records it still has to load, loading the loaded edges again
+            # would duplicate them
+            shard_result = previous_result
+            source_file = Path(previous_result["pending_file"])
+            print(f"{shard_path.name}: resuming from {source_file.name}")
+        else:
+            shard_result = {"kind": kind, "file": file_signature, "status": None, "pending_file": None,
+                            "rejected_records": 0, "loads": []}
+            source_file = shard_path
+
+        for attempt in range(1, self.max_attempts + 1):
+            # a slot is held from upload to the end of the load, so the load queue never overflows
+            async with load_slots:
+                source = await asyncio.to_thread(self.object_store.upload_file, source_file, source_file.name)
+                load_id = await self.submit_load(source, kind)
+                print(f"{source_file.name}: submitted load {load_id}")
+                overall_status = await self.wait_for_load(load_id, source_file.name)
+                error_logs = []
+                if overall_status["status"] != LOAD_COMPLETED or \
+                        any(overall_status.get(error_count, 0) for error_count in LOAD_ERROR_COUNTS):
+                    error_logs = await self.get_load_errors(load_id)
+            shard_result["loads"].append({"load_id": load_id, "source": source, "status": overall_status["status"],
+                                          "records": overall_status.get("totalRecords", 0),
+                                          "errors": len(error_logs)})
+
+            record_errors = [error_log for error_log in error_logs if error_log.get("recordNum")]
+            permanent_errors = [error_log for error_log in record_errors if is_permanent_error(error_log, kind)]
+            retry_record_numbers = {error_log["recordNum"] for error_log in record_errors} - \
+                {error_log["recordNum"] for error_log in permanent_errors}
+            shard_result["rejected_records"] += len(permanent_errors)
+            for error_log in permanent_errors[:5]:
+                print(f"{source_file.name}: record {error_log['recordNum']} rejected, "
+                      f"{error_log.get('errorCode')}: {error_log.get('errorMessage')}")
+
+            if not retry_record_numbers and (overall_status["status"] == LOAD_COMPLETED or record_errors):
+                # loaded, apart from malformed records and dangling edges that loading again won't fix
+                shard_result["status"] = SHARD_LOADED
+                shard_result["pending_file"] = None
+                break
+
+            if retry_record_numbers:
+                if len(error_logs) >= MAX_ERROR_RECORDS:
+                    print(f"{source_file.name}: more than {MAX_ERROR_RECORDS} errors, only the listed records "
+                          f"are retried")
+                retry_file = shard_path.with_name(
+                    f"{shard_path.stem}_retry{len(shard_result['loads'])}{shard_path.suffix}")
+                await asyncio.to_thread(write_retry_file, source_file, retry_record_numbers, retry_file)
+                print(f"{source_file.name}: {len(retry_record_numbers)} failed records written to {retry_file.name}")
+                source_file = retry_file
+            else:
+                # the load failed as a whole (e.g. an S3 read error), the same file is loaded again
+                if kind == "edges" and overall_status.get("totalRecords", 0):
+                    print(f"{source_file.name}: the failed load had processed records, loading it again can "
+                          f"duplicate edges")
+                print(f"{source_file.name}: load {load_id} ended with {overall_status['status']}")
+            shard_result["status"] = SHARD_FAILED
+            shard_result["pending_file"] = str(source_file)
+
+        self.state[str(shard_path)] = shard_result
+        self.save_state()
+        if shard_result["status"] == SHARD_FAILED:
+            print(f"{shard_path.name}: not loaded after {self.max_attempts} attempts, {shard_result['pending_file']} "
+                  f"is loaded on the next run")
+        return shard_result
+
+    async def load_shards(self, shard_paths: list, kind: str) -> list:
+        load_slots = asyncio.Semaphore(self.max_queued_loads)
+        print(f"Loading {len(shard_paths)} {kind} shard(s)")
+        return await asyncio.gather(*[self.load_shard(shard_path, kind, load_slots) for shard_path in shard_paths])
+
+    async def run(self, node_shards: list, edge_shards: list) -> dict:
+        """Load every node shard, then every edge shard. Returns the failed shard paths by kind."""
+        start_time = time.time()
+        failed_shards = {"nodes": [], "edges": []}
+        node_results = await self.load_shards(node_shards, "nodes")
+        failed_shards["nodes"] = [str(path) for path, result in zip(node_shards, node_results)
+                                  if result["status"] != SHARD_LOADED]
+        if failed_shards["nodes"]:
+            print(f"{len(failed_shards['nodes'])} node shard(s) failed, not loading the edges")
+            return failed_shards
+        edge_results = await self.load_shards(edge_shards, "edges")
+        failed_shards["edges"] = [str(path) for path, result in zip(edge_shards, edge_results)
+                                  if result["status"] != SHARD_LOADED]
+        print(f"Bulk load finished in {time.time() - start_time:.1f}s")
+        return failed_shards
+
+
+def bulk_load(endpoint: str, node_shards: list, edge_shards: list, object_store, iam_role_arn: str,
+              region: str = DEFAULT_REGION, sign: bool = True, state_file=None, version_store=None,
+              **loader_options) -> dict:
+    """
+    Load the shards with a BulkLoader and, when every shard loaded, write the graph version that invalidates
+    cached query results to version_store (GraphVersionStore or LocalGraphVersionStore, None to skip it).
+    Returns the failed shard paths by kind.
+    """
+    async def run_bulk_load():
+        async with AsyncNeptuneClient(endpoint, region=region, sign=sign) as client:
+            bulk_loader = BulkLoader(client, object_store, iam_role_arn, region=region, state_file=state_file,
+                                     **loader_options)
+            return await bulk_loader.run(node_shards, edge_shards)
+
+    failed_shards = asyncio.run(run_bulk_load())
+    if version_store and not failed_shards["nodes"] and not failed_shards["edges"]:
+        try:
+            print(f"Graph version set to {set_graph_version(version_store)}")
+        except GraphVersionError as e:
+            print(f"Could not write the graph version, cached query results expire after their TTL: {e}")
+    return failed_shards
+
+
+class LoaderStandIn:
+    """
+    A local stand-in for the Neptune bulk loader, loading from a LocalObjectStore.
+    A load finishes after polls_per_load status requests. Node ids are kept, and edge records whose nodes
+    weren't loaded yet fail with FROM_OR_TO_VERTEX_ARE_MISSING, like in Neptune.
+    fail_loads maps a file name to the number of its loads that fail as a whole before one succeeds.
+    """
+    def __init__(self, object_store: LocalObjectStore, polls_per_load: int = 2, fail_loads: dict = None):
+        self.object_store = object_store
+        self.polls_per_load = polls_per_load
+        self.fail_loads = dict(fail_loads or {})
+        self.lock = threading.Lock()
+        self.loads = {}
+        self.node_ids = set()
+        self.edge_count = 0
+
+    def submit(self, load_request: dict) -> dict:
+        with self.lock:
+            load_id = str(uuid.uuid4())
+            self.loads[load_id] = {"source": load_request["source"], "polls": 0, "status": LOAD_IN_QUEUE,
+                                   "records": 0, "error_logs": []}
+            return {"status": "200 OK", "payload": {"loadId": load_id}}
+
+    def run_load(self, load: dict):
+        source_file = self.object_store.get_local_path(load["source"])
+        if self.fail_loads.get(source_file.name):
+            self.fail_loads[source_file.name] -= 1
+            load["status"] = LOAD_FAILED
+            return
+        with open(source_file, newline="", encoding="utf-8") as source:
+            reader = csv.reader(source)
+            header = next(reader)
+            is_edges = ":START_ID" in header
+            for record_number, row in enumerate(reader, start=1):
+                load["records"] += 1
+                if len(row) != len(header):
+                    error = ("PARSING_ERROR", f"Expected {len(header)} columns, found {len(row)}")
+                elif not is_edges:
+                    self.node_ids.add(row[header.index(":ID")])
+                    continue
+                elif row[header.index(":START_ID")] in self.node_ids and row[header.index(":END_ID")] in self.node_ids:
+                    self.edge_count += 1
+                    continue
+                else:
+                    error = ("FROM_OR_TO_VERTEX_ARE_MISSING", "Edge references a node that isn't loaded")
+                load["error_logs"].append({"errorCode": error[0], "errorMessage": error[1],
+                                           "fileName": load["source"], "recordNum": record_number})
+        load["status"] = LOAD_FAILED if load["error_logs"] else LOAD_COMPLETED
+
+    def get_status(self, load_id: str, query: dict) -> dict:
+        with self.lock:
+            load = self.loads[load_id]
+            load["polls"] += 1
+            if load["status"] in UNFINISHED_LOAD_STATUSES:
+                if load["polls"] >= self.polls_per_load:
+                    self.run_load(load)
+                else:
+                    load["status"] = LOAD_IN_PROGRESS
+            error_logs = load["error_logs"]
+            payload = {"overallStatus": {"fullUri": load["source"], "status": load["status"],
+                                         "totalRecords": load["records"],
+                                         "parsingErrors": sum(error["errorCode"] == "PARSING_ERROR"
+                                                              for error in error_logs),
+                                         "datatypeMismatchErrors": 0,
+                                         "insertErrors": sum(error["errorCode"] != "PARSING_ERROR"
+                                                             for error in error_logs)}}
+            if query.get("errors") == ["true"]:
+                page = int(query.get("page", ["1"])[0])
+                errors_per_page = int(query.get("errorsPerPage", ["10"])[0])
+                start_index = (page - 1) * errors_per_page
+                payload["errors"] = {"loadId": load_id, "startIndex": start_index + 1,
+                                     "errorLogs": error_logs[start_index:start_index + errors_per_page]}
+            return {"status": "200 OK", "payload": payload}
+
+
+def serve_loader_stand_in(loader: LoaderStandIn, host: str = "127.0.0.1", port: int = 8182):
+    """
+    Serve a LoaderStandIn on /loader next to an openCypher stand-in that returns no rows,
+    use it with BulkLoader(AsyncNeptuneClient(f"http://{host}:{port}", sign=False), loader.object_store, ...).
+    """
+    class LoaderStandInHandler(get_opencypher_stand_in_handler(lambda query, parameters: [])):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if not url.path.startswith("/loader/"):
+                super().do_GET()
+                return
+            load_id = url.path.removeprefix("/loader/")
+            if load_id not in loader.loads:
+                self.send_json({"code": "LoadNotFoundException", "detailedMessage": f"No load {load_id}"},
+                               status=404)
+                return
+            self.send_json(loader.get_status(load_id, parse_qs(url.query)))
+
+        def do_POST(self):
+            if not self.path.startswith("/loader"):
+                super().do_POST()
+                return
+            load_request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.send_json(loader.submit(load_request))
+
+    return ThreadingHTTPServer((host, port), LoaderStandInHandler)
+
+
+@click.command()
+@click.option('--graph-id', '-g', default="goldenKG", help='Graph to load, from data_output/kgs/<graph-id>.')
+@click.option('--index-file', default=None,
+              help='Shard index written by neptune_csv.py, defaults to '
+                   'data_output/kgs/<graph-id>/neptune/<graph-id>_neptune_files.json.')
+@click.option('--endpoint', default=None, help='Neptune endpoint url, e.g. https://<cluster>:8182')
+@click.option('--region', default=DEFAULT_REGION, show_default=True)
+@click.option('--bucket', default=None, help='S3 bucket the shards are uploaded to.')
+@click.option('--prefix', default=None, help='S3 key prefix, defaults to the graph id.')
+@click.option('--iam-role-arn', default=None, help='IAM role the loader reads the bucket with.')
+@click.option('--max-queued-loads', default=DEFAULT_MAX_QUEUED_LOADS, show_default=True,
+              help='Shards uploaded or loading at the same time.')
+@click.option('--max-attempts', default=DEFAULT_MAX_ATTEMPTS, show_default=True, help='Load attempts per shard.')
+@click.option('--parallelism', default=DEFAULT_PARALLELISM, show_default=True,
+              type=click.Choice(["LOW", "MEDIUM", "HIGH", "OVERSUBSCRIBE"]))
+@click.option('--no-sign', is_flag=True, help='Send unsigned requests, for clusters without IAM authentication.')
+@click.option('--fresh', is_flag=True, help='Ignore the state of a previous run and load every shard again.')
+@click.option('--local-stand-in', is_flag=True,
+              help='Load into a local stand-in for the bulk loader and S3 instead of Neptune, to try out a load.')
+def bulk_load_graph(graph_id: str, index_file: str, endpoint: str, region: str, bucket: str, prefix: str,
+                    iam_role_arn: str, max_queued_loads: int, max_attempts: int, parallelism: str, no_sign: bool,
+                    fresh: bool, local_stand_in: bool):
+    index_file = Path(index_file) if index_file else get_neptune_files_index_path(graph_id)
+    neptune_files = load_neptune_files_index(index_file)
+    loader_options = {"max_queued_loads": max_queued_loads, "max_attempts": max_attempts,
+                      "parallelism": parallelism}
+
+    if local_stand_in:
+        with tempfile.TemporaryDirectory() as stand_in_dir:
+            loader = LoaderStandIn(LocalObjectStore(Path(stand_in_dir) / "s3"))
+            server = serve_loader_stand_in(loader, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                failed_shards = bulk_load(f"http://127.0.0.1:{server.server_port}", neptune_files["nodes"],
+                                          neptune_files["edges"], loader.object_store, "local-stand-in",
+                                          region=region, sign=False, state_file=Path(stand_in_dir) / "state.json",
+                                          version_store=LocalGraphVersionStore(Path(stand_in_dir) / "graph_version"),
+                                          poll_interval=0.1, max_poll_interval=1, **loader_options)
+            finally:
+                server.shutdown()
+            print(f"Stand-in loaded {len(loader.node_ids)} nodes and {loader.edge_count} edges")
+    else:
+        if not (endpoint and bucket and iam_role_arn):
+            raise click.UsageError("--endpoint, --bucket and --iam-role-arn are required, or use --local-stand-in")
+        state_file = index_file.with_name(f"{graph_id}{BULK_LOAD_STATE_SUFFIX}")
+        if fresh and state_file.exists():
+            state_file.unlink()
+        failed_shards = bulk_load(endpoint, neptune_files["nodes"], neptune_files["edges"],
+                                  S3ObjectStore(bucket, prefix if prefix is not None else graph_id, region),
+                                  iam_role_arn, region=region, sign=not no_sign, state_file=state_file,
+                                  version_store=GraphVersionStore(endpoint, region=region), **loader_options)
+
+    failed_count = len(failed_shards["nodes"]) + len(failed_shards["edges"])
+    if failed_count:
+        raise click.ClickException(f"{failed_count} shard(s) failed to load, run again to retry them")
+
+if __name__ == "__main__":
+    bulk_load_graph()
@@ -0,0 +1,67 @@
+import os
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# use the fastest available json parser, these all accept bytes
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+        json_loads = msgspec.json.decode
+    except ImportError:
+        import json
+        json_loads = json.loads
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def find_line_chunks(file_path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    Split a file into (start, end) byte ranges of roughly chunk_size bytes that always end on a line boundary.
+    """
+    chunks = []
+    with open(file_path, "rb") as input_file:
+        file_size = os.fstat(input_file.fileno()).st_size
+        start = 0
+        while start < file_size:
+            input_file.seek(min(start + chunk_size, file_size))
+            input_file.readline()
+            end = min(input_file.tell(), file_size)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+def read_chunk_lines(file_path, start: int, end: int) -> list:
+    with open(file_path, "rb") as input_file:
+        input_file.seek(start)
+        return input_file.read(end - start).splitlines()
+
+def map_line_chunks(chunk_function, file_path, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Call chunk_function(file_path, start, end) for every line chunk of a file using a process pool,
+    yielding the results in file order so output built from them is deterministic.
+    Only a bounded number of chunks are in flight at once to keep memory independent of the file size.
+    """
+    chunks = find_line_chunks(file_path, chunk_size)
+    workers = workers or os.cpu_count()
+    if workers <= 1 or len(chunks) <= 1:
+        for start, end in chunks:
+            yield chunk_function(file_path, start, end)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining_chunks = iter(chunks)
+        pending = deque()
+        for start, end in remaining_chunks:
+            pending.append(executor.submit(chunk_function, file_path, start, end))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            result = pending.popleft().result()
+            next_chunk = next(remaining_chunks, None)
+            if next_chunk:
+                pending.append(executor.submit(chunk_function, file_path, *next_chunk))
+            yield result
@@ -0,0 +1,146 @@
+from datetime import datetime
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+from midas.util import get_data_directory_path
+
+# CIViC monthly dumps are named like 01-Oct-2025-ClinicalEvidenceSummaries.tsv
+CIVIC_SUMMARY_FILES = {
+    "clinical_path": "ClinicalEvidenceSummaries.tsv",
+    "molecular_profile_path": "MolecularProfileSummaries.tsv",
+    "variant_path": "VariantSummaries.tsv",
+    "feature_path": "FeatureSummaries.tsv"
+}
+CIVIC_DUMP_DATE_FORMAT = "%d-%b-%Y"
+CIVIC_EXTRACTED_FILE_NAME = "variant_gene_disease_therapy_with_normIDs_revised.tsv"
+ALLELE_REGISTRY_COLUMNS = ["allele_registry_id", "allele_registry_ids", "allele_registry"]
+OUTPUT_COLUMNS = ["gene_symbol", "variant", "allele_registry_id", "disease", "doid", "therapy", "ncbi_gene_id"]
+
+# only these columns are read, with the join keys as nullable integers and repetitive text as categories
+CLINICAL_DTYPES = {"molecular_profile_id": "Int64", "disease": "category", "doid": "category", "therapies": "category"}
+MOLECULAR_PROFILE_DTYPES = {"molecular_profile_id": "Int64", "variant_ids": "string"}
+VARIANT_DTYPES = {"variant_id": "Int64", "variant": "string", "feature_id": "Int64", "entrez_id": "string",
+                  **{allele_column: "string" for allele_column in ALLELE_REGISTRY_COLUMNS}}
+FEATURE_DTYPES = {"feature_id": "Int64", "name": "category"}
+
+
+def get_civic_data_directory_path() -> Path:
+    return get_data_directory_path() / "CIViC"
+
+def get_civic_extracted_file_path() -> Path:
+    return get_civic_data_directory_path() / CIVIC_EXTRACTED_FILE_NAME
+
+def find_civic_summary_files(civic_dir: Path = None) -> dict | None:
+    """Return the paths of the four summary files of the most recent complete CIViC dump in civic_dir, if any."""
+    civic_dir = Path(civic_dir) if civic_dir else get_civic_data_directory_path()
+    clinical_suffix = f"-{CIVIC_SUMMARY_FILES['clinical_path']}"
+    dump_dates = {}
+    for clinical_file in civic_dir.glob(f"*{clinical_suffix}"):
+        dump_date = clinical_file.name[:-len(clinical_suffix)]
+        try:
+            dump_dates[datetime.strptime(dump_date, CIVIC_DUMP_DATE_FORMAT)] = dump_date
+        except ValueError:
+            continue
+    for parsed_date in sorted(dump_dates, reverse=True):
+        summary_paths = {path_name: civic_dir / f"{dump_dates[parsed_date]}-{file_suffix}"
+                         for path_name, file_suffix in CIVIC_SUMMARY_FILES.items()}
+        if all(path.exists() for path in summary_paths.values()):
+            return summary_paths
+    return None
+
+
+def normalize_numeric_ids(values: pd.Series, prefix: str) -> pd.Series:
+    """
+    Keep values that already start with prefix (case-insensitive), turn numeric values into prefix + integer,
+    anything else becomes NA. Categorical values are normalized once per category instead of once per row.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        normalized_categories = normalize_numeric_ids(pd.Series(values.cat.categories), prefix).array
+        return pd.Series(normalized_categories.take(values.cat.codes.to_numpy(), allow_fill=True),
+                         index=values.index, dtype="string")
+    values = values.astype("string").str.strip()
+    already_prefixed = values.str.upper().str.startswith(prefix.upper()).fillna(False)
+    numbers = np.trunc(pd.to_numeric(values.mask(already_prefixed), errors="coerce"))
+    prefixed_numbers = prefix + numbers.astype("Int64").astype("string")
+    return values.where(already_prefixed, prefixed_numbers)
+
+def normalize_allele_registry_ids(values: pd.Series) -> pd.Series:
+    return "CAID:" + values.astype("string").str.strip()
+
+def explode_variant_ids(molecular_profiles: pd.DataFrame) -> pd.DataFrame:
+    """Map molecular profiles to their variants, variant_ids look like "12", "12, 13" or "[12, 13]"."""
+    variant_ids = (molecular_profiles["variant_ids"]
+                   .str.replace(r"[\[\]()'\"\s]", "", regex=True)
+                   .str.split(","))
+    profile_variants = (molecular_profiles[["molecular_profile_id"]]
+                        .assign(variant_id=variant_ids)
+                        .explode("variant_id"))
+    profile_variants["variant_id"] = pd.to_numeric(profile_variants["variant_id"], errors="coerce").astype("Int64")
+    return profile_variants.dropna(subset=["variant_id"]).drop_duplicates()
+
+
+def read_summary_file(file_path, dtypes: dict) -> pd.DataFrame:
+    return pd.read_csv(file_path, sep="\t", usecols=lambda column: column in dtypes, dtype=dtypes)
+
+def extract_civic_data(clinical_path, molecular_profile_path, variant_path, feature_path,
+                       output_path=None) -> pd.DataFrame:
+    """
+    Join the CIViC clinical evidence, molecular profile, variant and feature summaries into one row per
+    clinical evidence item and variant, with DOID, CAID and NCBIGene identifiers normalized.
+    Therapies are kept as they are, they are resolved to NCIT identifiers in a later step.
+    """
+    clinical = read_summary_file(clinical_path, CLINICAL_DTYPES)
+    molecular_profiles = read_summary_file(molecular_profile_path, MOLECULAR_PROFILE_DTYPES)
+    variants = read_summary_file(variant_path, VARIANT_DTYPES)
+    features = read_summary_file(feature_path, FEATURE_DTYPES).rename(columns={"name": "gene_symbol"})
+
+    allele_column = next((column for column in ALLELE_REGISTRY_COLUMNS if column in variants.columns), None)
+    if allele_column:
+        variants["allele_registry_id"] = normalize_allele_registry_ids(variants[allele_column])
+    else:
+        variants["allele_registry_id"] = pd.Series(pd.NA, index=variants.index, dtype="string")
+    variants["ncbi_gene_id"] = normalize_numeric_ids(variants["entrez_id"], "NCBIGene:")
+    clinical["doid"] = normalize_numeric_ids(clinical["doid"], "DOID:")
+
+    variants_with_genes = variants[["variant_id", "variant", "feature_id", "allele_registry_id", "ncbi_gene_id"]] \
+        .merge(features, on="feature_id", how="left")
+    extracted = (clinical
+                 .merge(explode_variant_ids(molecular_profiles), on="molecular_profile_id", how="left")
+                 .merge(variants_with_genes, on="variant_id", how="left")
+                 .rename(columns={"therapies": "therapy"})
+                 [OUTPUT_COLUMNS]
+                 .reset_index(drop=True))
+    if output_path:
+        extracted.to_csv(output_path, sep="\t", index=False)
+        print(f"Extracted {len(extracted)} CIViC rows to {output_path}")
+    return extracted
+
+def extract_latest_civic_dump(civic_dir: Path = None, output_path: Path = None) -> pd.DataFrame:
+    summary_paths = find_civic_summary_files(civic_dir)
+    if not summary_paths:
+        raise FileNotFoundError(f"No complete CIViC summary dump found in {civic_dir or get_civic_data_directory_path()}")
+    return extract_civic_data(**summary_paths, output_path=output_path or get_civic_extracted_file_path())
+
+
+@click.command()
+@click.option('--clinical', 'clinical_path', type=click.Path(exists=True), help='ClinicalEvidenceSummaries.tsv')
+@click.option('--molecular-profiles', 'molecular_profile_path', type=click.Path(exists=True), help='MolecularProfileSummaries.tsv')
+@click.option('--variants', 'variant_path', type=click.Path(exists=True), help='VariantSummaries.tsv')
+@click.option('--features', 'feature_path', type=click.Path(exists=True), help='FeatureSummaries.tsv')
+@click.option('--output', 'output_path', type=click.Path(), default=None,
+              help=f'Output TSV, defaults to data/CIViC/{CIVIC_EXTRACTED_FILE_NAME}')
+def extract_civic(clinical_path, molecular_profile_path, variant_path, feature_path, output_path):
+    """Extract CIViC variant, gene, disease and therapy rows. Without explicit inputs the latest dump in data/CIViC is used."""
+    summary_paths = [clinical_path, molecular_profile_path, variant_path, feature_path]
+    if not any(summary_paths):
+        extract_latest_civic_dump(output_path=output_path)
+    elif all(summary_paths):
+        extract_civic_data(*summary_paths, output_path=output_path or get_civic_extracted_file_path())
+    else:
+        raise click.UsageError("Provide all four CIViC summary files, or none to use the latest dump in data/CIViC.")
+
+if __name__ == "__main__":
+    extract_civic()
@@ -0,0 +1,161 @@
+import json
+
+from pathlib import Path
+
+from midas.chunking import json_loads
+
+# pyarrow is optional, it's only needed when graphs are written to or read from parquet
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# columns that get their own typed parquet column, any other property goes into the json "properties" column
+NODE_COLUMNS = {
+    "id": "string",
+    "name": "string",
+    "category": "string[]",
+    "equivalent_identifiers": "string[]",
+    "description": "string",
+    "information_content": "float"
+}
+EDGE_COLUMNS = {
+    "subject": "string",
+    "predicate": "string",
+    "object": "string",
+    "primary_knowledge_source": "string",
+    "aggregator_knowledge_sources": "string[]",
+    "publications": "string[]",
+    "knowledge_level": "string",
+    "agent_type": "string"
+}
+PROPERTIES_COLUMN = "properties"
+DEFAULT_BATCH_SIZE = 100_000
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for parquet KGX files, install it with: uv pip install pyarrow")
+
+def get_kgx_columns(kind: str) -> dict:
+    if kind == "nodes":
+        return NODE_COLUMNS
+    elif kind == "edges":
+        return EDGE_COLUMNS
+    raise ValueError(f"Unknown KGX file kind: {kind}, expected nodes or edges")
+
+def get_kgx_schema(kind: str):
+    require_pyarrow()
+    arrow_types = {"string": pa.string(), "string[]": pa.list_(pa.string()), "float": pa.float64()}
+    fields = [pa.field(column, arrow_types[column_type]) for column, column_type in get_kgx_columns(kind).items()]
+    fields.append(pa.field(PROPERTIES_COLUMN, pa.string()))
+    return pa.schema(fields)
+
+
+class KGXParquetWriter:
+    """
+    Writes KGX node or edge dictionaries to a parquet file, buffering batch_size records per row group.
+    """
+    def __init__(self, output_file_path, kind: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.schema = get_kgx_schema(kind)
+        self.columns = get_kgx_columns(kind)
+        self.batch_size = batch_size
+        self.parquet_writer = pq.ParquetWriter(str(output_file_path), self.schema, compression="zstd")
+        self.buffer = {column: [] for column in self.schema.names}
+        self.buffered_records = 0
+        self.records_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record: dict):
+        for column, column_type in self.columns.items():
+            value = record.get(column)
+            if column_type == "float" and value is not None:
+                value = float(value)
+            elif column_type == "string[]" and value is not None and not isinstance(value, list):
+                value = [value]
+            self.buffer[column].append(value)
+        extra_properties = {key: value for key, value in record.items() if key not in self.columns}
+        self.buffer[PROPERTIES_COLUMN].append(json.dumps(extra_properties) if extra_properties else None)
+        self.buffered_records += 1
+        if self.buffered_records >= self.batch_size:
+            self.flush()
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if not self.buffered_records:
+            return
+        self.parquet_writer.write_table(pa.table(self.buffer, schema=self.schema))
+        self.records_written += self.buffered_records
+        self.buffer = {column: [] for column in self.schema.names}
+        self.buffered_records = 0
+
+    def close(self):
+        if self.parquet_writer:
+            self.flush()
+            self.parquet_writer.close()
+            self.parquet_writer = None
+
+
+def iterate_parquet_records(file_path, columns: list = None):
+    require_pyarrow()
+    parquet_file = pq.ParquetFile(str(file_path))
+    for record_batch in parquet_file.iter_batches(columns=columns):
+        for row in record_batch.to_pylist():
+            extra_properties = row.pop(PROPERTIES_COLUMN, None)
+            record = {key: value for key, value in row.items() if value is not None}
+            if extra_properties:
+                record.update(json.loads(extra_properties))
+            yield record
+
+def iterate_jsonl_records(file_path):
+    with open(file_path, "rb") as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                yield json_loads(line)
+
+def iterate_kgx_file(file_path, columns: list = None):
+    """
+    Iterate the nodes or edges in a KGX file as dictionaries, from jsonl or parquet depending on the extension.
+    For parquet, columns can restrict which columns are read (the json properties column must be requested explicitly).
+    """
+    if Path(file_path).suffix == ".parquet":
+        yield from iterate_parquet_records(file_path, columns=columns)
+    else:
+        yield from iterate_jsonl_records(file_path)
+
+def convert_jsonl_to_parquet(jsonl_file_path, parquet_file_path, kind: str, batch_size: int = DEFAULT_BATCH_SIZE):
+    with KGXParquetWriter(parquet_file_path, kind, batch_size=batch_size) as parquet_writer:
+        parquet_writer.write_all(iterate_jsonl_records(jsonl_file_path))
+    return parquet_writer.records_written
+
+def convert_graph_to_parquet(nodes_input_file, edges_input_file, nodes_output_file, edges_output_file):
+    print(f"Writing parquet files {nodes_output_file} and {edges_output_file}")
+    convert_jsonl_to_parquet(nodes_input_file, nodes_output_file, "nodes")
+    convert_jsonl_to_parquet(edges_input_file, edges_output_file, "edges")
+
+def convert_parquet_to_jsonl(parquet_file_path, jsonl_file_path):
+    records_written = 0
+    with open(jsonl_file_path, "w") as jsonl_file:
+        for record in iterate_parquet_records(parquet_file_path):
+            jsonl_file.write(json.dumps(record) + "\n")
+            records_written += 1
+    return records_written
+
+def get_kgx_file_path(kgx_directory, file_prefix: str, kind: str):
+    """Return the parquet version of a KGX file if it's at least as new as the jsonl one, otherwise the jsonl one."""
+    parquet_file_path = Path(kgx_directory) / f"{file_prefix}_{kind}.parquet"
+    jsonl_file_path = Path(kgx_directory) / f"{file_prefix}_{kind}.jsonl"
+    if parquet_file_path.exists() and \
+            (not jsonl_file_path.exists() or parquet_file_path.stat().st_mtime >= jsonl_file_path.stat().st_mtime):
+        return parquet_file_path
+    return jsonl_file_path
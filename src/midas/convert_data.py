@@ -1,16 +1,45 @@
 import csv
 import json
+import time
 
 from pathlib import Path
 
 from orion.biolink_constants import GENE, DISEASE, SEQUENCE_VARIANT
 
-from midas.util import get_data_directory_path, get_kgx_output_file_writer, format_hgvsg, get_consequence_predicate
+from midas.chunking import DEFAULT_CHUNK_SIZE, json_loads, map_line_chunks, read_chunk_lines
+from midas.civic_extraction import get_civic_extracted_file_path
+from midas.therapy_resolver import TherapyResolver, get_civic_therapies_path
+from midas.util import get_data_directory_path, get_kg_output_directory_path, get_kgx_output_file_writer, \
+    format_hgvsg, get_consequence_predicate
 
 
-def convert_civic_data():
+source_data_files = {
+    "1kg": Path("1kg") / "1kg_test.json",
+    "civic": Path("CIViC") / "variant_gene_disease_therapy_with_normIDs.tsv",
+    "cbioportal": Path("cbioportal") / "all-chr-gene-doid-info.json"
+}
+
+def get_source_data_path(source: str) -> Path:
+    return get_data_directory_path() / source_data_files[source]
+
+def get_civic_data_path() -> Path:
+    # a fresh extraction from a CIViC dump is used once its therapies can be resolved
+    civic_extracted_path = get_civic_extracted_file_path()
+    if civic_extracted_path.exists() and get_civic_therapies_path().exists():
+        return civic_extracted_path
+    return get_source_data_path("civic")
+
+def get_source_input_paths(source: str) -> list:
+    if source == "civic":
+        return [get_civic_data_path(), get_civic_therapies_path()]
+    return [get_source_data_path(source)]
+
+def convert_civic_data(fuzzy_therapies: bool = False):
     print("Converting civic data to KGX files...")
-    civic_data_path = get_data_directory_path() / "CIViC" / "variant_gene_disease_therapy_with_normIDs.tsv"
+    civic_data_path = get_civic_data_path()
+    # without the CIViC therapies export, fall back to the NCIT ids that were mapped in preprocessing
+    civic_therapy_resolver = TherapyResolver.from_csv(fuzzy=fuzzy_therapies) if get_civic_therapies_path().exists() \
+        else None
     with (open(civic_data_path, "r") as civic_data_file,
           get_kgx_output_file_writer("civic") as kgx_file_writer):
         civic_reader = csv.DictReader(civic_data_file, delimiter="\t")
@@ -24,7 +53,10 @@ def convert_civic_data():
             disease_name = row["disease"]
             gene_id = row["ncbi_gene_id"]
             gene_symbol = row["gene_symbol"]
-            therapy_ids = row["ncit_ids"].split(",")
+            if civic_therapy_resolver and row["therapy"]:
+                therapy_ids = civic_therapy_resolver.resolve_ncit_ids(row["therapy"])
+            else:
+                therapy_ids = (row.get("ncit_ids") or "").split(",")
             if variant_id and "unrecognized" not in variant_name:
                 kgx_file_writer.write_node(node_id=variant_id,
                                            node_name=variant_name,
@@ -57,7 +89,7 @@ def convert_civic_data():
 
 def convert_cbioportal_data():
     print("Converting cbioportal data to KGX files...")
-    cbioportal_data_path = get_data_directory_path() / "cbioportal" / "all-chr-gene-doid-info.json"
+    cbioportal_data_path = get_source_data_path("cbioportal")
     with (open(cbioportal_data_path, "r") as cbioportal_data_file,
           get_kgx_output_file_writer("cbioportal") as kgx_file_writer):
         cbioportal_data = json.load(cbioportal_data_file)
@@ -81,40 +113,67 @@ def convert_cbioportal_data():
                                        object_id=disease_id,
                                        primary_knowledge_source="infores:cbioportal")
 
-def convert_1kg_data() -> None:
+ONEKG_POPULATIONS = ["AFR", "AMR", "EAS", "EUR", "SAS"]
+# a full VEP dump has far more unique variants than fit in memory, spill them to disk past this many
+ONEKG_MAX_BUFFERED_NODES = 1_000_000
+
+def parse_1kg_variant(variant_obj: dict) -> list:
+    """Return the KGX (record type, kwargs) writes for one VEP variant, in the order they should be written."""
+    if 'transcript_consequences' not in variant_obj:
+        return []
+    variant_id = next((format_hgvsg(tc["hgvsg"], tc["spdi"]) for tc in variant_obj['transcript_consequences'] if "hgvsg" in tc and 'spdi' in tc), None)
+    gene_id = next((f"NCBIGene:{tc["gene_id"]}" for tc in variant_obj['transcript_consequences']), None)
+    if not variant_id:
+        return []
+
+    frequency_list = variant_obj["input"].split()[-1].split(";")
+    most_severe_consequence = f"{variant_obj["most_severe_consequence"]}"
+    population_frequencies = {}
+    for frequency in frequency_list:
+        population, _, value = frequency.partition("=")
+        if population in ONEKG_POPULATIONS:
+            population_frequencies[population] = value
+    frequencies = [{population: population_frequencies[population]}
+                   for population in ONEKG_POPULATIONS if population in population_frequencies]
+    return [
+        ("node", {"node_id": variant_id, "node_types": [SEQUENCE_VARIANT], "node_properties": {"frequencies": frequencies}}),
+        ("node", {"node_id": gene_id, "node_types": [GENE]}),
+        ("edge", {"subject_id": variant_id,
+                  "predicate": get_consequence_predicate(most_severe_consequence),
+                  "object_id": gene_id,
+                  "edge_properties": {"most_severe_consequence": most_severe_consequence},
+                  "primary_knowledge_source": "infores:1000genomes"})
+    ]
+
+def convert_1kg_chunk(onekg_data_path, start: int, end: int) -> tuple:
+    start_time = time.perf_counter()
+    kgx_records = []
+    record_count = 0
+    for line in read_chunk_lines(onekg_data_path, start, end):
+        if not line.strip():
+            continue
+        record_count += 1
+        kgx_records.extend(parse_1kg_variant(json_loads(line)))
+    return kgx_records, record_count, time.perf_counter() - start_time
+
+def convert_1kg_data(workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
     print("Converting 1kg data to KGX files...")
-    onekg_data_path = get_data_directory_path() / "1kg" / "1kg_test.json"
-    with (open(onekg_data_path, "r") as onekg_data_file,
-          get_kgx_output_file_writer("1kg") as kgx_file_writer):
-        for line in onekg_data_file:
-            variant_obj = json.loads(line)
-            if 'transcript_consequences' not in variant_obj:
-                continue
-            variant_id = next((format_hgvsg(tc["hgvsg"], tc["spdi"]) for tc in variant_obj['transcript_consequences'] if "hgvsg" in tc and 'spdi' in tc), None)
-            gene_id = next((f"NCBIGene:{tc["gene_id"]}" for tc in variant_obj['transcript_consequences']), None)
-
-            if variant_id:
-                frequency_list = variant_obj["input"].split()[-1].split(";")
-                most_severe_consequence = f"{variant_obj["most_severe_consequence"]}"
-                for frequency in frequency_list:
-                    if frequency.startswith("AFR="):
-                        AFR_frequency = {"AFR": frequency.split("=")[1]}
-                    elif frequency.startswith("AMR="):
-                        AMR_frequency = {"AMR": frequency.split("=")[1]}
-                    elif frequency.startswith("EAS="):
-                        EAS_frequency = {"EAS": frequency.split("=")[1]}
-                    elif frequency.startswith("EUR="):
-                        EUR_frequency = {"EUR": frequency.split("=")[1]}
-                    elif frequency.startswith("SAS="):
-                        SAS_frequency = {"SAS": frequency.split("=")[1]}
-                frequencies = [AFR_frequency, AMR_frequency, EAS_frequency, EUR_frequency, SAS_frequency]
-                kgx_file_writer.write_node(node_id=variant_id, node_types=[SEQUENCE_VARIANT], node_properties={"frequencies": frequencies})
-                kgx_file_writer.write_node(node_id=gene_id, node_types=[GENE])
-                kgx_file_writer.write_edge(subject_id=variant_id,
-                                           predicate=get_consequence_predicate(most_severe_consequence),
-                                           object_id=gene_id,
-                                           edge_properties={"most_severe_consequence": most_severe_consequence},
-                                           primary_knowledge_source="infores:1000genomes")
+    onekg_data_path = get_source_data_path("1kg")
+    # VEP dumps are split into line-aligned chunks that are parsed in parallel,
+    # the results come back in file order so the output files are deterministic
+    with get_kgx_output_file_writer("1kg", max_buffered_nodes=ONEKG_MAX_BUFFERED_NODES) as kgx_file_writer:
+        total_records = 0
+        for chunk_number, (kgx_records, record_count, seconds) in \
+                enumerate(map_line_chunks(convert_1kg_chunk, onekg_data_path, workers=workers, chunk_size=chunk_size), start=1):
+            for record_type, record in kgx_records:
+                if record_type == "node":
+                    kgx_file_writer.write_node(**record)
+                else:
+                    kgx_file_writer.write_edge(**record)
+            total_records += record_count
+            print(f"1kg chunk {chunk_number}: {record_count} records in {seconds:.2f}s "
+                  f"({record_count / seconds if seconds else 0:.0f} records/s)")
+        print(f"Converted {total_records} 1kg records.")
 
 
 conversion_functions = {
@@ -123,10 +182,15 @@ conversion_functions = {
     "cbioportal": convert_cbioportal_data
 }
 
-def convert_to_kgx(sources:list):
-    output_dir = Path(__file__).parent.parent.parent / "data_output" / "kgs"
-    output_dir.mkdir(parents=True, exist_ok=True)
+def convert_source(source: str, fuzzy_therapies: bool = False):
+    if source == "civic":
+        convert_civic_data(fuzzy_therapies=fuzzy_therapies)
+        return
+    convert_function = conversion_functions.get(source, None)
+    if convert_function:
+        convert_function()
+
+def convert_to_kgx(sources:list, fuzzy_therapies: bool = False):
+    get_kg_output_directory_path()
     for source in sources:
-        convert_function = conversion_functions.get(source, None)
-        if convert_function:
-            convert_function()
\ No newline at end of file
+        convert_source(source, fuzzy_therapies=fuzzy_therapies)
@@ -0,0 +1,109 @@
+import heapq
+import itertools
+import json
+import tempfile
+
+from orion.kgx_file_writer import KGXFileWriter
+
+
+def merge_node(node: dict, other_node: dict) -> dict:
+    """Merge the properties of other_node into node, both with the same id."""
+    if not node.get("name") and other_node.get("name"):
+        node["name"] = other_node["name"]
+    for key, value in other_node.items():
+        if key in ("id", "name"):
+            continue
+        existing_value = node.get(key)
+        if isinstance(existing_value, list) and isinstance(value, list):
+            node[key] = existing_value + [item for item in value if item not in existing_value]
+        elif existing_value is None or existing_value == "" or existing_value == []:
+            node[key] = value
+    return node
+
+
+class DedupKGXFileWriter:
+    """
+    Sits between a converter and a KGXFileWriter, merging the properties of nodes written more than once
+    so each node id is written a single time when the writer is closed. Edges are passed straight through.
+
+    By default every unique node is held in memory and written in the order it was first seen.
+    With max_buffered_nodes set, the buffer is sorted and spilled to disk whenever it fills up and the
+    spill files are merged by id on close, so memory stays bounded and the nodes are written sorted by id.
+    """
+    def __init__(self,
+                 kgx_file_writer: KGXFileWriter,
+                 max_buffered_nodes: int = None,
+                 spill_dir: str = None):
+        self.kgx_file_writer = kgx_file_writer
+        self.max_buffered_nodes = max_buffered_nodes
+        self.spill_dir = spill_dir
+        self.nodes = {}
+        self.spill_files = []
+        self.node_writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_node(self, node_id: str, node_name: str = "", node_types: list = None, node_properties: dict = None):
+        self.node_writes += 1
+        node = {"id": node_id, "name": node_name, "category": list(node_types) if node_types else []}
+        if node_properties:
+            node.update(node_properties)
+        if node_id in self.nodes:
+            merge_node(self.nodes[node_id], node)
+        else:
+            self.nodes[node_id] = node
+            if self.max_buffered_nodes and len(self.nodes) >= self.max_buffered_nodes:
+                self.spill_nodes()
+
+    def write_edge(self, **edge_kwargs):
+        self.kgx_file_writer.write_edge(**edge_kwargs)
+
+    def spill_nodes(self):
+        spill_file = tempfile.TemporaryFile(mode="w+", dir=self.spill_dir)
+        for node_id in sorted(self.nodes):
+            spill_file.write(json.dumps(self.nodes[node_id]) + "\n")
+        spill_file.seek(0)
+        self.spill_files.append(spill_file)
+        self.nodes = {}
+
+    def iterate_merged_nodes(self):
+        if not self.spill_files:
+            yield from self.nodes.values()
+            return
+        if self.nodes:
+            self.spill_nodes()
+        spilled_nodes = heapq.merge(*[map(json.loads, spill_file) for spill_file in self.spill_files],
+                                    key=lambda spilled_node: spilled_node["id"])
+        for _, node_group in itertools.groupby(spilled_nodes, key=lambda spilled_node: spilled_node["id"]):
+            node = next(node_group)
+            for other_node in node_group:
+                merge_node(node, other_node)
+            yield node
+
+    def write_nodes(self):
+        nodes_written = 0
+        for node in self.iterate_merged_nodes():
+            node_id = node.pop("id")
+            node_name = node.pop("name")
+            node_types = node.pop("category")
+            self.kgx_file_writer.write_node(node_id=node_id,
+                                            node_name=node_name,
+                                            node_types=node_types,
+                                            node_properties=node,
+                                            uniquify=False)
+            nodes_written += 1
+        print(f"Wrote {nodes_written} unique nodes from {self.node_writes} node writes.")
+
+    def close(self):
+        try:
+            self.write_nodes()
+        finally:
+            for spill_file in self.spill_files:
+                spill_file.close()
+            self.spill_files = []
+            self.nodes = {}
+            self.kgx_file_writer.close()
@@ -0,0 +1,381 @@
+"""
+Incremental updates of a loaded graph. The previous and the new merged graph are compared record by record,
+after mapping them to the Neptune CSV columns so only changes Neptune can see count. The added, updated and
+deleted nodes and edges are written as loader CSVs and as batched openCypher mutations (UNWIND $rows) that
+apply the delta to a loaded graph without a full bulk reload.
+"""
+
+import heapq
+import itertools
+import json
+import shutil
+import tempfile
+
+from collections import Counter
+from operator import itemgetter
+from pathlib import Path
+
+import click
+
+from midas.columnar import get_kgx_file_path, iterate_kgx_file
+from midas.neptune_client import DEFAULT_REGION, NeptuneClient
+from midas.neptune_csv import (NEPTUNE_DELIMITER, NeptuneCSVWriter, compile_row_function, get_neptune_columns,
+                               get_parquet_read_columns)
+from midas.query_cache import GraphVersionError, GraphVersionStore, set_graph_version
+from midas.util import get_kg_output_directory_path
+
+ADDED = "added"
+UPDATED = "updated"
+DELETED = "deleted"
+# edges are loaded without ids, these properties identify an edge
+EDGE_KEY_PROPERTIES = ["subject", "predicate", "object", "primary_knowledge_source", "qualified_predicate",
+                       "object_aspect_qualifier", "object_direction_qualifier"]
+KEY_SEPARATOR = "\x1f"
+# records held in memory per input while sorting, past this they're sorted in runs spilled to disk
+DEFAULT_MAX_BUFFERED_RECORDS = 500_000
+DEFAULT_MUTATION_BATCH_SIZE = 1_000
+# the order mutations are applied in: deletes first, and edges are added once their nodes exist
+MUTATION_PHASES = ["edges_deleted", "nodes_deleted", "nodes_added", "nodes_updated", "edges_added", "edges_updated"]
+# the additions can be bulk loaded from the delta CSVs instead (bulk_load.py --index-file)
+LOADER_PHASES = ["nodes_added", "edges_added"]
+DELTA_FILES_INDEX_SUFFIX = "_delta_neptune_files.json"
+DELTA_SUMMARY_SUFFIX = "_delta.json"
+MUTATIONS_FILE_SUFFIX = "_delta_mutations.jsonl"
+
+
+def get_delta_directory_path(graph_id: str) -> Path:
+    return get_kg_output_directory_path() / graph_id / "delta"
+
+def quote_name(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+def get_property_name(header: str) -> str:
+    # name:String -> name
+    return header.split(":")[0]
+
+def iterate_neptune_rows(input_file, kind: str, columns: list):
+    read_columns = get_parquet_read_columns(columns, kind) if Path(input_file).suffix == ".parquet" else None
+    to_row = compile_row_function(columns)
+    for record in iterate_kgx_file(input_file, columns=read_columns):
+        yield to_row(record)
+
+def get_key_function(columns: list, kind: str):
+    column_indices = {kgx_property: index for index, (_, kgx_property, _) in enumerate(columns)}
+    if kind == "nodes":
+        id_index = column_indices["id"]
+        return lambda row: row[id_index]
+    key_indices = [column_indices[key_property] for key_property in EDGE_KEY_PROPERTIES]
+    return lambda row: KEY_SEPARATOR.join(row[index] for index in key_indices)
+
+def sort_rows(rows, key_function, max_buffered_records: int = DEFAULT_MAX_BUFFERED_RECORDS, spill_dir=None):
+    """
+    Yield (key, row) sorted by key. Past max_buffered_records, sorted runs are spilled to disk
+    and merged, so memory stays bounded for graphs of any size.
+    """
+    buffer = []
+    spill_files = []
+
+    def spill():
+        spill_file = tempfile.TemporaryFile(mode="w+", dir=spill_dir)
+        buffer.sort(key=itemgetter(0))
+        for item in buffer:
+            spill_file.write(json.dumps(item) + "\n")
+        spill_file.seek(0)
+        spill_files.append(spill_file)
+        buffer.clear()
+
+    for row in rows:
+        buffer.append((key_function(row), row))
+        if len(buffer) >= max_buffered_records:
+            spill()
+    if not spill_files:
+        buffer.sort(key=itemgetter(0))
+        yield from buffer
+        return
+    if buffer:
+        spill()
+    try:
+        yield from heapq.merge(*[map(json.loads, spill_file) for spill_file in spill_files], key=itemgetter(0))
+    finally:
+        for spill_file in spill_files:
+            spill_file.close()
+
+def iterate_key_groups(sorted_items):
+    for key, items in itertools.groupby(sorted_items, key=itemgetter(0)):
+        yield key, [row for _, row in items]
+
+def diff_sorted_rows(old_items, new_items):
+    """
+    Merge join two streams of (key, row) sorted by key, yielding (key, old rows, new rows) for every key.
+    A key only in the old stream has no new rows and the other way around.
+    """
+    old_groups = iterate_key_groups(old_items)
+    new_groups = iterate_key_groups(new_items)
+    old_group = next(old_groups, None)
+    new_group = next(new_groups, None)
+    while old_group or new_group:
+        if new_group is None or (old_group is not None and old_group[0] < new_group[0]):
+            yield old_group[0], old_group[1], []
+            old_group = next(old_groups, None)
+        elif old_group is None or new_group[0] < old_group[0]:
+            yield new_group[0], [], new_group[1]
+            new_group = next(new_groups, None)
+        else:
+            yield old_group[0], old_group[1], new_group[1]
+            old_group = next(old_groups, None)
+            new_group = next(new_groups, None)
+
+
+class MutationWriter:
+    """
+    Turns changed Neptune CSV rows into batched openCypher mutations, one UNWIND query per batch of rows
+    with the same labels or relationship type, written as jsonl lines of {phase, query, parameters}.
+    Batches are collected per phase in temporary files and written out in MUTATION_PHASES order on close.
+    """
+    def __init__(self, output_file, batch_size: int = DEFAULT_MUTATION_BATCH_SIZE, spill_dir=None):
+        self.output_file = output_file
+        self.batch_size = batch_size
+        self.phase_files = {phase: tempfile.TemporaryFile(mode="w+", dir=spill_dir) for phase in MUTATION_PHASES}
+        # (phase, query) -> rows of the next batch
+        self.batches = {}
+        self.mutation_counts = Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, phase: str, query: str, row: dict):
+        rows = self.batches.setdefault((phase, query), [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.write_batch(phase, query)
+
+    def write_batch(self, phase: str, query: str):
+        rows = self.batches.pop((phase, query))
+        self.phase_files[phase].write(json.dumps({"phase": phase, "query": query, "parameters": {"rows": rows}}) + "\n")
+        self.mutation_counts[phase] += 1
+
+    def close(self):
+        for phase, query in list(self.batches):
+            self.write_batch(phase, query)
+        with open(self.output_file, "w") as mutations_out:
+            for phase in MUTATION_PHASES:
+                self.phase_files[phase].seek(0)
+                shutil.copyfileobj(self.phase_files[phase], mutations_out)
+                self.phase_files[phase].close()
+
+
+class NeptuneRowMutations:
+    """openCypher mutations for the Neptune CSV rows of one kind (nodes or edges)."""
+    def __init__(self, kind: str, columns: list):
+        self.kind = kind
+        self.column_indices = {kgx_property: index for index, (_, kgx_property, _) in enumerate(columns)}
+        # (property name, value type, row index) of the plain property columns
+        self.property_columns = [(get_property_name(header), value_type, index)
+                                 for index, (header, _, value_type) in enumerate(columns)
+                                 if not header.startswith(":")]
+        self.edge_key_properties = [(key_property, self.column_indices[key_property])
+                                    for key_property in EDGE_KEY_PROPERTIES
+                                    if key_property not in ("subject", "predicate", "object")] \
+            if kind == "edges" else []
+
+    def get_value(self, row: list, kgx_property: str) -> str:
+        return row[self.column_indices[kgx_property]]
+
+    def get_properties(self, row: list, previous_row: list = None) -> dict:
+        # an empty value is a missing property, on updates it's set to null to remove the previous value
+        properties = {}
+        for property_name, value_type, index in self.property_columns:
+            if row[index] == "":
+                if previous_row and previous_row[index] != "":
+                    properties[property_name] = None
+            else:
+                properties[property_name] = float(row[index]) if value_type == "double" else row[index]
+        return properties
+
+    def get_labels(self, row: list) -> list:
+        return self.get_value(row, "category").split(NEPTUNE_DELIMITER)
+
+    def get_edge_match(self, row: list) -> str:
+        relationship_type = quote_name(self.get_value(row, "predicate"))
+        key_conditions = "".join(f" AND coalesce(r.{quote_name(key_property)}, '') = row.key.{quote_name(key_property)}"
+                                 for key_property, _ in self.edge_key_properties)
+        return f"MATCH (s)-[r:{relationship_type}]->(o) WHERE id(s) = row.subject AND id(o) = row.object{key_conditions}"
+
+    def get_edge_parameters(self, row: list, **parameters) -> dict:
+        return {"subject": self.get_value(row, "subject"),
+                "object": self.get_value(row, "object"),
+                "key": {key_property: row[index] for key_property, index in self.edge_key_properties},
+                **parameters}
+
+    def write(self, mutation_writer: MutationWriter, change: str, old_row: list = None, new_row: list = None):
+        phase = f"{self.kind}_{change}"
+        if self.kind == "nodes":
+            if change == DELETED:
+                mutation_writer.add(phase, "UNWIND $rows AS row MATCH (n) WHERE id(n) = row.id DETACH DELETE n",
+                                    {"id": self.get_value(old_row, "id")})
+            elif change == ADDED:
+                labels = ":".join(map(quote_name, self.get_labels(new_row)))
+                mutation_writer.add(phase, f"UNWIND $rows AS row CREATE (n:{labels} {{`~id`: row.id}}) "
+                                           f"SET n += row.properties",
+                                    {"id": self.get_value(new_row, "id"), "properties": self.get_properties(new_row)})
+            else:
+                old_labels, new_labels = self.get_labels(old_row), self.get_labels(new_row)
+                query = "UNWIND $rows AS row MATCH (n) WHERE id(n) = row.id SET n += row.properties"
+                added_labels = [label for label in new_labels if label not in old_labels]
+                removed_labels = [label for label in old_labels if label not in new_labels]
+                if added_labels:
+                    query += f" SET n:{':'.join(map(quote_name, added_labels))}"
+                if removed_labels:
+                    query += f" REMOVE n:{':'.join(map(quote_name, removed_labels))}"
+                mutation_writer.add(phase, query, {"id": self.get_value(new_row, "id"),
+                                                   "properties": self.get_properties(new_row, old_row)})
+        else:
+            if change == DELETED:
+                mutation_writer.add(phase, f"UNWIND $rows AS row {self.get_edge_match(old_row)} DELETE r",
+                                    self.get_edge_parameters(old_row))
+            elif change == ADDED:
+                relationship_type = quote_name(self.get_value(new_row, "predicate"))
+                mutation_writer.add(phase, f"UNWIND $rows AS row MATCH (s), (o) "
+                                           f"WHERE id(s) = row.subject AND id(o) = row.object "
+                                           f"CREATE (s)-[r:{relationship_type}]->(o) SET r += row.properties",
+                                    self.get_edge_parameters(new_row, properties=self.get_properties(new_row)))
+            else:
+                mutation_writer.add(phase, f"UNWIND $rows AS row {self.get_edge_match(new_row)} "
+                                           f"SET r += row.properties",
+                                    self.get_edge_parameters(new_row,
+                                                             properties=self.get_properties(new_row, old_row)))
+
+
+def compute_kind_delta(graph_id: str, kind: str, old_input_file, new_input_file, output_dir: Path,
+                       mutation_writer: MutationWriter, max_buffered_records: int = DEFAULT_MAX_BUFFERED_RECORDS,
+                       spill_dir=None) -> dict:
+    columns = get_neptune_columns(kind)
+    header = [column_header for column_header, _, _ in columns]
+    key_function = get_key_function(columns, kind)
+    row_mutations = NeptuneRowMutations(kind, columns)
+    change_counts = Counter()
+    csv_writers = {change: NeptuneCSVWriter(output_dir / f"{graph_id}_{kind}_{change}.csv", header)
+                   for change in (ADDED, UPDATED, DELETED)}
+    try:
+        old_items = sort_rows(iterate_neptune_rows(old_input_file, kind, columns), key_function,
+                              max_buffered_records=max_buffered_records, spill_dir=spill_dir)
+        new_items = sort_rows(iterate_neptune_rows(new_input_file, kind, columns), key_function,
+                              max_buffered_records=max_buffered_records, spill_dir=spill_dir)
+        for key, old_rows, new_rows in diff_sorted_rows(old_items, new_items):
+            if len(old_rows) == 1 and len(new_rows) == 1:
+                if old_rows[0] == new_rows[0]:
+                    change_counts["unchanged"] += 1
+                else:
+                    csv_writers[UPDATED].write(new_rows[0])
+                    row_mutations.write(mutation_writer, UPDATED, old_rows[0], new_rows[0])
+                    change_counts[UPDATED] += 1
+                continue
+            if sorted(old_rows) == sorted(new_rows):
+                change_counts["unchanged"] += len(new_rows)
+                continue
+            # duplicate edge keys can't be updated one by one, every edge with the key is replaced
+            for old_row in old_rows:
+                csv_writers[DELETED].write(old_row)
+                row_mutations.write(mutation_writer, DELETED, old_row=old_row)
+                change_counts[DELETED] += 1
+            for new_row in new_rows:
+                csv_writers[ADDED].write(new_row)
+                row_mutations.write(mutation_writer, ADDED, new_row=new_row)
+                change_counts[ADDED] += 1
+    finally:
+        for csv_writer in csv_writers.values():
+            csv_writer.close()
+    print(f"{kind}: {change_counts[ADDED]} added, {change_counts[UPDATED]} updated, {change_counts[DELETED]} deleted, "
+          f"{change_counts['unchanged']} unchanged")
+    return {change: change_counts[change] for change in (ADDED, UPDATED, DELETED, "unchanged")}
+
+
+def compute_graph_delta(graph_id: str, old_nodes_file, old_edges_file, new_nodes_file, new_edges_file, output_dir,
+                        batch_size: int = DEFAULT_MUTATION_BATCH_SIZE,
+                        max_buffered_records: int = DEFAULT_MAX_BUFFERED_RECORDS) -> dict:
+    """
+    Compare the previous and the new graph (KGX jsonl or parquet) and write to output_dir:
+    - {graph_id}_{nodes|edges}_{added|updated|deleted}.csv, the changed records as Neptune CSV
+    - {graph_id}_delta_neptune_files.json, the added nodes and edges for bulk_load.py --index-file
+    - {graph_id}_delta_mutations.jsonl, batched openCypher mutations applying the whole delta
+    - {graph_id}_delta.json, the counts of the delta
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Computing the delta of {graph_id} from {old_nodes_file} and {old_edges_file} "
+          f"to {new_nodes_file} and {new_edges_file}")
+    mutations_file = output_dir / f"{graph_id}{MUTATIONS_FILE_SUFFIX}"
+    with tempfile.TemporaryDirectory(dir=output_dir) as spill_dir, \
+            MutationWriter(mutations_file, batch_size=batch_size, spill_dir=spill_dir) as mutation_writer:
+        delta = {
+            "graph_id": graph_id,
+            "nodes": compute_kind_delta(graph_id, "nodes", old_nodes_file, new_nodes_file, output_dir,
+                                        mutation_writer, max_buffered_records, spill_dir),
+            "edges": compute_kind_delta(graph_id, "edges", old_edges_file, new_edges_file, output_dir,
+                                        mutation_writer, max_buffered_records, spill_dir)
+        }
+    delta["mutations"] = dict(mutation_writer.mutation_counts)
+    with open(output_dir / f"{graph_id}{DELTA_FILES_INDEX_SUFFIX}", "w") as index_out:
+        json.dump({"nodes": [str(output_dir / f"{graph_id}_nodes_{ADDED}.csv")],
+                   "edges": [str(output_dir / f"{graph_id}_edges_{ADDED}.csv")]}, index_out, indent=4)
+    with open(output_dir / f"{graph_id}{DELTA_SUMMARY_SUFFIX}", "w") as summary_out:
+        json.dump(delta, summary_out, indent=4)
+    return delta
+
+def apply_graph_delta(client: NeptuneClient, mutations_file, skip_phases: list = None) -> Counter:
+    """Run the mutations of a delta in order, skip_phases e.g. LOADER_PHASES when the additions were bulk loaded."""
+    skip_phases = set(skip_phases or [])
+    applied_rows = Counter()
+    with open(mutations_file) as mutations_in:
+        for line in mutations_in:
+            mutation = json.loads(line)
+            if mutation["phase"] in skip_phases:
+                continue
+            client.execute_query(mutation["query"], mutation["parameters"])
+            applied_rows[mutation["phase"]] += len(mutation["parameters"]["rows"])
+    print("Applied " + ", ".join(f"{applied_rows[phase]} {phase.replace('_', ' ')}"
+                                 for phase in MUTATION_PHASES if phase not in skip_phases))
+    return applied_rows
+
+
+@click.command()
+@click.option('--graph-id', '-g', default="goldenKG", help='Graph to compare, from data_output/kgs/<graph-id>.')
+@click.option('--previous-dir', required=True,
+              help='Directory with the previous build of the graph (<graph-id>_nodes/_edges, jsonl or parquet).')
+@click.option('--output-dir', default=None, help='Output directory, defaults to data_output/kgs/<graph-id>/delta.')
+@click.option('--batch-size', default=DEFAULT_MUTATION_BATCH_SIZE, show_default=True,
+              help='Rows per UNWIND mutation.')
+@click.option('--max-buffered-records', default=DEFAULT_MAX_BUFFERED_RECORDS, show_default=True,
+              help='Records sorted in memory per input before sorted runs are spilled to disk.')
+@click.option('--endpoint', default=None, help='Apply the delta to this Neptune endpoint, e.g. https://<cluster>:8182')
+@click.option('--region', default=DEFAULT_REGION, show_default=True)
+@click.option('--no-sign', is_flag=True, help='Send unsigned requests, for clusters without IAM authentication.')
+@click.option('--skip-added', is_flag=True,
+              help='Skip the added nodes and edges when applying, if they were bulk loaded from the delta CSVs.')
+def graph_delta(graph_id: str, previous_dir: str, output_dir: str, batch_size: int, max_buffered_records: int,
+                endpoint: str, region: str, no_sign: bool, skip_added: bool):
+    graph_dir = get_kg_output_directory_path() / graph_id
+    output_dir = Path(output_dir) if output_dir else get_delta_directory_path(graph_id)
+    compute_graph_delta(graph_id,
+                        get_kgx_file_path(previous_dir, graph_id, "nodes"),
+                        get_kgx_file_path(previous_dir, graph_id, "edges"),
+                        get_kgx_file_path(graph_dir, graph_id, "nodes"),
+                        get_kgx_file_path(graph_dir, graph_id, "edges"),
+                        output_dir,
+                        batch_size=batch_size,
+                        max_buffered_records=max_buffered_records)
+    if endpoint:
+        with NeptuneClient(endpoint, region=region, sign=not no_sign) as client:
+            apply_graph_delta(client, output_dir / f"{graph_id}{MUTATIONS_FILE_SUFFIX}",
+                              skip_phases=LOADER_PHASES if skip_added else None)
+        # the delta changed the graph, invalidate cached query results
+        try:
+            print(f"Graph version set to {set_graph_version(GraphVersionStore(endpoint, region=region))}")
+        except GraphVersionError as e:
+            print(f"Could not write the graph version, cached query results expire after their TTL: {e}")
+
+if __name__ == "__main__":
+    graph_delta()
@@ -0,0 +1,143 @@
+import json
+
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import click
+import numpy as np
+
+from midas.columnar import get_kgx_file_path, iterate_kgx_file
+from midas.sampling import get_node_stratum
+from midas.util import get_kg_output_directory_path
+
+GRAPH_STATS_FILE_SUFFIX = "_stats.json"
+DEFAULT_TOP_K = 10
+
+
+def get_graph_stats_path(graph_id: str) -> Path:
+    return get_kg_output_directory_path() / graph_id / f"{graph_id}{GRAPH_STATS_FILE_SUFFIX}"
+
+def load_graph_stats(stats_file_path) -> dict:
+    with open(stats_file_path) as stats_file:
+        return json.load(stats_file)
+
+def get_degree_bin_labels(bin_count: int) -> list:
+    # bin 0 holds degree 0, bin i holds degrees 2^(i-1) to 2^i - 1
+    return ["0", "1"] + [f"{2 ** (i - 1)}-{2 ** i - 1}" for i in range(2, bin_count)]
+
+def get_degree_histogram(degrees: np.ndarray) -> dict:
+    if not len(degrees):
+        return {}
+    degree_bins = np.zeros(len(degrees), dtype=np.int64)
+    positive = degrees > 0
+    degree_bins[positive] = np.floor(np.log2(degrees[positive])).astype(np.int64) + 1
+    bin_counts = np.bincount(degree_bins)
+    return {label: int(count) for label, count in zip(get_degree_bin_labels(len(bin_counts)), bin_counts) if count}
+
+def get_degree_summary(degrees: np.ndarray) -> dict:
+    if not len(degrees):
+        return {"mean": 0, "median": 0, "max": 0, "isolated_nodes": 0}
+    return {"mean": round(float(degrees.mean()), 3),
+            "median": float(np.median(degrees)),
+            "max": int(degrees.max()),
+            "isolated_nodes": int((degrees == 0).sum())}
+
+
+def generate_graph_stats(graph_id: str, nodes_input_file, edges_input_file, output_file=None,
+                         top_k: int = DEFAULT_TOP_K) -> dict:
+    """
+    Compute summary statistics of a merged graph in two passes over the nodes and one over the edges:
+    counts per category, predicate and knowledge source, degree histograms, and the top_k highest degree
+    nodes (hubs) per primary category (the first, most specific category of a node).
+    """
+    print(f"Generating graph statistics for {graph_id}")
+    node_indices = {}
+    category_counts = Counter()
+    primary_category_code_lookup = {}
+    primary_category_codes = []
+    for node in iterate_kgx_file(nodes_input_file, columns=["id", "category"]):
+        node_indices[node["id"]] = len(node_indices)
+        categories = node.get("category") or []
+        category_counts.update([categories] if isinstance(categories, str) else categories)
+        primary_category_codes.append(primary_category_code_lookup.setdefault(get_node_stratum(node),
+                                                                              len(primary_category_code_lookup)))
+    primary_categories = list(primary_category_code_lookup)
+
+    degrees = [0] * len(node_indices)
+    predicate_counts = Counter()
+    source_counts = Counter()
+    source_predicate_counts = defaultdict(Counter)
+    dangling_edges = 0
+    edge_count = 0
+    for edge in iterate_kgx_file(edges_input_file, columns=["subject", "predicate", "object",
+                                                            "primary_knowledge_source"]):
+        edge_count += 1
+        predicate_counts[edge.get("predicate")] += 1
+        primary_knowledge_source = edge.get("primary_knowledge_source", "missing_primary_knowledge_source")
+        source_counts[primary_knowledge_source] += 1
+        source_predicate_counts[primary_knowledge_source][edge.get("predicate")] += 1
+        subject_index = node_indices.get(edge["subject"])
+        object_index = node_indices.get(edge["object"])
+        if subject_index is None or object_index is None:
+            dangling_edges += 1
+        if subject_index is not None:
+            degrees[subject_index] += 1
+        if object_index is not None:
+            degrees[object_index] += 1
+
+    degrees = np.array(degrees, dtype=np.int64)
+    primary_category_codes = np.array(primary_category_codes, dtype=np.int32)
+    degrees_by_category = {}
+    hub_indices_by_category = {}
+    for code, primary_category in enumerate(primary_categories):
+        category_node_indices = np.flatnonzero(primary_category_codes == code)
+        category_degrees = degrees[category_node_indices]
+        degrees_by_category[primary_category] = {**get_degree_summary(category_degrees),
+                                                 "histogram": get_degree_histogram(category_degrees)}
+        # stable sort, ties keep graph order
+        top_positions = np.argsort(-category_degrees, kind="stable")[:top_k]
+        hub_indices_by_category[primary_category] = category_node_indices[top_positions].tolist()
+
+    # the names are only needed for the hubs, so they're read in a second pass instead of kept for every node
+    hub_indices = {index for indices in hub_indices_by_category.values() for index in indices}
+    hub_nodes = {}
+    for index, node in enumerate(iterate_kgx_file(nodes_input_file, columns=["id", "name"])):
+        if index in hub_indices:
+            hub_nodes[index] = {"id": node["id"], "name": node.get("name", ""), "degree": int(degrees[index])}
+
+    graph_stats = {
+        "graph_id": graph_id,
+        "node_count": len(node_indices),
+        "edge_count": edge_count,
+        "dangling_edges": dangling_edges,
+        "nodes_by_category": dict(category_counts.most_common()),
+        "nodes_by_primary_category": {primary_category: int((primary_category_codes == code).sum())
+                                      for code, primary_category in enumerate(primary_categories)},
+        "edges_by_predicate": dict(predicate_counts.most_common()),
+        "edges_by_source": dict(source_counts.most_common()),
+        "edges_by_source_and_predicate": {source: dict(source_predicate_counts[source].most_common())
+                                          for source, _ in source_counts.most_common()},
+        "degree": {**get_degree_summary(degrees), "histogram": get_degree_histogram(degrees)},
+        "degree_by_category": degrees_by_category,
+        "hubs_by_category": {primary_category: [hub_nodes[index] for index in indices]
+                             for primary_category, indices in hub_indices_by_category.items()}
+    }
+    output_file = output_file or Path(nodes_input_file).parent / f"{graph_id}{GRAPH_STATS_FILE_SUFFIX}"
+    with open(output_file, "w") as stats_file:
+        json.dump(graph_stats, stats_file, indent=4)
+    return graph_stats
+
+
+@click.command()
+@click.option('--graph-id', '-g', default="goldenKG", help='Graph to summarize, from data_output/kgs/<graph-id>.')
+@click.option('--top-k', default=DEFAULT_TOP_K, show_default=True, help='Number of hubs listed per category.')
+def graph_stats(graph_id: str, top_k: int):
+    graph_dir = get_kg_output_directory_path() / graph_id
+    generate_graph_stats(graph_id,
+                         get_kgx_file_path(graph_dir, graph_id, "nodes"),
+                         get_kgx_file_path(graph_dir, graph_id, "edges"),
+                         output_file=get_graph_stats_path(graph_id),
+                         top_k=top_k)
+
+if __name__ == "__main__":
+    graph_stats()
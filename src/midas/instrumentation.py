@@ -0,0 +1,205 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+RUN_REPORT_FILE_NAME = "run_report.json"
+# files whose lines are records, the ones with a header line don't count it
+RECORD_FILE_SUFFIXES = [".jsonl", ".csv", ".tsv"]
+HEADER_FILE_SUFFIXES = [".csv", ".tsv"]
+TRACEMALLOC_TOP_ALLOCATIONS = 50
+SUMMARY_STAGE_COUNT = 10
+
+
+def get_timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+def get_rss_mb(max_rss: int) -> float:
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    return round(max_rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+def get_cpu_seconds(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+def reset_peak_rss() -> bool:
+    """Reset the peak RSS of this process (linux only), so the next reading is the peak of a stage."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs_file:
+            clear_refs_file.write("5")
+        return True
+    except OSError:
+        return False
+
+def read_peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # without /proc this is the peak of the whole process so far
+    return get_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+def count_records(file_path: Path) -> int | None:
+    """Lines of a jsonl file or rows of a csv/tsv file, None for other files."""
+    file_path = Path(file_path)
+    if file_path.suffix not in RECORD_FILE_SUFFIXES or not file_path.exists():
+        return None
+    line_count = 0
+    with open(file_path, "rb") as record_file:
+        while block := record_file.read(1 << 20):
+            line_count += block.count(b"\n")
+    return max(line_count - 1, 0) if file_path.suffix in HEADER_FILE_SUFFIXES else line_count
+
+def get_profile_name(stage: str) -> str:
+    return stage.replace(":", "_").replace("/", "_")
+
+
+class RunReport:
+    """
+    Wall time, CPU time, peak RSS, records and bytes in and out of every stage of a pipeline run, written to
+    run_report.json next to the graph. With a profile directory, every stage also gets a cProfile dump and
+    the top allocation sites from tracemalloc.
+    CPU time includes worker processes the stage waited for. Peak RSS is the stage's own process (per stage on
+    linux, the process peak so far elsewhere), and worker_peak_rss_mb the largest worker it waited for.
+    """
+    def __init__(self, profile_dir: Path = None):
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.stages = []
+        # record counts by file path, size and modification time, so a stage's outputs aren't counted again
+        # when they are the next stage's inputs
+        self.record_counts = {}
+        self.started_at = get_timestamp()
+        self.start_time = time.perf_counter()
+
+    def get_record_count(self, file_path: Path) -> int | None:
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        cached = self.record_counts.get(str(file_path))
+        if cached and cached["size"] == file_stat.st_size and cached["mtime_ns"] == file_stat.st_mtime_ns:
+            return cached["records"]
+        record_count = count_records(file_path)
+        self.record_counts[str(file_path)] = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns,
+                                              "records": record_count}
+        return record_count
+
+    def get_file_stats(self, files: list) -> tuple:
+        """Total bytes of the data files and records of the ones with countable records (None without any)."""
+        # the manifest lists the stage modules as inputs too, they aren't data
+        data_files = [Path(file_path) for file_path in files if Path(file_path).suffix != ".py"]
+        file_bytes = sum(file_path.stat().st_size for file_path in data_files if file_path.exists())
+        record_counts = [record_count for record_count in map(self.get_record_count, data_files)
+                         if record_count is not None]
+        return file_bytes, sum(record_counts) if record_counts else None
+
+    @contextmanager
+    def measure(self, stage: str, inputs: list = None, outputs: list = None):
+        """Measure the stage run in the with block, yielding its record so callers can add to it."""
+        input_bytes, records_in = self.get_file_stats(inputs or [])
+        stage_record = {"stage": stage, "status": "ran", "started_at": get_timestamp(), "pid": os.getpid()}
+        profiler = cProfile.Profile() if self.profile_dir else None
+        if profiler:
+            tracemalloc.start()
+            profiler.enable()
+        reset_peak_rss()
+        worker_max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        start_cpu_seconds = get_cpu_seconds(resource.RUSAGE_SELF) + get_cpu_seconds(resource.RUSAGE_CHILDREN)
+        start_time = time.perf_counter()
+        try:
+            yield stage_record
+        except BaseException:
+            stage_record["status"] = "failed"
+            raise
+        finally:
+            seconds = time.perf_counter() - start_time
+            cpu_seconds = get_cpu_seconds(resource.RUSAGE_SELF) + get_cpu_seconds(resource.RUSAGE_CHILDREN) - \
+                start_cpu_seconds
+            peak_rss_mb = read_peak_rss_mb()
+            stage_worker_max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            if profiler:
+                profiler.disable()
+                stage_record["profile_files"] = self.write_profile(stage, profiler)
+            output_bytes, records_out = self.get_file_stats(outputs or [])
+            stage_record.update({
+                "seconds": round(seconds, 3),
+                "cpu_seconds": round(cpu_seconds, 3),
+                "peak_rss_mb": peak_rss_mb,
+                "worker_peak_rss_mb": get_rss_mb(stage_worker_max_rss) if stage_worker_max_rss > worker_max_rss
+                else None,
+                "input_bytes": input_bytes,
+                "output_bytes": output_bytes,
+                "records_in": records_in,
+                "records_out": records_out,
+                "records_per_second": round(records_out / seconds) if records_out and seconds else None
+            })
+            self.stages.append(stage_record)
+            print(f"{stage} {stage_record['status']} in {seconds:.1f}s (cpu {cpu_seconds:.1f}s), "
+                  f"peak RSS {peak_rss_mb:.0f}MB, {records_in} records in, {records_out} records out")
+
+    def write_profile(self, stage: str, profiler: cProfile.Profile) -> list:
+        # the allocations still held at the end of the stage, without the profiler's own
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, cProfile.__file__),
+                                                              tracemalloc.Filter(False, tracemalloc.__file__)])
+        traced_bytes, peak_traced_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profile_path = self.profile_dir / f"{get_profile_name(stage)}.prof"
+        profiler.dump_stats(profile_path)
+        allocations_path = self.profile_dir / f"{get_profile_name(stage)}_tracemalloc.txt"
+        with open(allocations_path, "w") as allocations_file:
+            allocations_file.write(f"{stage}: {traced_bytes / (1 << 20):.1f}MB traced at the end of the stage, "
+                                   f"{peak_traced_bytes / (1 << 20):.1f}MB at the peak\n")
+            for statistic in snapshot.statistics("lineno")[:TRACEMALLOC_TOP_ALLOCATIONS]:
+                allocations_file.write(f"{statistic}\n")
+        return [str(profile_path), str(allocations_path)]
+
+    def record_skipped(self, stage: str):
+        self.stages.append({"stage": stage, "status": "skipped", "started_at": get_timestamp(), "pid": os.getpid()})
+
+    def get_updates(self) -> dict:
+        return {"stages": self.stages, "record_counts": self.record_counts}
+
+    def apply_updates(self, updates: dict):
+        self.stages.extend(updates["stages"])
+        self.record_counts.update(updates["record_counts"])
+
+    def get_report(self, status: str, **run_info) -> dict:
+        return {**run_info,
+                "status": status,
+                "started_at": self.started_at,
+                "finished_at": get_timestamp(),
+                "seconds": round(time.perf_counter() - self.start_time, 3),
+                "cpu_seconds": round(get_cpu_seconds(resource.RUSAGE_SELF) +
+                                     get_cpu_seconds(resource.RUSAGE_CHILDREN), 3),
+                "peak_rss_mb": get_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+                "worker_peak_rss_mb": get_rss_mb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss),
+                "profile_dir": str(self.profile_dir) if self.profile_dir else None,
+                "stages": self.stages}
+
+    def write(self, report_path: Path, status: str, **run_info) -> dict:
+        report = self.get_report(status, **run_info)
+        temp_report_path = Path(report_path).with_suffix(".json.tmp")
+        with open(temp_report_path, "w") as report_file:
+            json.dump(report, report_file, indent=4)
+        os.replace(temp_report_path, report_path)
+        return report
+
+    def print_summary(self):
+        measured_stages = sorted((stage for stage in self.stages if "seconds" in stage),
+                                 key=lambda stage: stage["seconds"], reverse=True)
+        total_seconds = time.perf_counter() - self.start_time
+        print(f"Run took {total_seconds:.1f}s, slowest stages:")
+        for stage in measured_stages[:SUMMARY_STAGE_COUNT]:
+            print(f"  {stage['stage']}: {stage['seconds']:.1f}s ({stage['seconds'] / total_seconds:.0%}), "
+                  f"peak RSS {stage['peak_rss_mb']:.0f}MB")
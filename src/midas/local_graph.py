@@ -0,0 +1,444 @@
+import time
+
+from pathlib import Path
+
+import click
+import numpy as np
+
+from midas.columnar import get_kgx_file_path, iterate_kgx_file
+from midas.name_index import Postings, StringTable, get_offsets
+from midas.util import get_kg_output_directory_path
+
+LOCAL_GRAPH_FILE_SUFFIX = "_local_graph.npz"
+DEFAULT_NEIGHBOR_LIMIT = 100
+DEFAULT_MAX_HOPS = 3
+NEIGHBOR_SCAN_CHUNK_SIZE = 4096
+OUTGOING = "out"
+INCOMING = "in"
+BOTH = "both"
+
+
+def get_local_graph_path(graph_id: str) -> Path:
+    return get_kg_output_directory_path() / graph_id / f"{graph_id}{LOCAL_GRAPH_FILE_SUFFIX}"
+
+def get_string_codes(strings: list) -> dict:
+    return {string: code for code, string in enumerate(strings)}
+
+def get_csr_rows(offsets: np.ndarray, values: np.ndarray, rows: np.ndarray) -> tuple:
+    """
+    Gather the values of several CSR rows at once, returns the values and the position in rows
+    each value came from.
+    """
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    row_positions = np.repeat(np.arange(len(rows)), lengths)
+    value_indices = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths) + \
+        np.repeat(starts, lengths)
+    return values[value_indices], row_positions
+
+def filter_in_chunks(values: np.ndarray, keep_values, limit: int) -> np.ndarray:
+    """
+    The first limit values for which keep_values returns true, checked in chunks that stop once the limit is
+    reached, so a filter over the edges of a hub or a common predicate doesn't scan all of them.
+    """
+    kept_chunks = []
+    kept_count = 0
+    for start in range(0, len(values), NEIGHBOR_SCAN_CHUNK_SIZE):
+        chunk = values[start:start + NEIGHBOR_SCAN_CHUNK_SIZE]
+        kept_chunks.append(chunk[keep_values(chunk)])
+        kept_count += len(kept_chunks[-1])
+        if kept_count >= limit:
+            break
+    return np.concatenate(kept_chunks)[:limit] if kept_chunks else values[:0]
+
+def get_csr_index(row_values: np.ndarray, row_count: int) -> tuple:
+    """Offsets and the value positions sorted by row, for a CSR index over row_values (e.g. edges by subject)."""
+    order = np.argsort(row_values, kind="stable").astype(np.int32)
+    return get_offsets(np.bincount(row_values, minlength=row_count)), order
+
+
+class LocalGraph:
+    """
+    An in-memory copy of a merged graph for neighborhood, path and match queries without Neptune.
+    Node ids, categories, predicates and knowledge sources are interned to integers. Edges are stored as
+    subject, object, predicate and knowledge source arrays, with CSR indexes of the edges by subject (outgoing),
+    by object (incoming) and by predicate, and of the nodes by category.
+    Everything is held in numpy arrays and saved as one npz file, like the NameIndex.
+    """
+    def __init__(self, arrays):
+        self.node_ids = StringTable.from_arrays(arrays, "node_ids")
+        self.node_names = StringTable.from_arrays(arrays, "node_names")
+        self.node_descriptions = StringTable.from_arrays(arrays, "node_descriptions")
+        self.node_identifiers = StringTable.from_arrays(arrays, "node_identifiers")
+        self.categories = StringTable.from_arrays(arrays, "categories")
+        self.node_categories = Postings.from_arrays(arrays, "node_categories")
+        self.category_nodes = Postings.from_arrays(arrays, "category_nodes")
+        self.predicates = StringTable.from_arrays(arrays, "predicates")
+        self.sources = StringTable.from_arrays(arrays, "sources")
+        self.edge_subjects = arrays["edge_subjects"]
+        self.edge_objects = arrays["edge_objects"]
+        self.edge_predicates = arrays["edge_predicates"]
+        self.edge_sources = arrays["edge_sources"]
+        self.outgoing_offsets = arrays["outgoing_offsets"]
+        self.outgoing_edges = arrays["outgoing_edges"]
+        self.incoming_offsets = arrays["incoming_offsets"]
+        self.incoming_edges = arrays["incoming_edges"]
+        self.predicate_offsets = arrays["predicate_offsets"]
+        self.predicate_edges = arrays["predicate_edges"]
+        self.node_indices_by_id = None
+        self.category_codes = get_string_codes([self.categories[code] for code in range(len(self.categories))])
+        self.predicate_codes = get_string_codes([self.predicates[code] for code in range(len(self.predicates))])
+        self.category_masks = {}
+
+    @classmethod
+    def build(cls, nodes, edges):
+        node_indices = {}
+        node_names, node_descriptions, node_identifiers, node_category_lists = [], [], [], []
+        category_codes = {}
+        for node in nodes:
+            if node["id"] in node_indices:
+                continue
+            node_indices[node["id"]] = len(node_indices)
+            node_names.append(node.get("name") or "")
+            node_descriptions.append(node.get("description") or "")
+            identifiers = node.get("equivalent_identifiers") or []
+            node_identifiers.append(";".join(identifiers) if isinstance(identifiers, list) else str(identifiers))
+            categories = node.get("category") or []
+            categories = [categories] if isinstance(categories, str) else categories
+            # in the node's order, the first category is the most specific one
+            node_category_lists.append(list(dict.fromkeys(category_codes.setdefault(category, len(category_codes))
+                                                          for category in categories)))
+        category_node_lists = [[] for _ in category_codes]
+        # node indices are increasing, so every posting list comes out sorted
+        for node_index, node_category_codes in enumerate(node_category_lists):
+            for category_code in node_category_codes:
+                category_node_lists[category_code].append(node_index)
+
+        predicate_codes, source_codes = {}, {}
+        edge_columns = ([], [], [], [])
+        dangling_edges = 0
+        for edge in edges:
+            subject_index = node_indices.get(edge["subject"])
+            object_index = node_indices.get(edge["object"])
+            if subject_index is None or object_index is None:
+                dangling_edges += 1
+                continue
+            edge_columns[0].append(subject_index)
+            edge_columns[1].append(object_index)
+            edge_columns[2].append(predicate_codes.setdefault(edge.get("predicate") or "", len(predicate_codes)))
+            edge_columns[3].append(source_codes.setdefault(edge.get("primary_knowledge_source") or "",
+                                                           len(source_codes)))
+        if dangling_edges:
+            print(f"Skipped {dangling_edges} edges with a subject or object that isn't in the nodes")
+        edge_subjects, edge_objects, edge_predicates, edge_sources = [np.array(column, dtype=np.int32)
+                                                                      for column in edge_columns]
+        outgoing_offsets, outgoing_edges = get_csr_index(edge_subjects, len(node_indices))
+        incoming_offsets, incoming_edges = get_csr_index(edge_objects, len(node_indices))
+        predicate_offsets, predicate_edges = get_csr_index(edge_predicates, len(predicate_codes))
+
+        arrays = {
+            **StringTable.from_strings(list(node_indices)).to_arrays("node_ids"),
+            **StringTable.from_strings(node_names).to_arrays("node_names"),
+            **StringTable.from_strings(node_descriptions).to_arrays("node_descriptions"),
+            **StringTable.from_strings(node_identifiers).to_arrays("node_identifiers"),
+            **StringTable.from_strings(list(category_codes)).to_arrays("categories"),
+            **Postings.from_lists(node_category_lists).to_arrays("node_categories"),
+            **Postings.from_lists(category_node_lists).to_arrays("category_nodes"),
+            **StringTable.from_strings(list(predicate_codes)).to_arrays("predicates"),
+            **StringTable.from_strings(list(source_codes)).to_arrays("sources"),
+            "edge_subjects": edge_subjects,
+            "edge_objects": edge_objects,
+            "edge_predicates": edge_predicates,
+            "edge_sources": edge_sources,
+            "outgoing_offsets": outgoing_offsets,
+            "outgoing_edges": outgoing_edges,
+            "incoming_offsets": incoming_offsets,
+            "incoming_edges": incoming_edges,
+            "predicate_offsets": predicate_offsets,
+            "predicate_edges": predicate_edges
+        }
+        return cls(arrays)
+
+    @classmethod
+    def load(cls, graph_file_path):
+        with np.load(graph_file_path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def save(self, graph_file_path):
+        np.savez(graph_file_path,
+                 **self.node_ids.to_arrays("node_ids"),
+                 **self.node_names.to_arrays("node_names"),
+                 **self.node_descriptions.to_arrays("node_descriptions"),
+                 **self.node_identifiers.to_arrays("node_identifiers"),
+                 **self.categories.to_arrays("categories"),
+                 **self.node_categories.to_arrays("node_categories"),
+                 **self.category_nodes.to_arrays("category_nodes"),
+                 **self.predicates.to_arrays("predicates"),
+                 **self.sources.to_arrays("sources"),
+                 edge_subjects=self.edge_subjects,
+                 edge_objects=self.edge_objects,
+                 edge_predicates=self.edge_predicates,
+                 edge_sources=self.edge_sources,
+                 outgoing_offsets=self.outgoing_offsets,
+                 outgoing_edges=self.outgoing_edges,
+                 incoming_offsets=self.incoming_offsets,
+                 incoming_edges=self.incoming_edges,
+                 predicate_offsets=self.predicate_offsets,
+                 predicate_edges=self.predicate_edges)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_subjects)
+
+    def get_node_index(self, node_id: str):
+        if self.node_indices_by_id is None:
+            self.node_indices_by_id = {self.node_ids[index]: index for index in range(self.node_count)}
+        return self.node_indices_by_id.get(node_id)
+
+    def get_node(self, node_index: int) -> dict:
+        return {"id": self.node_ids[node_index],
+                "name": self.node_names[node_index],
+                "categories": [self.categories[code] for code in self.node_categories.get(node_index)],
+                "description": self.node_descriptions[node_index],
+                "equivalent_identifiers": self.node_identifiers[node_index]}
+
+    def get_node_by_id(self, node_id: str) -> dict:
+        node_index = self.get_node_index(node_id)
+        return self.get_node(node_index) if node_index is not None else None
+
+    def get_edge(self, edge_index: int) -> dict:
+        return {"subject": self.node_ids[self.edge_subjects[edge_index]],
+                "predicate": self.predicates[self.edge_predicates[edge_index]],
+                "object": self.node_ids[self.edge_objects[edge_index]],
+                "primary_knowledge_source": self.sources[self.edge_sources[edge_index]]}
+
+    def get_category_mask(self, categories: list) -> np.ndarray:
+        """Boolean mask of the nodes with at least one of the categories, cached per category list."""
+        mask_key = tuple(sorted(categories))
+        if mask_key not in self.category_masks:
+            category_mask = np.zeros(self.node_count, dtype=bool)
+            for category in categories:
+                if category in self.category_codes:
+                    category_mask[self.category_nodes.get(self.category_codes[category])] = True
+            self.category_masks[mask_key] = category_mask
+        return self.category_masks[mask_key]
+
+    def get_predicate_mask(self, predicates: list) -> np.ndarray:
+        predicate_mask = np.zeros(len(self.predicates), dtype=bool)
+        predicate_mask[[self.predicate_codes[predicate] for predicate in predicates
+                        if predicate in self.predicate_codes]] = True
+        return predicate_mask
+
+    def get_category_node_indices(self, category: str) -> np.ndarray:
+        if category not in self.category_codes:
+            return np.empty(0, dtype=np.int32)
+        return self.category_nodes.get(self.category_codes[category])
+
+    def get_degrees(self) -> np.ndarray:
+        return np.diff(self.outgoing_offsets) + np.diff(self.incoming_offsets)
+
+    def get_adjacent_edges(self, node_indices: np.ndarray, direction: str = BOTH) -> tuple:
+        """The edges of several nodes, with the neighbor across each edge and the position of the node it came from."""
+        edge_parts, neighbor_parts, position_parts = [], [], []
+        if direction in (OUTGOING, BOTH):
+            edges, positions = get_csr_rows(self.outgoing_offsets, self.outgoing_edges, node_indices)
+            edge_parts.append(edges)
+            neighbor_parts.append(self.edge_objects[edges])
+            position_parts.append(positions)
+        if direction in (INCOMING, BOTH):
+            edges, positions = get_csr_rows(self.incoming_offsets, self.incoming_edges, node_indices)
+            edge_parts.append(edges)
+            neighbor_parts.append(self.edge_subjects[edges])
+            position_parts.append(positions)
+        return np.concatenate(edge_parts), np.concatenate(neighbor_parts), np.concatenate(position_parts)
+
+    def get_neighbors(self, node_id: str, direction: str = BOTH, predicates: list = None, categories: list = None,
+                      limit: int = DEFAULT_NEIGHBOR_LIMIT) -> list:
+        """
+        The edges of a node, optionally only outgoing or incoming ones, with one of the predicates and to
+        neighbors with one of the categories. Returned as dictionaries of the neighbor's id and name, the
+        predicate, the direction from the node and the knowledge source.
+        """
+        node_index = self.get_node_index(node_id)
+        if node_index is None:
+            return []
+        outgoing_edges = self.outgoing_edges[self.outgoing_offsets[node_index]:self.outgoing_offsets[node_index + 1]] \
+            if direction != INCOMING else self.outgoing_edges[:0]
+        incoming_edges = self.incoming_edges[self.incoming_offsets[node_index]:self.incoming_offsets[node_index + 1]] \
+            if direction != OUTGOING else self.incoming_edges[:0]
+        edges = np.concatenate([outgoing_edges, incoming_edges])
+        is_outgoing = np.arange(len(edges)) < len(outgoing_edges)
+        predicate_mask = self.get_predicate_mask(predicates) if predicates else None
+        category_mask = self.get_category_mask(categories) if categories else None
+
+        def keep_positions(positions: np.ndarray) -> np.ndarray:
+            keep = np.ones(len(positions), dtype=bool)
+            if predicate_mask is not None:
+                keep &= predicate_mask[self.edge_predicates[edges[positions]]]
+            if category_mask is not None:
+                keep &= category_mask[np.where(is_outgoing[positions], self.edge_objects[edges[positions]],
+                                               self.edge_subjects[edges[positions]])]
+            return keep
+
+        positions = filter_in_chunks(np.arange(len(edges)), keep_positions, limit)
+        edges, is_outgoing = edges[positions], is_outgoing[positions]
+        neighbors = np.where(is_outgoing, self.edge_objects[edges], self.edge_subjects[edges])
+        return [{"id": self.node_ids[neighbor],
+                 "name": self.node_names[neighbor],
+                 "predicate": self.predicates[self.edge_predicates[edge]],
+                 "direction": OUTGOING if outgoing else INCOMING,
+                 "primary_knowledge_source": self.sources[self.edge_sources[edge]]}
+                for edge, neighbor, outgoing in zip(edges, neighbors, is_outgoing)]
+
+    def get_shortest_path(self, source_id: str, target_id: str, max_hops: int = DEFAULT_MAX_HOPS,
+                          predicates: list = None) -> dict:
+        """
+        A shortest path between two nodes of at most max_hops edges, ignoring edge direction.
+        Breadth first, with one vectorized expansion of the whole frontier per hop. Returns the nodes and
+        edges of the path, or None when there is no path within max_hops.
+        """
+        source_index, target_index = self.get_node_index(source_id), self.get_node_index(target_id)
+        if source_index is None or target_index is None:
+            return None
+        parents = np.full(self.node_count, -1, dtype=np.int64)
+        parent_edges = np.full(self.node_count, -1, dtype=np.int64)
+        parents[source_index] = source_index
+        predicate_mask = self.get_predicate_mask(predicates) if predicates else None
+        frontier = np.array([source_index])
+        for _ in range(max_hops):
+            if parents[target_index] != -1 or not len(frontier):
+                break
+            edges, neighbors, positions = self.get_adjacent_edges(frontier)
+            keep = parents[neighbors] == -1
+            if predicate_mask is not None:
+                keep &= predicate_mask[self.edge_predicates[edges]]
+            edges, neighbors, positions = edges[keep], neighbors[keep], positions[keep]
+            # the first edge reaching a node makes it a child of that edge's frontier node
+            next_frontier, first_indices = np.unique(neighbors, return_index=True)
+            parents[next_frontier] = frontier[positions[first_indices]]
+            parent_edges[next_frontier] = edges[first_indices]
+            frontier = next_frontier
+        if parents[target_index] == -1:
+            return None
+
+        path_nodes, path_edges = [target_index], []
+        while path_nodes[-1] != source_index:
+            path_edges.append(int(parent_edges[path_nodes[-1]]))
+            path_nodes.append(int(parents[path_nodes[-1]]))
+        return {"nodes": [self.get_node(node_index) for node_index in reversed(path_nodes)],
+                "edges": [self.get_edge(edge_index) for edge_index in reversed(path_edges)]}
+
+    def match_edges(self, subject_ids: list = None, subject_categories: list = None, predicates: list = None,
+                    object_ids: list = None, object_categories: list = None,
+                    limit: int = DEFAULT_NEIGHBOR_LIMIT) -> list:
+        """
+        Edges (subject)-[predicate]->(object) matching every given filter, like a MATCH with a WHERE clause.
+        The most selective index is scanned (subject or object ids, then predicates) and the other filters
+        are applied as masks.
+        """
+        subject_indices = [self.get_node_index(node_id) for node_id in subject_ids or []]
+        object_indices = [self.get_node_index(node_id) for node_id in object_ids or []]
+        subject_indices = np.array([index for index in subject_indices if index is not None], dtype=np.int64)
+        object_indices = np.array([index for index in object_indices if index is not None], dtype=np.int64)
+        if subject_ids:
+            edges = get_csr_rows(self.outgoing_offsets, self.outgoing_edges, subject_indices)[0]
+        elif object_ids:
+            edges = get_csr_rows(self.incoming_offsets, self.incoming_edges, object_indices)[0]
+        elif predicates:
+            predicate_codes = np.array([self.predicate_codes[predicate] for predicate in predicates
+                                        if predicate in self.predicate_codes], dtype=np.int64)
+            edges = get_csr_rows(self.predicate_offsets, self.predicate_edges, predicate_codes)[0]
+        else:
+            edges = np.arange(self.edge_count)
+        object_mask = None
+        if object_ids and subject_ids:
+            object_mask = np.zeros(self.node_count, dtype=bool)
+            object_mask[object_indices] = True
+        predicate_mask = self.get_predicate_mask(predicates) if predicates and (subject_ids or object_ids) else None
+        subject_category_mask = self.get_category_mask(subject_categories) if subject_categories else None
+        object_category_mask = self.get_category_mask(object_categories) if object_categories else None
+
+        def keep_edges(chunk_edges: np.ndarray) -> np.ndarray:
+            keep = np.ones(len(chunk_edges), dtype=bool)
+            if object_mask is not None:
+                keep &= object_mask[self.edge_objects[chunk_edges]]
+            if predicate_mask is not None:
+                keep &= predicate_mask[self.edge_predicates[chunk_edges]]
+            if subject_category_mask is not None:
+                keep &= subject_category_mask[self.edge_subjects[chunk_edges]]
+            if object_category_mask is not None:
+                keep &= object_category_mask[self.edge_objects[chunk_edges]]
+            return keep
+
+        return [self.get_edge(edge_index) for edge_index in filter_in_chunks(edges, keep_edges, limit)]
+
+    def match_nodes(self, categories: list = None, name_contains: str = None,
+                    limit: int = DEFAULT_NEIGHBOR_LIMIT) -> list:
+        """Nodes with one of the categories whose lowercase name contains name_contains."""
+        node_indices = np.flatnonzero(self.get_category_mask(categories)) if categories \
+            else np.arange(self.node_count)
+        matches = []
+        for node_index in node_indices:
+            if len(matches) >= limit:
+                break
+            if name_contains is None or name_contains.lower() in self.node_names[node_index].lower():
+                matches.append(self.get_node(node_index))
+        return matches
+
+
+def build_local_graph(nodes_input_file, edges_input_file, graph_output_file) -> LocalGraph:
+    print(f"Building local graph {graph_output_file}")
+    start_time = time.time()
+    local_graph = LocalGraph.build(
+        iterate_kgx_file(nodes_input_file, columns=["id", "name", "category", "description", "equivalent_identifiers"]),
+        iterate_kgx_file(edges_input_file, columns=["subject", "predicate", "object", "primary_knowledge_source"]))
+    local_graph.save(graph_output_file)
+    print(f"Loaded {local_graph.node_count} nodes and {local_graph.edge_count} edges "
+          f"in {time.time() - start_time:.1f}s")
+    return local_graph
+
+def load_local_graph(graph_id: str) -> LocalGraph:
+    """Load the local graph of a merged graph, building it first if it's missing or older than the graph files."""
+    graph_dir = get_kg_output_directory_path() / graph_id
+    graph_files = [get_kgx_file_path(graph_dir, graph_id, "nodes"), get_kgx_file_path(graph_dir, graph_id, "edges")]
+    graph_file_path = get_local_graph_path(graph_id)
+    if graph_file_path.exists() and \
+            all(graph_file_path.stat().st_mtime >= graph_file.stat().st_mtime for graph_file in graph_files):
+        return LocalGraph.load(graph_file_path)
+    return build_local_graph(*graph_files, graph_file_path)
+
+
+@click.command()
+@click.option('--graph-id', '-g', default="goldenKG", help='Graph to load, from data_output/kgs/<graph-id>.')
+@click.option('--neighbors', 'node_id', default=None, help='List the neighbors of a node id.')
+@click.option('--path', 'path_ids', nargs=2, default=None, help='Find a shortest path between two node ids.')
+@click.option('--category', 'categories', multiple=True, help='Only neighbors with this category (repeatable).')
+@click.option('--predicate', 'predicates', multiple=True, help='Only edges with this predicate (repeatable).')
+@click.option('--limit', default=DEFAULT_NEIGHBOR_LIMIT, show_default=True)
+@click.option('--max-hops', default=DEFAULT_MAX_HOPS, show_default=True)
+def local_graph(graph_id: str, node_id: str, path_ids: tuple, categories: tuple, predicates: tuple, limit: int,
+                max_hops: int):
+    graph = load_local_graph(graph_id)
+    if node_id:
+        start_time = time.perf_counter()
+        neighbors = graph.get_neighbors(node_id, predicates=list(predicates), categories=list(categories),
+                                        limit=limit)
+        for neighbor in neighbors:
+            print(f"{neighbor['direction']}\t{neighbor['predicate']}\t{neighbor['id']}\t{neighbor['name']}")
+        print(f"{len(neighbors)} neighbors in {(time.perf_counter() - start_time) * 1000:.2f}ms")
+    if path_ids:
+        path = graph.get_shortest_path(*path_ids, max_hops=max_hops, predicates=list(predicates))
+        if path is None:
+            print(f"No path within {max_hops} hops")
+            return
+        for node, edge in zip(path["nodes"], path["edges"] + [None]):
+            print(f"{node['id']}\t{node['name']}")
+            if edge:
+                print(f"  {edge['subject']} -[{edge['predicate']}]-> {edge['object']}")
+
+if __name__ == "__main__":
+    local_graph()
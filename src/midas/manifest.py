@@ -0,0 +1,143 @@
+import ast
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from midas.instrumentation import RunReport
+from midas.util import get_kg_output_directory_path
+
+MANIFEST_FILE_NAME = "build_manifest.json"
+
+
+def get_manifest_path() -> Path:
+    return get_kg_output_directory_path() / MANIFEST_FILE_NAME
+
+def get_module_source_files(*modules) -> list:
+    """
+    The source files of the modules and of every midas module they import, directly or through each other.
+    Used as stage inputs, so a change to a helper module rebuilds the stages that use it.
+    """
+    package_dir = Path(__file__).parent
+    pending_files = [Path(module.__file__) for module in modules]
+    source_files = set()
+    while pending_files:
+        source_file = pending_files.pop()
+        if source_file in source_files:
+            continue
+        source_files.add(source_file)
+        # imports inside functions count too, some modules import their helpers lazily
+        for node in ast.walk(ast.parse(source_file.read_text())):
+            if isinstance(node, ast.ImportFrom) and node.module:
+                module_names = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+            elif isinstance(node, ast.Import):
+                module_names = [alias.name for alias in node.names]
+            else:
+                continue
+            for module_name in module_names:
+                package_name, _, module_name = module_name.partition(".")
+                module_file = package_dir / f"{module_name.split('.')[0]}.py"
+                if package_name == "midas" and module_name and module_file.exists():
+                    pending_files.append(module_file)
+    return sorted(source_files)
+
+
+class BuildManifest:
+    """
+    Records the input hashes, parameters and outputs of every pipeline stage so that stages whose
+    inputs haven't changed since the last build can be skipped.
+
+    Stages are identified by a key like "convert:civic" or "merge:goldenKG". File hashes are cached by
+    size and modification time so unchanged files (including multi-GB intermediate files) are not re-read.
+    """
+    def __init__(self, manifest_path: Path = None, run_report: RunReport = None):
+        self.manifest_path = Path(manifest_path) if manifest_path else get_manifest_path()
+        # measures the stages that run (and notes the skipped ones) when given
+        self.run_report = run_report
+        self.stages = {}
+        self.file_hashes = {}
+        self.updated_stages = {}
+        self.updated_file_hashes = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            self.stages = manifest.get("stages", {})
+            self.file_hashes = manifest.get("file_hashes", {})
+
+    def file_hash(self, file_path) -> str | None:
+        file_path = str(file_path)
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        cached = self.file_hashes.get(file_path)
+        if cached and cached["size"] == file_stat.st_size and cached["mtime_ns"] == file_stat.st_mtime_ns:
+            return cached["sha256"]
+        with open(file_path, "rb") as file_to_hash:
+            file_digest = hashlib.file_digest(file_to_hash, "sha256").hexdigest()
+        hash_entry = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "sha256": file_digest}
+        self.file_hashes[file_path] = hash_entry
+        self.updated_file_hashes[file_path] = hash_entry
+        return file_digest
+
+    def is_up_to_date(self, stage: str, inputs: list, outputs: list, params: dict = None) -> bool:
+        stage_entry = self.stages.get(stage)
+        if not stage_entry:
+            return False
+        if stage_entry["params"] != (params or {}):
+            return False
+        if stage_entry["inputs"] != {str(path): self.file_hash(path) for path in inputs}:
+            return False
+        # outputs that were deleted or modified since they were built invalidate the stage too
+        output_hashes = {str(path): self.file_hash(path) for path in outputs}
+        if None in output_hashes.values():
+            return False
+        return stage_entry["outputs"] == output_hashes
+
+    def record(self, stage: str, inputs: list, outputs: list, params: dict = None):
+        stage_entry = {
+            "inputs": {str(path): self.file_hash(path) for path in inputs},
+            "params": params or {},
+            "outputs": {str(path): self.file_hash(path) for path in outputs}
+        }
+        self.stages[stage] = stage_entry
+        self.updated_stages[stage] = stage_entry
+
+    @staticmethod
+    def run_stage_function(stage: str, outputs: list, stage_function):
+        stage_function()
+        # a stage that silently produced nothing isn't recorded, otherwise it would be skipped from then on
+        missing_outputs = [str(path) for path in outputs if not Path(path).exists()]
+        if missing_outputs:
+            raise FileNotFoundError(f"Stage {stage} didn't write its outputs: {', '.join(missing_outputs)}")
+
+    def run_stage(self, stage: str, inputs: list, outputs: list, stage_function, params: dict = None,
+                  force: bool = False) -> bool:
+        if not force and self.is_up_to_date(stage, inputs, outputs, params):
+            print(f"Skipping {stage}, inputs are unchanged since the last build.")
+            if self.run_report:
+                self.run_report.record_skipped(stage)
+            return False
+        if self.run_report:
+            with self.run_report.measure(stage, inputs=inputs, outputs=outputs):
+                self.run_stage_function(stage, outputs, stage_function)
+        else:
+            self.run_stage_function(stage, outputs, stage_function)
+        self.record(stage, inputs, outputs, params)
+        return True
+
+    def get_updates(self) -> dict:
+        # used to hand results from worker processes back to the manifest owned by the main process
+        return {"stages": self.updated_stages, "file_hashes": self.updated_file_hashes}
+
+    def apply_updates(self, updates: dict):
+        self.stages.update(updates["stages"])
+        self.file_hashes.update(updates["file_hashes"])
+        if self.run_report and updates.get("run_report"):
+            self.run_report.apply_updates(updates["run_report"])
+
+    def save(self):
+        temp_manifest_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(temp_manifest_path, "w") as manifest_file:
+            json.dump({"stages": self.stages, "file_hashes": self.file_hashes}, manifest_file, indent=4)
+        os.replace(temp_manifest_path, self.manifest_path)
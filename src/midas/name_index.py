@@ -0,0 +1,303 @@
+import bisect
+import itertools
+import re
+import unicodedata
+
+from collections import defaultdict
+from pathlib import Path
+
+import click
+import numpy as np
+
+from midas.columnar import PROPERTIES_COLUMN, get_kgx_file_path, iterate_kgx_file
+from midas.util import get_kg_output_directory_path
+
+NAME_INDEX_FILE_SUFFIX = "_name_index.npz"
+NON_ALPHANUMERIC_PATTERN = re.compile(r"[^0-9a-z]+")
+NGRAM_SIZE = 3
+DEFAULT_SEARCH_LIMIT = 10
+# match types, from best to worst, results are returned in this order
+EXACT_MATCH = "exact"
+PREFIX_MATCH = "prefix"
+TOKEN_PREFIX_MATCH = "token_prefix"
+SUBSTRING_MATCH = "substring"
+
+
+def get_name_index_path(graph_id: str) -> Path:
+    return get_kg_output_directory_path() / graph_id / f"{graph_id}{NAME_INDEX_FILE_SUFFIX}"
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and replace punctuation with single spaces."""
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(character for character in name if not unicodedata.combining(character))
+    return NON_ALPHANUMERIC_PATTERN.sub(" ", name.lower()).strip()
+
+def get_ngrams(token: str) -> set:
+    return {token[i:i + NGRAM_SIZE] for i in range(len(token) - NGRAM_SIZE + 1)}
+
+def get_prefix_range(sorted_strings, prefix: str) -> range:
+    # in a sorted list the strings starting with prefix are contiguous, like the leaves under a trie node
+    start = bisect.bisect_left(sorted_strings, prefix)
+    return range(start, bisect.bisect_left(sorted_strings, prefix + "\U0010ffff", lo=start))
+
+def get_offsets(lengths) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+class StringTable:
+    """An immutable list of strings stored as one utf-8 buffer and offsets, compact to store and quick to load."""
+    def __init__(self, buffer: bytes, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: list):
+        encoded_strings = [string.encode() for string in strings]
+        return cls(b"".join(encoded_strings), get_offsets([len(encoded) for encoded in encoded_strings]))
+
+    @classmethod
+    def from_arrays(cls, arrays, name: str):
+        return cls(arrays[f"{name}_buffer"].tobytes(), arrays[f"{name}_offsets"])
+
+    def to_arrays(self, name: str) -> dict:
+        return {f"{name}_buffer": np.frombuffer(self.buffer, dtype=np.uint8), f"{name}_offsets": self.offsets}
+
+    def get_lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode()
+
+
+class Postings:
+    """Sorted integer posting lists in one array (CSR layout), list i is values[offsets[i]:offsets[i + 1]]."""
+    def __init__(self, offsets: np.ndarray, values: np.ndarray):
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def from_lists(cls, posting_lists: list):
+        offsets = get_offsets([len(posting_list) for posting_list in posting_lists])
+        values = np.fromiter(itertools.chain.from_iterable(posting_lists), dtype=np.int32, count=int(offsets[-1]))
+        return cls(offsets, values)
+
+    @classmethod
+    def from_arrays(cls, arrays, name: str):
+        return cls(arrays[f"{name}_offsets"], arrays[f"{name}_values"])
+
+    def to_arrays(self, name: str) -> dict:
+        return {f"{name}_offsets": self.offsets, f"{name}_values": self.values}
+
+    def get(self, index: int) -> np.ndarray:
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_union(self, indices) -> np.ndarray:
+        return np.unique(np.concatenate([self.get(index) for index in indices])) if len(indices) \
+            else np.empty(0, dtype=np.int32)
+
+
+class NameIndex:
+    """
+    Name lookup for the nodes of a merged graph, without scanning the graph.
+    Names (and synonyms) are normalized with normalize_name, and looked up in order:
+    - exact and prefix matches of the whole name, from the sorted names
+    - prefix matches of every word of the query, from the sorted name tokens and their node postings
+    - substring matches of every word of the query, from the trigram postings of the name tokens
+    Everything is held in numpy arrays and saved as one npz file.
+    """
+    def __init__(self, arrays):
+        self.node_ids = StringTable.from_arrays(arrays, "node_ids")
+        self.node_names = StringTable.from_arrays(arrays, "node_names")
+        self.category_lists = StringTable.from_arrays(arrays, "category_lists")
+        self.node_category_codes = arrays["node_category_codes"]
+        self.name_keys = StringTable.from_arrays(arrays, "name_keys")
+        self.name_nodes = arrays["name_nodes"]
+        self.tokens = StringTable.from_arrays(arrays, "tokens")
+        self.token_nodes = Postings.from_arrays(arrays, "token_nodes")
+        self.ngrams = StringTable.from_arrays(arrays, "ngrams")
+        self.ngram_tokens = Postings.from_arrays(arrays, "ngram_tokens")
+        self.node_name_lengths = self.node_names.get_lengths()
+        self.node_indices_by_id = None
+
+    @classmethod
+    def build(cls, nodes):
+        node_ids, node_names, node_category_codes = [], [], []
+        category_codes = {}
+        name_entries = []
+        token_nodes = defaultdict(list)
+        for node in nodes:
+            names = [node.get("name")] + list(node.get("synonym") or [])
+            name_keys = {normalize_name(name) for name in names if name} - {""}
+            if not name_keys:
+                continue
+            node_index = len(node_ids)
+            node_ids.append(node["id"])
+            node_names.append(node.get("name") or "")
+            categories = node.get("category") or []
+            categories = [categories] if isinstance(categories, str) else categories
+            node_category_codes.append(category_codes.setdefault("|".join(categories), len(category_codes)))
+            name_entries.extend((name_key, node_index) for name_key in name_keys)
+            # node indices are increasing, so every posting list comes out sorted
+            for token in {token for name_key in name_keys for token in name_key.split()}:
+                token_nodes[token].append(node_index)
+        name_entries.sort()
+        sorted_tokens = sorted(token_nodes)
+        ngram_tokens = defaultdict(list)
+        for token_index, token in enumerate(sorted_tokens):
+            for ngram in get_ngrams(token):
+                ngram_tokens[ngram].append(token_index)
+        sorted_ngrams = sorted(ngram_tokens)
+
+        arrays = {
+            **StringTable.from_strings(node_ids).to_arrays("node_ids"),
+            **StringTable.from_strings(node_names).to_arrays("node_names"),
+            **StringTable.from_strings(list(category_codes)).to_arrays("category_lists"),
+            "node_category_codes": np.array(node_category_codes, dtype=np.int32),
+            **StringTable.from_strings([name_key for name_key, _ in name_entries]).to_arrays("name_keys"),
+            "name_nodes": np.array([node_index for _, node_index in name_entries], dtype=np.int32),
+            **StringTable.from_strings(sorted_tokens).to_arrays("tokens"),
+            **Postings.from_lists([token_nodes[token] for token in sorted_tokens]).to_arrays("token_nodes"),
+            **StringTable.from_strings(sorted_ngrams).to_arrays("ngrams"),
+            **Postings.from_lists([ngram_tokens[ngram] for ngram in sorted_ngrams]).to_arrays("ngram_tokens")
+        }
+        return cls(arrays)
+
+    @classmethod
+    def load(cls, index_file_path):
+        with np.load(index_file_path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def save(self, index_file_path):
+        np.savez(index_file_path,
+                 **self.node_ids.to_arrays("node_ids"),
+                 **self.node_names.to_arrays("node_names"),
+                 **self.category_lists.to_arrays("category_lists"),
+                 node_category_codes=self.node_category_codes,
+                 **self.name_keys.to_arrays("name_keys"),
+                 name_nodes=self.name_nodes,
+                 **self.tokens.to_arrays("tokens"),
+                 **self.token_nodes.to_arrays("token_nodes"),
+                 **self.ngrams.to_arrays("ngrams"),
+                 **self.ngram_tokens.to_arrays("ngram_tokens"))
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def get_node(self, node_index: int) -> dict:
+        category_list = self.category_lists[self.node_category_codes[node_index]]
+        return {"id": self.node_ids[node_index],
+                "name": self.node_names[node_index],
+                "categories": category_list.split("|") if category_list else []}
+
+    def get_node_by_id(self, node_id: str) -> dict:
+        if self.node_indices_by_id is None:
+            self.node_indices_by_id = {self.node_ids[index]: index for index in range(len(self))}
+        node_index = self.node_indices_by_id.get(node_id)
+        return self.get_node(node_index) if node_index is not None else None
+
+    def get_name_matches(self, name_range: range) -> np.ndarray:
+        return np.unique(self.name_nodes[name_range.start:name_range.stop])
+
+    def get_token_prefix_matches(self, query_token: str) -> np.ndarray:
+        return self.token_nodes.get_union(get_prefix_range(self.tokens, query_token))
+
+    def get_token_substring_matches(self, query_token: str) -> np.ndarray:
+        if len(query_token) < NGRAM_SIZE:
+            return self.get_token_prefix_matches(query_token)
+        token_indices = None
+        for ngram in get_ngrams(query_token):
+            ngram_range = get_prefix_range(self.ngrams, ngram)
+            if not ngram_range or self.ngrams[ngram_range.start] != ngram:
+                return np.empty(0, dtype=np.int32)
+            ngram_token_indices = self.ngram_tokens.get(ngram_range.start)
+            token_indices = ngram_token_indices if token_indices is None \
+                else np.intersect1d(token_indices, ngram_token_indices, assume_unique=True)
+        # the trigrams can all be present without the query being a substring
+        token_indices = [index for index in token_indices if query_token in self.tokens[index]]
+        return self.token_nodes.get_union(token_indices)
+
+    def get_all_token_matches(self, query_tokens: list, get_token_matches) -> np.ndarray:
+        node_indices = None
+        for query_token in query_tokens:
+            token_matches = get_token_matches(query_token)
+            node_indices = token_matches if node_indices is None \
+                else np.intersect1d(node_indices, token_matches, assume_unique=True)
+            if not len(node_indices):
+                break
+        return node_indices
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, categories: list = None) -> list:
+        """
+        Return up to limit nodes matching query as dictionaries with id, name, categories and match type,
+        best matches first and shorter names first within a match type.
+        If categories are given, only nodes with at least one of them are returned.
+        """
+        normalized_query = normalize_name(query)
+        if not normalized_query or limit <= 0:
+            return []
+        category_codes = None
+        if categories:
+            categories = set(categories)
+            category_codes = np.array([code for code in range(len(self.category_lists))
+                                       if categories & set(self.category_lists[code].split("|"))], dtype=np.int32)
+        query_tokens = normalized_query.split()
+
+        matches = []
+        selected = np.empty(0, dtype=np.int32)
+        match_finders = [
+            (EXACT_MATCH, lambda: self.get_name_matches(range(
+                bisect.bisect_left(self.name_keys, normalized_query),
+                bisect.bisect_right(self.name_keys, normalized_query)))),
+            (PREFIX_MATCH, lambda: self.get_name_matches(get_prefix_range(self.name_keys, normalized_query))),
+            (TOKEN_PREFIX_MATCH, lambda: self.get_all_token_matches(query_tokens, self.get_token_prefix_matches)),
+            (SUBSTRING_MATCH, lambda: self.get_all_token_matches(query_tokens, self.get_token_substring_matches))
+        ]
+        for match_type, find_matches in match_finders:
+            node_indices = find_matches()
+            node_indices = node_indices[~np.isin(node_indices, selected)]
+            if category_codes is not None:
+                node_indices = node_indices[np.isin(self.node_category_codes[node_indices], category_codes)]
+            # stable sort keeps ties in graph order
+            node_indices = node_indices[np.argsort(self.node_name_lengths[node_indices], kind="stable")]
+            node_indices = node_indices[:limit - len(matches)]
+            matches.extend({**self.get_node(node_index), "match": match_type} for node_index in node_indices)
+            selected = np.concatenate([selected, node_indices])
+            if len(matches) >= limit:
+                break
+        return matches
+
+    def get_node_ids(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, categories: list = None) -> list:
+        return [match["id"] for match in self.search(query, limit=limit, categories=categories)]
+
+
+def build_name_index(nodes_input_file, index_output_file) -> NameIndex:
+    print(f"Building name index {index_output_file}")
+    name_index = NameIndex.build(iterate_kgx_file(nodes_input_file,
+                                                  columns=["id", "name", "category", PROPERTIES_COLUMN]))
+    name_index.save(index_output_file)
+    print(f"Indexed the names of {len(name_index)} nodes, {len(name_index.tokens)} distinct tokens")
+    return name_index
+
+
+@click.command()
+@click.option('--graph-id', '-g', default="goldenKG", help='Graph to index, from data_output/kgs/<graph-id>.')
+@click.option('--nodes-in', default=None, help='KGX nodes file (jsonl or parquet), defaults to the graph nodes file.')
+@click.option('--search', 'query', default=None, help='Search an existing index instead of building it.')
+@click.option('--category', 'categories', multiple=True, help='Only return nodes with this category (repeatable).')
+@click.option('--limit', default=DEFAULT_SEARCH_LIMIT, show_default=True)
+def name_index(graph_id: str, nodes_in: str, query: str, categories: tuple, limit: int):
+    index_file_path = get_name_index_path(graph_id)
+    if query:
+        for match in NameIndex.load(index_file_path).search(query, limit=limit, categories=list(categories)):
+            print(f"{match['id']}\t{match['name']}\t{match['match']}\t{','.join(match['categories'])}")
+        return
+    graph_dir = get_kg_output_directory_path() / graph_id
+    build_name_index(nodes_in or get_kgx_file_path(graph_dir, graph_id, "nodes"), index_file_path)
+
+if __name__ == "__main__":
+    name_index()
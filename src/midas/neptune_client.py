@@ -0,0 +1,215 @@
+import asyncio
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+import httpx
+
+NEPTUNE_SERVICE_NAME = "neptune-db"
+DEFAULT_REGION = "us-east-1"
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_CONNECTIONS = 10
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+class NeptuneQueryError(Exception):
+    def __init__(self, message: str, status_code: int = None, response_text: str = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_text = response_text
+
+
+class NeptuneRequestSigner:
+    """
+    Signs requests with SigV4 for IAM authenticated Neptune clusters.
+    boto3 resolves the credentials once (profile, environment, instance role, ...) and refreshes them
+    only when they are about to expire, instead of resolving them again for every request.
+    """
+    def __init__(self, region: str = DEFAULT_REGION, credentials=None):
+        # boto3 is only needed for IAM authentication, not for local stand-ins
+        from botocore.auth import SigV4Auth
+        from botocore.awsrequest import AWSRequest
+        if credentials is None:
+            import boto3
+            credentials = boto3.Session().get_credentials()
+            if credentials is None:
+                raise NeptuneQueryError("No AWS credentials found to sign Neptune requests")
+        self.region = region
+        self.credentials = credentials
+        self.sigv4_auth_class = SigV4Auth
+        self.aws_request_class = AWSRequest
+
+    def sign(self, method: str, url: str, body: bytes = None, headers: dict = None) -> dict:
+        frozen_credentials = self.credentials.get_frozen_credentials() \
+            if hasattr(self.credentials, "get_frozen_credentials") else self.credentials
+        aws_request = self.aws_request_class(method=method, url=url, data=body, headers=dict(headers or {}))
+        self.sigv4_auth_class(frozen_credentials, NEPTUNE_SERVICE_NAME, self.region).add_auth(aws_request)
+        return dict(aws_request.headers.items())
+
+
+def get_query_body(query: str, parameters: dict = None) -> bytes:
+    # the openCypher HTTP endpoint takes parameters as a json string, which lets Neptune reuse the query plan
+    form = {"query": query}
+    if parameters:
+        form["parameters"] = json.dumps(parameters)
+    return urlencode(form).encode()
+
+def parse_response(response: httpx.Response) -> dict:
+    if response.status_code >= 400:
+        raise NeptuneQueryError(f"Neptune request failed with status {response.status_code}: {response.text[:500]}",
+                                status_code=response.status_code, response_text=response.text)
+    return response.json() if response.content else {}
+
+
+class BaseNeptuneClient:
+    """Request preparation and signing shared by the sync and asyncio Neptune clients."""
+    def __init__(self, endpoint: str, region: str = DEFAULT_REGION, sign: bool = True, credentials=None,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        self.endpoint = endpoint.rstrip("/")
+        self.signer = NeptuneRequestSigner(region, credentials) if sign else None
+        self.max_connections = max_connections
+        self.http_limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+    def prepare_request(self, method: str, path: str, body: bytes = None, json_body=None,
+                        headers: dict = None) -> tuple:
+        url = f"{self.endpoint}{path}"
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        if self.signer:
+            headers = self.signer.sign(method, url, body, headers)
+        return url, body, headers
+
+
+class NeptuneClient(BaseNeptuneClient):
+    """
+    openCypher and management API client for Neptune with a pooled keep-alive HTTP session.
+    endpoint is the cluster url, e.g. https://cluster.region.neptune.amazonaws.com:8182
+    With sign=False requests are sent unsigned, for clusters without IAM auth and local stand-ins.
+    """
+    def __init__(self, endpoint: str, region: str = DEFAULT_REGION, sign: bool = True, credentials=None,
+                 timeout: float = DEFAULT_TIMEOUT, max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        super().__init__(endpoint, region=region, sign=sign, credentials=credentials, max_connections=max_connections)
+        self.http_client = httpx.Client(timeout=timeout, limits=self.http_limits)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def request(self, method: str, path: str, body: bytes = None, json_body=None, headers: dict = None) -> dict:
+        url, body, headers = self.prepare_request(method, path, body, json_body, headers)
+        try:
+            response = self.http_client.request(method, url, content=body, headers=headers)
+        except httpx.HTTPError as e:
+            raise NeptuneQueryError(f"Neptune request to {url} failed: {e!r}") from e
+        return parse_response(response)
+
+    def execute_query(self, query: str, parameters: dict = None) -> dict:
+        return self.request("POST", "/openCypher", body=get_query_body(query, parameters),
+                            headers={"Content-Type": FORM_CONTENT_TYPE})
+
+    def execute_queries(self, queries: list) -> list:
+        """
+        Run independent queries concurrently over the pooled connections, results in query order.
+        Queries are query strings or (query, parameters) tuples.
+        """
+        queries = [query if isinstance(query, tuple) else (query,) for query in queries]
+        with ThreadPoolExecutor(max_workers=min(len(queries), self.max_connections) or 1) as executor:
+            return list(executor.map(lambda query: self.execute_query(*query), queries))
+
+    def get_status(self) -> dict:
+        return self.request("GET", "/status")
+
+    def close(self):
+        self.http_client.close()
+
+
+class AsyncNeptuneClient(BaseNeptuneClient):
+    """asyncio variant of NeptuneClient."""
+    def __init__(self, endpoint: str, region: str = DEFAULT_REGION, sign: bool = True, credentials=None,
+                 timeout: float = DEFAULT_TIMEOUT, max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        super().__init__(endpoint, region=region, sign=sign, credentials=credentials, max_connections=max_connections)
+        self.http_client = httpx.AsyncClient(timeout=timeout, limits=self.http_limits)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def request(self, method: str, path: str, body: bytes = None, json_body=None, headers: dict = None) -> dict:
+        url, body, headers = self.prepare_request(method, path, body, json_body, headers)
+        try:
+            response = await self.http_client.request(method, url, content=body, headers=headers)
+        except httpx.HTTPError as e:
+            raise NeptuneQueryError(f"Neptune request to {url} failed: {e!r}") from e
+        return parse_response(response)
+
+    async def execute_query(self, query: str, parameters: dict = None) -> dict:
+        return await self.request("POST", "/openCypher", body=get_query_body(query, parameters),
+                                  headers={"Content-Type": FORM_CONTENT_TYPE})
+
+    async def execute_queries(self, queries: list) -> list:
+        queries = [query if isinstance(query, tuple) else (query,) for query in queries]
+        return await asyncio.gather(*[self.execute_query(*query) for query in queries])
+
+    async def get_status(self) -> dict:
+        return await self.request("GET", "/status")
+
+    async def close(self):
+        await self.http_client.aclose()
+
+
+def get_opencypher_stand_in_handler(answer_query):
+    class OpenCypherStandInHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, response_json, status: int = 200):
+            response_body = json.dumps(response_json).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response_body)))
+            self.end_headers()
+            self.wfile.write(response_body)
+
+        def do_GET(self):
+            if self.path.startswith("/status"):
+                self.send_json({"status": "healthy"})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            if not self.path.startswith("/openCypher"):
+                self.send_error(404)
+                return
+            request_body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                request_json = json.loads(request_body)
+                query, parameters = request_json.get("query"), request_json.get("parameters") or {}
+            else:
+                form = parse_qs(request_body)
+                query = form.get("query", [""])[0]
+                parameters = json.loads(form["parameters"][0]) if "parameters" in form else {}
+            if isinstance(parameters, str):
+                parameters = json.loads(parameters)
+            try:
+                self.send_json({"results": answer_query(query, parameters)})
+            except Exception as e:
+                self.send_json({"code": "BadRequestException", "detailedMessage": str(e)}, status=400)
+
+    return OpenCypherStandInHandler
+
+def serve_opencypher_stand_in(answer_query=None, host: str = "127.0.0.1", port: int = 8182) -> ThreadingHTTPServer:
+    """
+    A local stand-in for the Neptune openCypher endpoint, for testing without a cluster.
+    answer_query(query, parameters) returns the list of result rows, by default every query returns no rows.
+    Use it with NeptuneClient(f"http://{host}:{port}", sign=False).
+    """
+    answer_query = answer_query or (lambda query, parameters: [])
+    return ThreadingHTTPServer((host, port), get_opencypher_stand_in_handler(answer_query))
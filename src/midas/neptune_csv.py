@@ -0,0 +1,229 @@
+import csv
+import json
+import re
+
+from pathlib import Path
+
+import click
+
+from midas.columnar import PROPERTIES_COLUMN, get_kgx_columns, get_kgx_file_path, iterate_kgx_file
+from midas.util import get_kg_output_directory_path
+
+# Neptune openCypher CSV columns: (neptune header, KGX property, value type)
+# String[] isn't supported by the openCypher format, lists are written as semicolon delimited strings
+NEPTUNE_NODE_COLUMNS = [
+    (":ID", "id", "string"),
+    ("name:String", "name", "string"),
+    (":LABEL", "category", "labels"),
+    ("equivalent_identifiers:String", "equivalent_identifiers", "string[]"),
+    ("NCBITaxon:String", "NCBITaxon", "string"),
+    ("information_content:Double", "information_content", "double"),
+    ("description:String", "description", "string"),
+    ("hgvs:String", "hgvs", "string[]"),
+    ("robokop_variant_id:String", "robokop_variant_id", "string")
+]
+NEPTUNE_EDGE_COLUMNS = [
+    (":START_ID", "subject", "string"),
+    (":END_ID", "object", "string"),
+    (":TYPE", "predicate", "type"),
+    ("primary_knowledge_source:String", "primary_knowledge_source", "string"),
+    ("knowledge_level:String", "knowledge_level", "string"),
+    ("agent_type:String", "agent_type", "string"),
+    ("original_subject:String", "original_subject", "string"),
+    ("original_object:String", "original_object", "string"),
+    ("description:String", "description", "string"),
+    ("NCBITaxon:String", "NCBITaxon", "string"),
+    ("publications:String", "publications", "string[]"),
+    ("object_aspect_qualifier:String", "object_aspect_qualifier", "string"),
+    ("object_direction_qualifier:String", "object_direction_qualifier", "string"),
+    ("qualified_predicate:String", "qualified_predicate", "string"),
+    ("most_severe_consequence:String", "most_severe_consequence", "string"),
+    ("p_value:Double", "p_value", "double")
+]
+NEPTUNE_DELIMITER = ";"
+DEFAULT_LABEL = "Node"
+DEFAULT_EDGE_TYPE = "RELATED_TO"
+DEFAULT_BATCH_SIZE = 10_000
+NEPTUNE_FILES_INDEX_SUFFIX = "_neptune_files.json"
+
+# values that arrive as one string instead of a list, e.g. concatenated labels like "biolink:Genebiolink:NamedThing"
+LABEL_PATTERN = re.compile(r"biolink:[A-Za-z]+")
+LIST_SPLITTER = re.compile(r"[;|]")
+
+
+def get_neptune_columns(kind: str) -> list:
+    if kind == "nodes":
+        return NEPTUNE_NODE_COLUMNS
+    elif kind == "edges":
+        return NEPTUNE_EDGE_COLUMNS
+    raise ValueError(f"Unknown KGX file kind: {kind}, expected nodes or edges")
+
+def format_string(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return NEPTUNE_DELIMITER.join(map(str, value))
+    return str(value)
+
+def format_string_list(value) -> str:
+    if not value:
+        return ""
+    if isinstance(value, str):
+        return NEPTUNE_DELIMITER.join(part.strip() for part in LIST_SPLITTER.split(value) if part.strip())
+    return NEPTUNE_DELIMITER.join(map(str, value))
+
+def format_labels(value) -> str:
+    if isinstance(value, str):
+        value = LABEL_PATTERN.findall(value)
+    return NEPTUNE_DELIMITER.join(value) if value else DEFAULT_LABEL
+
+def format_type(value) -> str:
+    return value or DEFAULT_EDGE_TYPE
+
+def format_double(value) -> str:
+    return "" if value is None or value == "" else str(float(value))
+
+VALUE_FORMATTERS = {
+    "string": format_string,
+    "string[]": format_string_list,
+    "labels": format_labels,
+    "type": format_type,
+    "double": format_double
+}
+
+def compile_row_function(columns: list):
+    """Turn a column spec into a function mapping a KGX record to a Neptune CSV row."""
+    getters = [(kgx_property, VALUE_FORMATTERS[value_type]) for _, kgx_property, value_type in columns]
+
+    def to_row(record: dict) -> list:
+        return [formatter(record.get(kgx_property)) for kgx_property, formatter in getters]
+    return to_row
+
+def get_parquet_read_columns(columns: list, kind: str) -> list:
+    # only read the parquet columns the spec needs, plus the json properties column for anything without its own column
+    typed_columns = get_kgx_columns(kind)
+    read_columns = [kgx_property for _, kgx_property, _ in columns if kgx_property in typed_columns]
+    if any(kgx_property not in typed_columns for _, kgx_property, _ in columns):
+        read_columns.append(PROPERTIES_COLUMN)
+    return read_columns
+
+
+class NeptuneCSVWriter:
+    """
+    Writes rows to a Neptune bulk load CSV file in batches. With max_rows_per_file the output is split into
+    numbered shards (nodes_0000.csv, nodes_0001.csv, ...) that the bulk loader can ingest in parallel.
+    """
+    def __init__(self, output_file_path, header: list, max_rows_per_file: int = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.output_file_path = Path(output_file_path)
+        self.header = header
+        self.max_rows_per_file = max_rows_per_file
+        self.batch_size = batch_size
+        self.output_files = []
+        self.output_file = None
+        self.csv_writer = None
+        self.rows_in_file = 0
+        self.rows_written = 0
+        self.batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open_next_file(self):
+        if self.output_file:
+            self.output_file.close()
+        if self.max_rows_per_file:
+            file_path = self.output_file_path.with_name(
+                f"{self.output_file_path.stem}_{len(self.output_files):04d}{self.output_file_path.suffix}")
+        else:
+            file_path = self.output_file_path
+        self.output_file = open(file_path, "w", encoding="utf-8", newline="")
+        self.csv_writer = csv.writer(self.output_file)
+        self.csv_writer.writerow(self.header)
+        self.output_files.append(file_path)
+        self.rows_in_file = 0
+
+    def write(self, row: list):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch = self.batch
+        self.batch = []
+        while batch or not self.output_file:
+            if not self.output_file or (self.max_rows_per_file and self.rows_in_file >= self.max_rows_per_file):
+                self.open_next_file()
+            rows_to_write = batch
+            if self.max_rows_per_file:
+                rows_to_write = batch[:self.max_rows_per_file - self.rows_in_file]
+            self.csv_writer.writerows(rows_to_write)
+            self.rows_in_file += len(rows_to_write)
+            self.rows_written += len(rows_to_write)
+            batch = batch[len(rows_to_write):]
+
+    def close(self):
+        if self.batch or not self.output_file:
+            self.flush()
+        if self.output_file:
+            self.output_file.close()
+
+
+def write_neptune_csv(records, kind: str, output_file_path, max_rows_per_file: int = None,
+                      columns: list = None) -> list:
+    columns = columns or get_neptune_columns(kind)
+    to_row = compile_row_function(columns)
+    with NeptuneCSVWriter(output_file_path, [header for header, _, _ in columns],
+                          max_rows_per_file=max_rows_per_file) as neptune_writer:
+        for record in records:
+            neptune_writer.write(to_row(record))
+    print(f"Wrote {neptune_writer.rows_written} {kind} to {len(neptune_writer.output_files)} Neptune CSV file(s)")
+    return neptune_writer.output_files
+
+def convert_kgx_file_to_neptune_csv(input_file_path, kind: str, output_file_path, max_rows_per_file: int = None,
+                                    columns: list = None) -> list:
+    """Convert a KGX nodes or edges file (jsonl or parquet) to Neptune openCypher CSV in a single pass."""
+    columns = columns or get_neptune_columns(kind)
+    read_columns = get_parquet_read_columns(columns, kind) if Path(input_file_path).suffix == ".parquet" else None
+    return write_neptune_csv(iterate_kgx_file(input_file_path, columns=read_columns), kind, output_file_path,
+                             max_rows_per_file=max_rows_per_file, columns=columns)
+
+def convert_kgx_to_neptune_csv(nodes_input_file, edges_input_file, nodes_output_file, edges_output_file,
+                               max_rows_per_file: int = None, index_file=None) -> dict:
+    print(f"Writing Neptune CSV files from {nodes_input_file} and {edges_input_file}")
+    neptune_files = {
+        "nodes": [str(path) for path in convert_kgx_file_to_neptune_csv(nodes_input_file, "nodes", nodes_output_file,
+                                                                        max_rows_per_file=max_rows_per_file)],
+        "edges": [str(path) for path in convert_kgx_file_to_neptune_csv(edges_input_file, "edges", edges_output_file,
+                                                                        max_rows_per_file=max_rows_per_file)]
+    }
+    # the number of shards isn't known up front, the index lists them for the loader
+    if index_file:
+        with open(index_file, "w") as index_out:
+            json.dump(neptune_files, index_out, indent=4)
+    return neptune_files
+
+
+@click.command()
+@click.option('--graph-id', '-g', default="goldenKG", help='Graph to convert, from data_output/kgs/<graph-id>.')
+@click.option('--nodes-in', default=None, help='KGX nodes file (jsonl or parquet), defaults to the graph nodes file.')
+@click.option('--edges-in', default=None, help='KGX edges file (jsonl or parquet), defaults to the graph edges file.')
+@click.option('--output-dir', default=None, help='Output directory, defaults to data_output/kgs/<graph-id>/neptune.')
+@click.option('--shard-rows', default=None, type=int,
+              help='Split the output into files of at most this many rows, for parallel bulk loading.')
+def convert_to_neptune(graph_id: str, nodes_in: str, edges_in: str, output_dir: str, shard_rows: int):
+    graph_dir = get_kg_output_directory_path() / graph_id
+    output_dir = Path(output_dir) if output_dir else graph_dir / "neptune"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    convert_kgx_to_neptune_csv(nodes_in or get_kgx_file_path(graph_dir, graph_id, "nodes"),
+                               edges_in or get_kgx_file_path(graph_dir, graph_id, "edges"),
+                               output_dir / f"{graph_id}_nodes_neptune.csv",
+                               output_dir / f"{graph_id}_edges_neptune.csv",
+                               max_rows_per_file=shard_rows,
+                               index_file=output_dir / f"{graph_id}{NEPTUNE_FILES_INDEX_SUFFIX}")
+
+if __name__ == "__main__":
+    convert_to_neptune()
@@ -0,0 +1,260 @@
+import json
+import sqlite3
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+
+import click
+
+from midas.util import get_data_output_directory_path
+
+NODE_NORM_NAMESPACE = "nodenorm"
+VARIANT_NORM_NAMESPACE = "variants"
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10_000_000
+# stay under sqlite's limit on the number of query parameters
+QUERY_BATCH_SIZE = 500
+
+
+def get_normalization_cache_path() -> Path:
+    return get_data_output_directory_path() / "normalization_cache.sqlite"
+
+
+class NormalizationCache:
+    """
+    Persistent sqlite cache of identifier normalization results, keyed by curie and a namespace that includes
+    the normalizer version, so a new Node Normalizer release never serves stale results.
+    Entries expire after ttl_seconds and the least recently used entries are evicted past max_entries.
+    Curies the Node Normalizer doesn't know are cached too (as null), they are just as expensive to look up.
+    """
+    def __init__(self,
+                 cache_path: Path = None,
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.cache_path = Path(cache_path) if cache_path else get_normalization_cache_path()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # several sources may be normalized in parallel processes that share the cache
+        self.connection = sqlite3.connect(self.cache_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS normalization_cache (
+                                       namespace TEXT NOT NULL,
+                                       curie TEXT NOT NULL,
+                                       result TEXT,
+                                       created_at REAL NOT NULL,
+                                       last_used_at REAL NOT NULL,
+                                       PRIMARY KEY (namespace, curie)) WITHOUT ROWID""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS normalization_cache_last_used "
+                                "ON normalization_cache (last_used_at)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_batch(self, namespace: str, curies: list) -> dict:
+        now = time.time()
+        results = {}
+        unique_curies = list(dict.fromkeys(curies))
+        for i in range(0, len(unique_curies), QUERY_BATCH_SIZE):
+            curie_batch = unique_curies[i:i + QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(curie_batch))
+            rows = self.connection.execute(f"SELECT curie, result FROM normalization_cache "
+                                           f"WHERE namespace = ? AND created_at >= ? AND curie IN ({placeholders})",
+                                           [namespace, now - self.ttl_seconds, *curie_batch]).fetchall()
+            for curie, result in rows:
+                results[curie] = json.loads(result)
+        if results:
+            self.connection.executemany("UPDATE normalization_cache SET last_used_at = ? "
+                                        "WHERE namespace = ? AND curie = ?",
+                                        [(now, namespace, curie) for curie in results])
+            self.connection.commit()
+        self.hits += len(results)
+        self.misses += len(unique_curies) - len(results)
+        return results
+
+    def set_batch(self, namespace: str, results: dict):
+        now = time.time()
+        self.connection.executemany("INSERT OR REPLACE INTO normalization_cache "
+                                    "(namespace, curie, result, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                                    [(namespace, curie, json.dumps(result), now, now)
+                                     for curie, result in results.items()])
+        self.connection.commit()
+
+    def get_namespace_entries(self, namespace: str) -> dict:
+        rows = self.connection.execute("SELECT curie, result FROM normalization_cache "
+                                       "WHERE namespace = ? AND created_at >= ?",
+                                       [namespace, time.time() - self.ttl_seconds])
+        return {curie: json.loads(result) for curie, result in rows}
+
+    def get_latest_namespace(self, prefix: str) -> str | None:
+        row = self.connection.execute("SELECT namespace FROM normalization_cache WHERE namespace LIKE ? "
+                                      "ORDER BY last_used_at DESC LIMIT 1", [f"{prefix}:%"]).fetchone()
+        return row[0] if row else None
+
+    def evict(self) -> int:
+        expired = self.connection.execute("DELETE FROM normalization_cache WHERE created_at < ?",
+                                          [time.time() - self.ttl_seconds]).rowcount
+        entry_count = self.connection.execute("SELECT count(*) FROM normalization_cache").fetchone()[0]
+        least_recently_used = 0
+        if entry_count > self.max_entries:
+            least_recently_used = self.connection.execute(
+                "DELETE FROM normalization_cache WHERE (namespace, curie) IN "
+                "(SELECT namespace, curie FROM normalization_cache ORDER BY last_used_at LIMIT ?)",
+                [entry_count - self.max_entries]).rowcount
+        self.connection.commit()
+        return expired + least_recently_used
+
+    def get_stats(self) -> dict:
+        namespace_counts = self.connection.execute("SELECT namespace, count(*) FROM normalization_cache "
+                                                   "GROUP BY namespace").fetchall()
+        return {"cache_path": str(self.cache_path), "namespaces": dict(namespace_counts)}
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+
+class VariantNormalizationCache:
+    """
+    Adapts a NormalizationCache to the cache interface used by robokop_genetics' GeneticsNormalizer.
+    Failed ClinGen lookups are not cached, they are looked up again on the next build.
+    """
+    def __init__(self, normalization_cache: NormalizationCache, namespace: str):
+        self.normalization_cache = normalization_cache
+        self.namespace = namespace
+
+    def get_batch_normalization(self, variant_ids: list) -> dict:
+        return self.normalization_cache.get_batch(self.namespace, variant_ids)
+
+    def set_batch_normalization(self, normalizations: dict):
+        # a ClinGen outage fails lookups the same way as an unknown variant, caching them would keep the
+        # variants of that build un-normalized for the whole ttl
+        self.normalization_cache.set_batch(self.namespace, {
+            variant_id: normalization for variant_id, normalization in normalizations.items()
+            if not is_failed_variant_normalization(normalization)})
+
+
+def is_failed_variant_normalization(normalization) -> bool:
+    return any("error_type" in result for result in normalization or [])
+
+
+def get_node_norm_namespace(node_normalizer, normalization_cache: NormalizationCache) -> str:
+    try:
+        return f"{NODE_NORM_NAMESPACE}:{node_normalizer.get_current_node_norm_version()}"
+    except Exception as e:
+        # without the service we can still serve results from the most recently used version
+        latest_namespace = normalization_cache.get_latest_namespace(NODE_NORM_NAMESPACE)
+        print(f"Could not determine the Node Normalizer version ({e!r}), using cached namespace {latest_namespace}")
+        return latest_namespace or f"{NODE_NORM_NAMESPACE}:unknown"
+
+def get_variant_norm_namespace() -> str:
+    try:
+        return f"{VARIANT_NORM_NAMESPACE}:robokop-genetics-{version('robokop-genetics')}"
+    except PackageNotFoundError:
+        return f"{VARIANT_NORM_NAMESPACE}:unknown"
+
+def attach_normalization_cache(node_normalizer, normalization_cache: NormalizationCache):
+    """
+    Route the lookups of an ORION NodeNormalizer through the cache so only cache misses hit the
+    Node Normalizer (regular nodes) and ClinGen (sequence variants) services.
+    """
+    namespace = get_node_norm_namespace(node_normalizer, normalization_cache)
+    hit_node_norm_service = node_normalizer.hit_node_norm_service
+
+    def cached_hit_node_norm_service(curies, retries=0):
+        results = normalization_cache.get_batch(namespace, curies)
+        cache_misses = [curie for curie in curies if curie not in results]
+        if cache_misses:
+            service_results = hit_node_norm_service(cache_misses, retries)
+            normalization_cache.set_batch(namespace, service_results)
+            results.update(service_results)
+        return results
+
+    node_normalizer.hit_node_norm_service = cached_hit_node_norm_service
+
+    # the normalizer creates this lazily, create it up front so it uses the cache
+    if not node_normalizer.sequence_variant_normalizer:
+        from robokop_genetics.genetics_normalization import GeneticsNormalizer
+        node_normalizer.sequence_variant_normalizer = GeneticsNormalizer(use_cache=False)
+        node_normalizer.variant_node_types = node_normalizer.sequence_variant_normalizer.get_sequence_variant_node_types()
+    node_normalizer.sequence_variant_normalizer.cache = VariantNormalizationCache(normalization_cache,
+                                                                                  get_variant_norm_namespace())
+
+
+def get_node_norm_stand_in_handler(normalization_cache: NormalizationCache, namespace: str):
+    node_norm_version = namespace.split(":", 1)[1]
+    cached_results = normalization_cache.get_namespace_entries(namespace)
+
+    class NodeNormStandInHandler(BaseHTTPRequestHandler):
+        def send_json(self, response_json):
+            response_body = json.dumps(response_json).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response_body)))
+            self.end_headers()
+            self.wfile.write(response_body)
+
+        def do_GET(self):
+            if self.path.startswith("/openapi.json"):
+                self.send_json({"info": {"version": node_norm_version}})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            if not self.path.startswith("/get_normalized_nodes"):
+                self.send_error(404)
+                return
+            request_json = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.send_json({curie: cached_results.get(curie) for curie in request_json.get("curies", [])})
+
+    return NodeNormStandInHandler
+
+def serve_node_norm_stand_in(normalization_cache: NormalizationCache, namespace: str,
+                             host: str = "127.0.0.1", port: int = 8089) -> ThreadingHTTPServer:
+    """
+    A local stand-in for the Node Normalizer service answering from the cache, for offline builds.
+    Point ORION at it with NODE_NORMALIZATION_ENDPOINT=http://{host}:{port}/
+    """
+    return ThreadingHTTPServer((host, port), get_node_norm_stand_in_handler(normalization_cache, namespace))
+
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+def stats():
+    with NormalizationCache() as normalization_cache:
+        click.echo(json.dumps(normalization_cache.get_stats(), indent=4))
+
+@cli.command()
+def evict():
+    with NormalizationCache() as normalization_cache:
+        click.echo(f"Evicted {normalization_cache.evict()} cache entries.")
+
+@cli.command()
+@click.option('--host', default="127.0.0.1", show_default=True)
+@click.option('--port', default=8089, show_default=True)
+@click.option('--namespace', default=None, help='Cache namespace to serve, defaults to the most recently used Node Normalizer version.')
+def serve(host: str, port: int, namespace: str):
+    normalization_cache = NormalizationCache()
+    namespace = namespace or normalization_cache.get_latest_namespace(NODE_NORM_NAMESPACE)
+    if not namespace:
+        raise click.ClickException("The normalization cache has no Node Normalizer results to serve.")
+    server = serve_node_norm_stand_in(normalization_cache, namespace, host=host, port=port)
+    click.echo(f"Serving {namespace} on http://{host}:{port}/ (set NODE_NORMALIZATION_ENDPOINT to use it)")
+    try:
+        server.serve_forever()
+    finally:
+        normalization_cache.close()
+
+if __name__ == "__main__":
+    cli()
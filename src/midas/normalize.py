@@ -1,37 +1,44 @@
+from midas.norm_cache import NormalizationCache, attach_normalization_cache
 from midas.util import get_data_output_directory_path
 
 from orion.kgx_file_normalizer import KGXFileNormalizer
 
 
-def normalize(sources:list):
-    for source in sources:
-        print(f"Normalizing {source}...")
-        nodes_file = get_data_output_directory_path() / "kgs" / source / f"{source}_nodes.jsonl"
+def normalize_source(source: str):
+    print(f"Normalizing {source}...")
+    nodes_file = get_data_output_directory_path() / "kgs" / source / f"{source}_nodes.jsonl"
+    if not nodes_file.exists():
+        nodes_file = get_data_output_directory_path() / "kgs" / source / f"nodes.jsonl"
         if not nodes_file.exists():
-            nodes_file = get_data_output_directory_path() / "kgs" / source / f"nodes.jsonl"
-            if not nodes_file.exists():
-                print(f'Nodes file for {source} could not be located for normalization..')
-                return
+            raise FileNotFoundError(f'Nodes file for {source} could not be located for normalization.')
 
-        norm_nodes_file = get_data_output_directory_path() / "kgs" / source / f"{source}_normalized_nodes.jsonl"
-        node_norm_map_file = get_data_output_directory_path() / "kgs" / source / f"normalization_map.json"
-        node_norm_failures = get_data_output_directory_path() / "kgs" / source / f"normalization_failures.txt"
+    norm_nodes_file = get_data_output_directory_path() / "kgs" / source / f"{source}_normalized_nodes.jsonl"
+    node_norm_map_file = get_data_output_directory_path() / "kgs" / source / f"normalization_map.json"
+    node_norm_failures = get_data_output_directory_path() / "kgs" / source / f"normalization_failures.txt"
 
-        edges_file = get_data_output_directory_path() / "kgs" / source / f"{source}_edges.jsonl"
+    edges_file = get_data_output_directory_path() / "kgs" / source / f"{source}_edges.jsonl"
+    if not edges_file.exists():
+        edges_file = get_data_output_directory_path() / "kgs" / source / f"edges.jsonl"
         if not edges_file.exists():
-            edges_file = get_data_output_directory_path() / "kgs" / source / f"edges.jsonl"
-            if not edges_file.exists():
-                print(f'Edges file for {source} could not be located for normalization..')
-                return
+            raise FileNotFoundError(f'Edges file for {source} could not be located for normalization.')
+
+    norm_edges_file = get_data_output_directory_path() / "kgs" / source / f"{source}_normalized_edges.jsonl"
+    predicate_map_file = get_data_output_directory_path() / "kgs" / source / f"predicate_map.jsonl"
+    normalizer = KGXFileNormalizer(source_nodes_file_path=nodes_file,
+                                   nodes_output_file_path=norm_nodes_file,
+                                   node_norm_map_file_path=node_norm_map_file,
+                                   node_norm_failures_file_path=node_norm_failures,
+                                   source_edges_file_path=edges_file,
+                                   edges_output_file_path=norm_edges_file,
+                                   edge_norm_predicate_map_file_path=predicate_map_file,
+                                   has_sequence_variants=True)
+    # most identifiers are the same from one build to the next, only resolve the ones that aren't cached
+    with NormalizationCache() as normalization_cache:
+        attach_normalization_cache(normalizer.node_normalizer, normalization_cache)
+        normalizer.normalize_kgx_files()
+        print(f"Normalization cache for {source}: {normalization_cache.hits} hits, {normalization_cache.misses} misses")
+        normalization_cache.evict()
 
-        norm_edges_file = get_data_output_directory_path() / "kgs" / source / f"{source}_normalized_edges.jsonl"
-        predicate_map_file = get_data_output_directory_path() / "kgs" / source / f"predicate_map.jsonl"
-        normalizer = KGXFileNormalizer(source_nodes_file_path=nodes_file,
-                                       nodes_output_file_path=norm_nodes_file,
-                                       node_norm_map_file_path=node_norm_map_file,
-                                       node_norm_failures_file_path=node_norm_failures,
-                                       source_edges_file_path=edges_file,
-                                       edges_output_file_path=norm_edges_file,
-                                       edge_norm_predicate_map_file_path=predicate_map_file,
-                                       has_sequence_variants=True)
-        normalizer.normalize_kgx_files()
\ No newline at end of file
+def normalize(sources:list):
+    for source in sources:
+        normalize_source(source)
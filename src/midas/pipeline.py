@@ -1,12 +1,25 @@
 import click
+import multiprocessing
+import queue
 
-from midas.convert_data import convert_to_kgx
+from pathlib import Path
+
+from midas import civic_extraction, columnar, convert_data, graph_stats, kgx_converter, normalize, merge, metadata, \
+    name_index, neptune_csv
+from midas.civic_extraction import extract_civic_data, find_civic_summary_files, get_civic_extracted_file_path
+from midas.columnar import convert_graph_to_parquet, get_kgx_file_path
+from midas.convert_data import convert_source, get_source_input_paths
+from midas.graph_stats import generate_graph_stats, get_graph_stats_path
+from midas.instrumentation import RUN_REPORT_FILE_NAME, RunReport
 from midas.kgx_converter import convert_kgx_to_csv
-from midas.normalize import normalize
-from midas.merge import merge
+from midas.normalize import normalize_source
+from midas.merge import merge as merge_sources
 from midas.metadata import generate_metadata
+from midas.manifest import BuildManifest, get_module_source_files
+from midas.name_index import build_name_index, get_name_index_path
+from midas.neptune_csv import NEPTUNE_FILES_INDEX_SUFFIX, convert_kgx_to_neptune_csv
 
-from midas.util import get_kg_output_directory_path
+from midas.util import get_kg_output_directory_path, get_source_kgx_files, get_source_normalized_files
 
 all_sources = [
         "civic",
@@ -14,37 +27,232 @@ all_sources = [
         "1kg"
 ]
 
+def run_source_extraction(source: str, manifest: BuildManifest, force: bool = False):
+    # sources with raw dumps in the data directory are extracted into their source data file first
+    if source == "civic":
+        civic_summary_files = find_civic_summary_files()
+        if not civic_summary_files:
+            return
+        civic_extracted_file = get_civic_extracted_file_path()
+        manifest.run_stage("extract:civic",
+                           inputs=list(civic_summary_files.values()) + get_module_source_files(civic_extraction),
+                           outputs=[civic_extracted_file],
+                           stage_function=lambda: extract_civic_data(**civic_summary_files,
+                                                                     output_path=civic_extracted_file),
+                           force=force)
+
+def build_source(source: str, force: bool = False, run_report: RunReport = None,
+                 fuzzy_therapies: bool = False) -> dict:
+    # sources don't depend on each other until merge, so this chain can run in its own process
+    # the stage modules and the midas modules they import are inputs too, so code changes trigger a rebuild
+    manifest = BuildManifest(run_report=run_report)
+    run_source_extraction(source, manifest, force=force)
+    manifest.run_stage(f"convert:{source}",
+                       inputs=get_source_input_paths(source) + get_module_source_files(convert_data),
+                       outputs=get_source_kgx_files(source),
+                       # only recorded when set, so builds without fuzzy matching keep their manifest entries
+                       params={"fuzzy_therapies": True} if fuzzy_therapies and source == "civic" else None,
+                       stage_function=lambda: convert_source(source, fuzzy_therapies=fuzzy_therapies),
+                       force=force)
+    manifest.run_stage(f"normalize:{source}",
+                       inputs=get_source_kgx_files(source) + get_module_source_files(normalize),
+                       outputs=get_source_normalized_files(source),
+                       stage_function=lambda: normalize_source(source),
+                       force=force)
+    return manifest.get_updates()
+
+def build_source_in_worker(source: str, force: bool, fuzzy_therapies: bool, profile_dir: Path,
+                           results: multiprocessing.Queue):
+    # the stages measured in a worker process go back to the main process with the manifest updates,
+    # the ones measured before a failure too
+    run_report = RunReport(profile_dir=profile_dir)
+    try:
+        updates, error = build_source(source, force=force, run_report=run_report,
+                                      fuzzy_therapies=fuzzy_therapies), None
+    except Exception as e:
+        updates, error = {"stages": {}, "file_hashes": {}}, repr(e)
+    results.put((source, {**updates, "run_report": run_report.get_updates()}, error))
+
+def build_sources(sources: list, manifest: BuildManifest, workers: int = 1, force: bool = False,
+                  fuzzy_therapies: bool = False):
+    if workers <= 1 or len(sources) <= 1:
+        for source in sources:
+            manifest.apply_updates(build_source(source, force=force, run_report=manifest.run_report,
+                                                fuzzy_therapies=fuzzy_therapies))
+        return
+
+    # one process per source rather than a pool, so the sources still building can be stopped when one fails
+    # (sources can start their own worker processes, which a multiprocessing.Pool worker can't)
+    profile_dir = manifest.run_report.profile_dir if manifest.run_report else None
+    results = multiprocessing.Queue()
+    pending_sources = list(sources)
+    running = {}
+    try:
+        while pending_sources or running:
+            while pending_sources and len(running) < workers:
+                source = pending_sources.pop(0)
+                running[source] = multiprocessing.Process(target=build_source_in_worker,
+                                                          args=(source, force, fuzzy_therapies, profile_dir, results))
+                running[source].start()
+            try:
+                source, updates, error = results.get(timeout=1)
+            except queue.Empty:
+                # a worker that was killed (e.g. out of memory) never reports back
+                for source, process in running.items():
+                    if process.exitcode:
+                        raise click.ClickException(f"Building source {source} failed: worker exited with "
+                                                   f"code {process.exitcode}")
+                continue
+            running.pop(source).join()
+            manifest.apply_updates(updates)
+            if error:
+                # fail fast - don't wait for the remaining sources before reporting the failure
+                raise click.ClickException(f"Building source {source} failed: {error}")
+    finally:
+        for process in running.values():
+            process.terminate()
+            process.join()
+    click.echo(f"Finished converting and normalizing: {sources}")
+
+def build_graph(graph_id: str, sources: list, manifest: BuildManifest, workers: int = 1, force: bool = False,
+                parquet: bool = False, neptune: bool = False, neptune_shard_rows: int = None,
+                fuzzy_therapies: bool = False):
+    # process and normalize the sources, merge waits for all of them
+    build_sources(sources, manifest, workers=workers, force=force, fuzzy_therapies=fuzzy_therapies)
+    manifest.save()
+
+    # merge and build a graph
+    graph_output_dir = get_kg_output_directory_path() / graph_id
+    graph_output_dir.mkdir(exist_ok=True)
+    graph_nodes_file = graph_output_dir / f"{graph_id}_nodes.jsonl"
+    graph_edges_file = graph_output_dir / f"{graph_id}_edges.jsonl"
+    graph_files = [graph_nodes_file, graph_edges_file]
+    normalized_files = [file_path for source in sources for file_path in get_source_normalized_files(source)]
+    manifest.run_stage(f"merge:{graph_id}",
+                       inputs=normalized_files + get_module_source_files(merge),
+                       outputs=graph_files + [graph_output_dir / f"{graph_id}_merge_metadata.json"],
+                       params={"sources": sources},
+                       stage_function=lambda: merge_sources(graph_id, sources, output_dir=graph_output_dir),
+                       force=force)
+    manifest.save()
+
+    # generate graph summary metadata
+    manifest.run_stage(f"metadata:{graph_id}",
+                       inputs=graph_files + get_module_source_files(metadata),
+                       outputs=[graph_output_dir / f"{graph_id}_metadata.json"],
+                       stage_function=lambda: generate_metadata(graph_id, graph_nodes_file, graph_edges_file),
+                       force=force)
+    manifest.save()
+
+    # prepare a csv file for neo4j import
+    graph_nodes_csv = graph_output_dir / f"{graph_id}_nodes.csv"
+    graph_edges_csv = graph_output_dir / f"{graph_id}_edges.csv"
+    manifest.run_stage(f"csv:{graph_id}",
+                       inputs=graph_files + get_module_source_files(kgx_converter),
+                       outputs=[graph_nodes_csv, graph_edges_csv],
+                       stage_function=lambda: convert_kgx_to_csv(nodes_input_file=graph_nodes_file,
+                                                                 edges_input_file=graph_edges_file,
+                                                                 nodes_output_file=graph_nodes_csv,
+                                                                 edges_output_file=graph_edges_csv),
+                       force=force)
+    manifest.save()
+
+    # columnar copy of the graph for the downstream tools
+    if parquet:
+        graph_parquet_files = [graph_output_dir / f"{graph_id}_nodes.parquet",
+                               graph_output_dir / f"{graph_id}_edges.parquet"]
+        manifest.run_stage(f"parquet:{graph_id}",
+                           inputs=graph_files + get_module_source_files(columnar),
+                           outputs=graph_parquet_files,
+                           stage_function=lambda: convert_graph_to_parquet(*graph_files, *graph_parquet_files),
+                           force=force)
+        manifest.save()
+
+    # name lookup index for the agent and the app, read from parquet when it's available
+    graph_name_index_file = get_name_index_path(graph_id)
+    graph_nodes_input_file = get_kgx_file_path(graph_output_dir, graph_id, "nodes")
+    manifest.run_stage(f"name_index:{graph_id}",
+                       inputs=[graph_nodes_input_file] + get_module_source_files(name_index),
+                       outputs=[graph_name_index_file],
+                       stage_function=lambda: build_name_index(graph_nodes_input_file, graph_name_index_file),
+                       force=force)
+    manifest.save()
+
+    # statistics the agent and the app answer count, hub and degree questions from, instead of querying Neptune
+    graph_stats_file = get_graph_stats_path(graph_id)
+    graph_kgx_input_files = [graph_nodes_input_file, get_kgx_file_path(graph_output_dir, graph_id, "edges")]
+    manifest.run_stage(f"stats:{graph_id}",
+                       inputs=graph_kgx_input_files + get_module_source_files(graph_stats),
+                       outputs=[graph_stats_file],
+                       stage_function=lambda: generate_graph_stats(graph_id, *graph_kgx_input_files,
+                                                                   output_file=graph_stats_file),
+                       force=force)
+    manifest.save()
+
+    # openCypher CSV files for the Neptune bulk loader, read from parquet when it's available
+    if neptune:
+        neptune_output_dir = graph_output_dir / "neptune"
+        neptune_output_dir.mkdir(exist_ok=True)
+        neptune_index_file = neptune_output_dir / f"{graph_id}{NEPTUNE_FILES_INDEX_SUFFIX}"
+        neptune_input_files = [get_kgx_file_path(graph_output_dir, graph_id, "nodes"),
+                               get_kgx_file_path(graph_output_dir, graph_id, "edges")]
+        manifest.run_stage(f"neptune:{graph_id}",
+                           inputs=neptune_input_files + get_module_source_files(neptune_csv),
+                           outputs=[neptune_index_file],
+                           params={"shard_rows": neptune_shard_rows},
+                           stage_function=lambda: convert_kgx_to_neptune_csv(
+                               *neptune_input_files,
+                               nodes_output_file=neptune_output_dir / f"{graph_id}_nodes_neptune.csv",
+                               edges_output_file=neptune_output_dir / f"{graph_id}_edges_neptune.csv",
+                               max_rows_per_file=neptune_shard_rows,
+                               index_file=neptune_index_file),
+                           force=force)
+        manifest.save()
+
 @click.command()
 @click.option('--graph-id', '-g', default="goldenKG", help='Graph identifier for output files.')
 @click.option('--sources', '-s', 'sources', multiple=True, default=all_sources,
               help='Sources to include in the graph. Omit for all available sources.')
-def run_pipeline(graph_id:str, sources:tuple=None):
+@click.option('--workers', '-w', default=1, show_default=True,
+              help='Number of processes used to convert and normalize sources in parallel.')
+@click.option('--force', '-f', is_flag=True, default=False,
+              help='Rebuild every stage even if its inputs are unchanged since the last build.')
+@click.option('--parquet', is_flag=True, default=False,
+              help='Also write the merged graph as parquet, which the midas tools read instead of jsonl when present. '
+                   'An extra export, the ORION stages still hand off jsonl.')
+@click.option('--neptune', is_flag=True, default=False,
+              help='Also write Neptune bulk load CSV files for the merged graph.')
+@click.option('--neptune-shard-rows', default=None, type=int,
+              help='Split the Neptune CSV files into shards of at most this many rows.')
+@click.option('--fuzzy-therapies', is_flag=True, default=False,
+              help='Resolve CIViC therapy names without an exact NCIT match by prefix and trigram similarity. '
+                   'Finds more therapies, but can attach the wrong drug.')
+@click.option('--profile', is_flag=True, default=False,
+              help='Write a cProfile dump and the top tracemalloc allocations of every stage to the graph\'s '
+                   'profiles directory. Slows the build down considerably.')
+def run_pipeline(graph_id:str, sources:tuple=None, workers:int=1, force:bool=False, parquet:bool=False,
+                 neptune:bool=False, neptune_shard_rows:int=None, fuzzy_therapies:bool=False, profile:bool=False):
     if not sources:
         click.echo("No sources provided. Exiting...")
         return
     sources = list(sources)
     click.echo(f"Building graph {graph_id} with source(s): {sources}")
-
-    # process and normalize the sources
-    convert_to_kgx(sources)
-    normalize(sources)
-
-    # merge and build a graph
     graph_output_dir = get_kg_output_directory_path() / graph_id
     graph_output_dir.mkdir(exist_ok=True)
-    merge(graph_id, sources, output_dir=graph_output_dir)
-
-    # generate graph summary metadata
-    graph_nodes_file = graph_output_dir / f"{graph_id}_nodes.jsonl"
-    graph_edges_file = graph_output_dir / f"{graph_id}_edges.jsonl"
-    print(f"Generating metadata for {graph_id}")
-    generate_metadata(graph_id, graph_nodes_file, graph_edges_file)
-
-    # prepare a csv file for neo4j import
-    convert_kgx_to_csv(nodes_input_file=graph_output_dir / f"{graph_id}_nodes.jsonl",
-                       edges_input_file=graph_output_dir / f"{graph_id}_edges.jsonl",
-                       nodes_output_file=graph_output_dir / f"{graph_id}_nodes.csv",
-                       edges_output_file=graph_output_dir / f"{graph_id}_edges.csv")
+    # every stage is measured, and the report is written even when the build fails
+    run_report = RunReport(profile_dir=graph_output_dir / "profiles" if profile else None)
+    manifest = BuildManifest(run_report=run_report)
+    run_info = {"graph_id": graph_id, "sources": sources, "workers": workers, "force": force,
+                "fuzzy_therapies": fuzzy_therapies}
+    status = "failed"
+    try:
+        build_graph(graph_id, sources, manifest, workers=workers, force=force, parquet=parquet, neptune=neptune,
+                    neptune_shard_rows=neptune_shard_rows, fuzzy_therapies=fuzzy_therapies)
+        status = "succeeded"
+    finally:
+        run_report.write(graph_output_dir / RUN_REPORT_FILE_NAME, status, **run_info)
+        run_report.print_summary()
+        click.echo(f"Wrote run report to {graph_output_dir / RUN_REPORT_FILE_NAME}")
 
 if __name__ == "__main__":
     run_pipeline()
@@ -0,0 +1,238 @@
+import json
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+import click
+
+from midas.neptune_client import DEFAULT_REGION, NeptuneClient
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 3600
+# how often (seconds) the graph version is read, at most one extra request per interval
+DEFAULT_VERSION_CHECK_INTERVAL = 60
+
+# the graph version is written to an SSM parameter of the cluster after every load, outside the graph so it
+# doesn't show up in counts, schemas or answers
+GRAPH_VERSION_PARAMETER_PREFIX = "/midas/graph_version/"
+
+
+class GraphVersionError(Exception):
+    pass
+
+
+def get_graph_version_parameter_name(endpoint: str) -> str:
+    # the cluster identifier is the first label of the endpoint host, shared by its writer and reader endpoints
+    host = urlparse(endpoint).hostname if "://" in endpoint else endpoint.split(":")[0]
+    return f"{GRAPH_VERSION_PARAMETER_PREFIX}{host.split('.')[0]}"
+
+
+class GraphVersionStore:
+    """The version of the graph loaded in a Neptune cluster, kept in an SSM parameter."""
+    def __init__(self, endpoint: str, region: str = DEFAULT_REGION):
+        # boto3 is only needed for real clusters, not for local stand-ins
+        import boto3
+        from botocore.exceptions import BotoCoreError, ClientError
+        self.ssm_client = boto3.client("ssm", region_name=region)
+        self.aws_errors = (BotoCoreError, ClientError)
+        self.parameter_name = get_graph_version_parameter_name(endpoint)
+
+    def get_version(self) -> str | None:
+        try:
+            return self.ssm_client.get_parameter(Name=self.parameter_name)["Parameter"]["Value"]
+        except self.ssm_client.exceptions.ParameterNotFound:
+            return None
+        except self.aws_errors as e:
+            raise GraphVersionError(f"Could not read {self.parameter_name}: {e}") from e
+
+    def set_version(self, version: str):
+        try:
+            self.ssm_client.put_parameter(Name=self.parameter_name, Value=version, Type="String", Overwrite=True)
+        except self.aws_errors as e:
+            raise GraphVersionError(f"Could not write {self.parameter_name}: {e}") from e
+
+
+class LocalGraphVersionStore:
+    """A local stand-in for GraphVersionStore, the version is kept in a file."""
+    def __init__(self, version_file):
+        self.version_file = Path(version_file)
+
+    def get_version(self) -> str | None:
+        try:
+            return self.version_file.read_text().strip() or None
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            raise GraphVersionError(f"Could not read {self.version_file}: {e}") from e
+
+    def set_version(self, version: str):
+        try:
+            self.version_file.write_text(version)
+        except OSError as e:
+            raise GraphVersionError(f"Could not write {self.version_file}: {e}") from e
+
+
+class GraphVersionTracker:
+    """Reads the graph version from a version store, at most once every check_interval seconds."""
+    def __init__(self, version_store, check_interval: float = DEFAULT_VERSION_CHECK_INTERVAL):
+        self.version_store = version_store
+        self.check_interval = check_interval
+        self.graph_version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def check(self, force: bool = False) -> bool:
+        """Read the version if it's due, returning whether it changed since the previous read."""
+        with self.lock:
+            now = time.monotonic()
+            first_check = self.checked_at is None
+            if not force and not first_check and now - self.checked_at < self.check_interval:
+                return False
+            self.checked_at = now
+            try:
+                graph_version = self.version_store.get_version()
+            except GraphVersionError as e:
+                # an unreachable store isn't a new graph, keep the last known version until it can be read again
+                print(f"Could not read the graph version, keeping {self.graph_version}: {e}")
+                return False
+            changed = graph_version != self.graph_version and not first_check
+            self.graph_version = graph_version
+            return changed
+
+
+def get_cache_key(query: str, parameters: dict = None) -> tuple:
+    return query, json.dumps(parameters or {}, sort_keys=True)
+
+
+class QueryCache:
+    """
+    LRU cache of query results with a time to live, keyed by (query template, parameters).
+    Thread safe, so one cache can be shared by the threads of a Streamlit server.
+    """
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value or None, counting the lookup as a hit or a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+class CachedQueryRunner:
+    """
+    Runs openCypher queries through a NeptuneClient and caches the results.
+    With a version tracker, the cache is cleared whenever the graph version changes, which is checked at most
+    once every check interval, so results never outlive a reload by more than that interval. Without one,
+    results are only kept until they expire.
+    """
+    def __init__(self, client: NeptuneClient, cache: QueryCache = None, version_tracker: GraphVersionTracker = None):
+        self.client = client
+        self.cache = cache or QueryCache()
+        self.version_tracker = version_tracker
+
+    @property
+    def graph_version(self) -> str | None:
+        return self.version_tracker.graph_version if self.version_tracker else None
+
+    def check_graph_version(self, force: bool = False):
+        if self.version_tracker is None:
+            return
+        previous_version = self.version_tracker.graph_version
+        if self.version_tracker.check(force=force):
+            print(f"Graph version changed from {previous_version} to {self.graph_version}, clearing query cache")
+            self.cache.clear()
+
+    def execute_query(self, query: str, parameters: dict = None, use_cache: bool = True) -> dict:
+        if not use_cache:
+            return self.client.execute_query(query, parameters)
+        self.check_graph_version()
+        key = get_cache_key(query, parameters)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.client.execute_query(query, parameters)
+            self.cache.put(key, result)
+        return result
+
+    def execute_queries(self, queries: list) -> list:
+        """Like NeptuneClient.execute_queries, the queries missing from the cache run concurrently."""
+        self.check_graph_version()
+        queries = [query if isinstance(query, tuple) else (query,) for query in queries]
+        keys = [get_cache_key(*query) for query in queries]
+        results = [self.cache.get(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            for index, result in zip(missing, self.client.execute_queries([queries[index] for index in missing])):
+                self.cache.put(keys[index], result)
+                results[index] = result
+        return results
+
+    def get_stats(self) -> dict:
+        return {"graph_version": self.graph_version, **self.cache.get_stats()}
+
+
+def set_graph_version(version_store, version: str = None) -> str:
+    """Write the graph version, by default the current time, after a (re)load."""
+    version = version or datetime.now().strftime("%Y%m%d%H%M%S")
+    version_store.set_version(version)
+    return version
+
+
+@click.command()
+@click.option('--endpoint', required=True, help='Neptune endpoint url, e.g. https://<cluster>:8182')
+@click.option('--region', default=DEFAULT_REGION, show_default=True)
+@click.option('--version', 'graph_version', default=None, help='Graph version, defaults to the current time.')
+def mark_graph_version(endpoint: str, region: str, graph_version: str):
+    """Write the graph version that invalidates query caches, run after every load."""
+    version_store = GraphVersionStore(endpoint, region=region)
+    graph_version = set_graph_version(version_store, graph_version)
+    print(f"Graph version {version_store.parameter_name} set to {graph_version}")
+
+if __name__ == "__main__":
+    mark_graph_version()
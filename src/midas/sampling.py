@@ -0,0 +1,162 @@
+import heapq
+import json
+import random
+
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import click
+
+from midas.columnar import get_kgx_file_path, iterate_kgx_file
+from midas.neptune_csv import write_neptune_csv
+from midas.util import get_kg_output_directory_path
+
+DEFAULT_SAMPLE_FRACTION = 0.01
+# every category keeps at least this many nodes, so rare ones are still represented
+DEFAULT_MIN_PER_STRATUM = 10
+DEFAULT_SEED = 42
+
+
+class StratifiedSampler:
+    """
+    Single pass stratified sampling. Every record gets a random priority: records with a priority below fraction
+    are sampled (so each stratum is sampled at the same rate), and a reservoir of the min_per_stratum
+    lowest priorities per stratum tops up strata that would otherwise end up under-represented.
+    Memory is bounded by the sample size plus min_per_stratum records per stratum.
+    """
+    def __init__(self, fraction: float, min_per_stratum: int = DEFAULT_MIN_PER_STRATUM, seed: int = DEFAULT_SEED):
+        self.fraction = fraction
+        self.min_per_stratum = min_per_stratum
+        self.random = random.Random(seed)
+        self.sampled = []
+        self.reservoirs = defaultdict(list)
+        self.total_counts = Counter()
+        self.sampled_counts = Counter()
+
+    def offer(self, stratum, index: int, record: dict):
+        self.total_counts[stratum] += 1
+        priority = self.random.random()
+        if priority < self.fraction:
+            self.sampled_counts[stratum] += 1
+            self.sampled.append((index, record))
+            return
+        # max heap by priority (negated) holding the lowest priorities that weren't sampled
+        reservoir = self.reservoirs[stratum]
+        if len(reservoir) < self.min_per_stratum:
+            heapq.heappush(reservoir, (-priority, index, record))
+        elif -reservoir[0][0] > priority:
+            heapq.heapreplace(reservoir, (-priority, index, record))
+
+    def get_top_ups(self) -> dict:
+        """The reservoir records that bring each under-represented stratum up to min_per_stratum."""
+        top_ups = {}
+        for stratum, reservoir in self.reservoirs.items():
+            missing = self.min_per_stratum - self.sampled_counts[stratum]
+            if missing > 0:
+                top_ups[stratum] = [(index, record) for _, index, record in heapq.nlargest(missing, reservoir)]
+        return top_ups
+
+    def get_sample(self) -> list:
+        """Return the sampled records in their original order."""
+        sample = list(self.sampled)
+        for stratum_top_ups in self.get_top_ups().values():
+            sample.extend(stratum_top_ups)
+        sample.sort(key=lambda indexed_record: indexed_record[0])
+        return [record for _, record in sample]
+
+    def get_report(self) -> dict:
+        top_up_counts = {stratum: len(stratum_top_ups) for stratum, stratum_top_ups in self.get_top_ups().items()}
+        return {str(stratum): {"total": self.total_counts[stratum],
+                               "sampled": self.sampled_counts[stratum] + top_up_counts.get(stratum, 0)}
+                for stratum in sorted(self.total_counts, key=str)}
+
+
+def get_node_stratum(node: dict) -> str:
+    # categories are ordered from most to least specific
+    categories = node.get("category")
+    if isinstance(categories, list):
+        return categories[0] if categories else "unknown"
+    return categories or "unknown"
+
+def get_edge_stratum(edge: dict) -> str:
+    # the knowledge source keeps every source's share of each predicate, e.g. CIViC vs 1kg variant edges
+    return f"{edge.get('predicate')}|{edge.get('primary_knowledge_source')}"
+
+def write_jsonl(records: list, output_file_path):
+    with open(output_file_path, "w") as jsonl_file:
+        for record in records:
+            jsonl_file.write(json.dumps(record) + "\n")
+
+def sample_graph(nodes_input_file, edges_input_file, output_dir, file_prefix: str,
+                 fraction: float = DEFAULT_SAMPLE_FRACTION, min_per_stratum: int = DEFAULT_MIN_PER_STRATUM,
+                 seed: int = DEFAULT_SEED, neptune: bool = True) -> dict:
+    """
+    Sample a closed subgraph with one pass over the nodes and one over the edges.
+    Nodes are sampled per category, so every category keeps its share of the graph, and the edges between
+    sampled nodes are kept. Edges are counted per predicate and knowledge source in the report.
+    Writes KGX jsonl files, and Neptune CSV files unless neptune is False, to output_dir.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    node_sampler = StratifiedSampler(fraction, min_per_stratum=min_per_stratum, seed=seed)
+    for index, node in enumerate(iterate_kgx_file(nodes_input_file)):
+        node_sampler.offer(get_node_stratum(node), index, node)
+    sampled_nodes = node_sampler.get_sample()
+    sampled_node_ids = {node["id"] for node in sampled_nodes}
+
+    sampled_edges = []
+    edge_totals = Counter()
+    edge_sampled_counts = Counter()
+    for edge in iterate_kgx_file(edges_input_file):
+        edge_stratum = get_edge_stratum(edge)
+        edge_totals[edge_stratum] += 1
+        if edge["subject"] in sampled_node_ids and edge["object"] in sampled_node_ids:
+            edge_sampled_counts[edge_stratum] += 1
+            sampled_edges.append(edge)
+
+    nodes_output_file = output_dir / f"{file_prefix}_nodes.jsonl"
+    edges_output_file = output_dir / f"{file_prefix}_edges.jsonl"
+    write_jsonl(sampled_nodes, nodes_output_file)
+    write_jsonl(sampled_edges, edges_output_file)
+    if neptune:
+        write_neptune_csv(sampled_nodes, "nodes", output_dir / f"{file_prefix}_nodes_neptune.csv")
+        write_neptune_csv(sampled_edges, "edges", output_dir / f"{file_prefix}_edges_neptune.csv")
+
+    sample_report = {
+        "fraction": fraction,
+        "min_per_stratum": min_per_stratum,
+        "seed": seed,
+        "node_count": len(sampled_nodes),
+        "edge_count": len(sampled_edges),
+        "nodes_by_category": node_sampler.get_report(),
+        "edges_by_predicate_and_source": {stratum: {"total": edge_totals[stratum],
+                                                     "sampled": edge_sampled_counts[stratum]}
+                                          for stratum in sorted(edge_totals)}
+    }
+    with open(output_dir / f"{file_prefix}_report.json", "w") as report_file:
+        json.dump(sample_report, report_file, indent=4)
+    print(f"Sampled {len(sampled_nodes)} nodes and {len(sampled_edges)} edges into {output_dir}")
+    return sample_report
+
+
+@click.command()
+@click.option('--graph-id', '-g', default="goldenKG", help='Graph to sample, from data_output/kgs/<graph-id>.')
+@click.option('--nodes-in', default=None, help='KGX nodes file (jsonl or parquet), defaults to the graph nodes file.')
+@click.option('--edges-in', default=None, help='KGX edges file (jsonl or parquet), defaults to the graph edges file.')
+@click.option('--output-dir', default=None, help='Output directory, defaults to data_output/kgs/<graph-id>/sample.')
+@click.option('--fraction', default=DEFAULT_SAMPLE_FRACTION, show_default=True, help='Fraction of the graph to sample.')
+@click.option('--min-per-stratum', default=DEFAULT_MIN_PER_STRATUM, show_default=True,
+              help='Minimum number of nodes per category.')
+@click.option('--seed', default=DEFAULT_SEED, show_default=True)
+def sample(graph_id: str, nodes_in: str, edges_in: str, output_dir: str, fraction: float, min_per_stratum: int,
+           seed: int):
+    graph_dir = get_kg_output_directory_path() / graph_id
+    sample_graph(nodes_in or get_kgx_file_path(graph_dir, graph_id, "nodes"),
+                 edges_in or get_kgx_file_path(graph_dir, graph_id, "edges"),
+                 output_dir or graph_dir / "sample",
+                 f"{graph_id}_sample",
+                 fraction=fraction, min_per_stratum=min_per_stratum, seed=seed)
+
+if __name__ == "__main__":
+    sample()
@@ -0,0 +1,231 @@
+import csv
+import json
+import random
+import time
+
+from pathlib import Path
+
+import click
+
+from midas.convert_data import source_data_files
+from midas.util import DATA_DIRECTORY_VARIABLE, REPOSITORY_DATA_DIRECTORY, get_data_directory_path, \
+    get_data_output_directory_path
+
+SYNTHETIC_SOURCES = ["civic", "1kg", "cbioportal"]
+DEFAULT_SEED = 42
+# roughly the number of genes, diseases and therapies the real sources refer to
+GENE_POOL_SIZE = 20_000
+DISEASE_POOL_SIZE = 10_000
+THERAPY_POOL_SIZE = 2_000
+CHROMOSOMES = [str(number) for number in range(1, 23)] + ["X", "Y"]
+# RefSeq accession versions of the GRCh38 chromosomes, as they appear in VEP's SPDI notation
+CHROMOSOME_ACCESSIONS = {
+    "1": "NC_000001.11", "2": "NC_000002.12", "3": "NC_000003.12", "4": "NC_000004.12", "5": "NC_000005.10",
+    "6": "NC_000006.12", "7": "NC_000007.14", "8": "NC_000008.11", "9": "NC_000009.12", "10": "NC_000010.11",
+    "11": "NC_000011.10", "12": "NC_000012.12", "13": "NC_000013.11", "14": "NC_000014.9", "15": "NC_000015.10",
+    "16": "NC_000016.10", "17": "NC_000017.11", "18": "NC_000018.10", "19": "NC_000019.10", "20": "NC_000020.11",
+    "21": "NC_000021.9", "22": "NC_000022.11", "X": "NC_000023.11", "Y": "NC_000024.10"
+}
+BASES = "ACGT"
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+# VEP consequences with their impact, weighted roughly like a 1000 Genomes dump
+CONSEQUENCES = [("intron_variant", "MODIFIER", 40), ("missense_variant", "MODERATE", 20),
+                ("synonymous_variant", "LOW", 15), ("splice_region_variant", "LOW", 5),
+                ("frameshift_variant", "HIGH", 2), ("protein_altering_variant", "MODERATE", 2),
+                ("3_prime_UTR_variant", "MODIFIER", 8), ("5_prime_UTR_variant", "MODIFIER", 4),
+                ("stop_gained", "HIGH", 2), ("upstream_gene_variant", "MODIFIER", 2)]
+DISEASE_NAME_PARTS = (["Acute", "Chronic", "Familial", "Juvenile", "Metastatic", "Hereditary", "Primary", "Recurrent"],
+                      ["Lung", "Breast", "Colorectal", "Pancreatic", "Gastric", "Ovarian", "Prostate", "Thyroid",
+                       "Renal", "Hepatic", "Lymphoid", "Myeloid", "Skin", "Bone", "Brain", "Bladder"],
+                      ["Carcinoma", "Adenocarcinoma", "Leukemia", "Lymphoma", "Sarcoma", "Melanoma", "Glioma",
+                       "Neoplasm", "Syndrome", "Disease"])
+THERAPY_NAME_SUFFIXES = ["tinib", "mab", "platin", "rafenib", "ciclib", "parib", "lisib", "zumab"]
+CIVIC_COLUMNS = ["gene_symbol", "variant", "allele_registry_id", "disease", "doid", "therapy", "ncbi_gene_id",
+                 "ncit_combo_id", "ncit_token_ids", "ncit_ids"]
+
+
+def parse_scale(scale: str) -> int:
+    """A record count like 10000, 10k, 1M or 100M."""
+    multipliers = {"k": 1_000, "m": 1_000_000, "g": 1_000_000_000}
+    scale = scale.strip().lower().replace("_", "")
+    if scale and scale[-1] in multipliers:
+        return int(float(scale[:-1]) * multipliers[scale[-1]])
+    return int(scale)
+
+def format_scale(record_count: int) -> str:
+    for suffix, multiplier in [("M", 1_000_000), ("k", 1_000)]:
+        if record_count >= multiplier and record_count % multiplier == 0:
+            return f"{record_count // multiplier}{suffix}"
+    return str(record_count)
+
+def get_skewed_index(rng: random.Random, size: int) -> int:
+    # skewed towards the start, so a few genes and diseases account for most records like in the real sources
+    return int(size * rng.random() ** 3)
+
+def get_gene(index: int) -> tuple:
+    """The entrez id, symbol and chromosome of a synthetic gene."""
+    return 1000 + index * 7, f"SYN{index}", CHROMOSOMES[index % len(CHROMOSOMES)]
+
+def get_disease(index: int) -> tuple:
+    """The DOID and name of a synthetic disease."""
+    adjectives, organs, kinds = DISEASE_NAME_PARTS
+    name = f"{adjectives[index % len(adjectives)]} {organs[index // len(adjectives) % len(organs)]} " \
+           f"{kinds[index // (len(adjectives) * len(organs)) % len(kinds)]}"
+    if index >= len(adjectives) * len(organs) * len(kinds):
+        name = f"{name} Type {index // (len(adjectives) * len(organs) * len(kinds)) + 1}"
+    return f"DOID:{10000 + index}", name
+
+def get_therapy(index: int) -> tuple:
+    """The NCIt id and name of a synthetic therapy."""
+    return f"C{100000 + index}", f"Syn{index}{THERAPY_NAME_SUFFIXES[index % len(THERAPY_NAME_SUFFIXES)]}"
+
+def get_civic_row(rng: random.Random, variant_pool_size: int) -> dict:
+    doid, disease_name = get_disease(get_skewed_index(rng, DISEASE_POOL_SIZE))
+    # a variant always has the same name, gene and allele registry id
+    variant_index = get_skewed_index(rng, variant_pool_size)
+    variant_rng = random.Random(variant_index)
+    entrez_gene_id, gene_symbol, _ = get_gene(get_skewed_index(variant_rng, GENE_POOL_SIZE))
+    variant_name = f"{variant_rng.choice(AMINO_ACIDS)}{variant_rng.randint(1, 2000)}{variant_rng.choice(AMINO_ACIDS)}"
+    row = {"gene_symbol": gene_symbol,
+           "variant": variant_name,
+           # like the CIViC export, most rows don't have an allele registry id
+           "allele_registry_id": f"CAID:CA{100000 + variant_index}" if variant_rng.random() < 0.4 else "",
+           "disease": disease_name,
+           "doid": doid,
+           "therapy": "",
+           "ncbi_gene_id": f"NCBIGene:{entrez_gene_id}",
+           "ncit_combo_id": "",
+           "ncit_token_ids": "",
+           "ncit_ids": ""}
+    if rng.random() < 0.4:
+        therapies = [get_therapy(get_skewed_index(rng, THERAPY_POOL_SIZE)) for _ in range(rng.choice([1, 1, 1, 2]))]
+        row["therapy"] = " + ".join(name for _, name in therapies)
+        row["ncit_token_ids"] = row["ncit_ids"] = ",".join(ncit_id for ncit_id, _ in therapies)
+    return row
+
+def get_vep_record(rng: random.Random, record_number: int, position: int, chromosome: str) -> dict:
+    reference, alternate = rng.sample(BASES, 2)
+    consequence, impact, _ = rng.choices(CONSEQUENCES, weights=[weight for _, _, weight in CONSEQUENCES])[0]
+    hgvsg = f"{chromosome}:g.{position}{reference}>{alternate}"
+    spdi = f"{CHROMOSOME_ACCESSIONS[chromosome]}:{position - 1}:{reference}:{alternate}"
+    transcript_consequences = []
+    for transcript_number in range(rng.randint(1, 4)):
+        gene_index = get_skewed_index(rng, GENE_POOL_SIZE)
+        transcript_consequences.append({"variant_allele": alternate,
+                                        "spdi": spdi,
+                                        "consequence_terms": [consequence],
+                                        "impact": impact,
+                                        "strand": rng.choice([1, -1]),
+                                        "gene_id": str(get_gene(gene_index)[0]),
+                                        "transcript_id": f"NM_{gene_index:06d}.{transcript_number + 1}",
+                                        "hgvsg": hgvsg})
+    frequencies = ";".join(f"{population}={rng.random() ** 4:.4f}"
+                           for population in ["AFR", "AMR", "EAS", "EUR", "SAS"])
+    return {"allele_string": f"{reference}/{alternate}",
+            "id": f"rs{100000000 + record_number}",
+            "transcript_consequences": transcript_consequences,
+            "seq_region_name": chromosome,
+            "input": f"{chromosome}\t{position}\trs{100000000 + record_number}\t{reference}\t{alternate}\t.\t.\t"
+                     f"dbSNP_156;TSA=SNV;E_Freq;E_1000G;{frequencies}",
+            "assembly_name": "GRCh38",
+            "strand": 1,
+            "most_severe_consequence": consequence,
+            "end": position,
+            "start": position}
+
+def generate_civic_data(output_file, record_count: int, seed: int = DEFAULT_SEED):
+    """A CIViC variant/gene/disease/therapy TSV with record_count rows, in the format of the preprocessed export."""
+    rng = random.Random(seed)
+    # variants repeat across rows (one row per disease and therapy), as in the export
+    variant_pool_size = max(record_count // 3, 1)
+    with open(output_file, "w", newline="") as civic_file:
+        civic_writer = csv.DictWriter(civic_file, fieldnames=CIVIC_COLUMNS, delimiter="\t", lineterminator="\n")
+        civic_writer.writeheader()
+        for _ in range(record_count):
+            civic_writer.writerow(get_civic_row(rng, variant_pool_size))
+
+def generate_1kg_data(output_file, record_count: int, seed: int = DEFAULT_SEED):
+    """VEP JSON lines for record_count variants at distinct, increasing positions along the chromosomes."""
+    rng = random.Random(seed)
+    records_per_chromosome = -(-record_count // len(CHROMOSOMES))
+    with open(output_file, "w") as vep_file:
+        for record_number in range(record_count):
+            if record_number % records_per_chromosome == 0:
+                position = 10_000
+            chromosome = CHROMOSOMES[record_number // records_per_chromosome]
+            position += rng.randint(1, 200)
+            vep_file.write(json.dumps(get_vep_record(rng, record_number, position, chromosome),
+                                      separators=(",", ":")) + "\n")
+
+def generate_cbioportal_data(output_file, record_count: int, seed: int = DEFAULT_SEED):
+    """The gene/chromosome/DOID JSON array written by the cBioPortal extraction, with record_count entries."""
+    rng = random.Random(seed)
+    # the extraction writes unique combinations, so draw genes for each disease without repeating them
+    genes_per_disease = min(GENE_POOL_SIZE, max(record_count // DISEASE_POOL_SIZE, 1))
+    with open(output_file, "w") as cbioportal_file:
+        cbioportal_file.write("[")
+        for record_number in range(record_count):
+            disease_index, disease_gene_number = divmod(record_number, genes_per_disease)
+            if disease_gene_number == 0:
+                gene_offset = rng.randrange(GENE_POOL_SIZE)
+            # 7919 is prime, so a disease's genes are distinct
+            gene_index = (disease_gene_number * 7919 + gene_offset) % GENE_POOL_SIZE
+            entrez_gene_id, gene_symbol, chromosome = get_gene(gene_index)
+            doid, _ = get_disease(disease_index % DISEASE_POOL_SIZE)
+            if disease_index >= DISEASE_POOL_SIZE:
+                doid = f"DOID:{10000 + disease_index}"
+            cbioportal_file.write(("," if record_number else "") + "\n  " + json.dumps(
+                {"entrez_gene_id": entrez_gene_id, "gene_symbol": gene_symbol, "chr": chromosome, "doid": doid}))
+        cbioportal_file.write("\n]\n")
+
+source_generators = {
+    "civic": generate_civic_data,
+    "1kg": generate_1kg_data,
+    "cbioportal": generate_cbioportal_data
+}
+
+def get_synthetic_data_directory_path() -> Path:
+    return get_data_output_directory_path() / "synthetic"
+
+def generate_source_data(source: str, record_count: int, seed: int = DEFAULT_SEED, data_dir: Path = None,
+                         overwrite: bool = False) -> Path:
+    """
+    Write synthetic input data for a source to data_dir, laid out like the data directory, by default where
+    its converter reads it (MIDAS_DATA_DIR). The source data committed to the repository is only replaced
+    with overwrite.
+    """
+    data_dir = Path(data_dir) if data_dir else get_data_directory_path()
+    if data_dir.resolve() == REPOSITORY_DATA_DIRECTORY.resolve() and not overwrite:
+        raise FileExistsError(f"Not writing synthetic data over the source data committed in "
+                              f"{REPOSITORY_DATA_DIRECTORY}")
+    output_file = data_dir / source_data_files[source]
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    start_time = time.time()
+    source_generators[source](output_file, record_count, seed=seed)
+    print(f"Generated {record_count} synthetic {source} records in {output_file} "
+          f"in {time.time() - start_time:.1f}s")
+    return output_file
+
+
+@click.command()
+@click.option('--records', '-n', default="10k", show_default=True, help='Records per source, e.g. 10k, 1M or 100M.')
+@click.option('--sources', '-s', 'sources', multiple=True, default=SYNTHETIC_SOURCES,
+              help='Sources to generate data for.')
+@click.option('--seed', default=DEFAULT_SEED, show_default=True)
+@click.option('--data-dir', default=None,
+              help='Directory to write the data to, laid out like data/. Defaults to data_output/synthetic.')
+@click.option('--overwrite', is_flag=True, help='Allow replacing the source data committed in data/.')
+def synthetic_data(records: str, sources: tuple, seed: int, data_dir: str, overwrite: bool):
+    """
+    Generate synthetic source data. Build a graph from it with MIDAS_DATA_DIR set to the data directory.
+    """
+    data_dir = Path(data_dir) if data_dir else get_synthetic_data_directory_path()
+    for source in sources:
+        try:
+            generate_source_data(source, parse_scale(records), seed=seed, data_dir=data_dir, overwrite=overwrite)
+        except FileExistsError as e:
+            raise click.ClickException(f"{e}, pass --overwrite to replace it")
+    print(f"Build a graph from it with {DATA_DIRECTORY_VARIABLE}={data_dir}")
+
+if __name__ == "__main__":
+    synthetic_data()
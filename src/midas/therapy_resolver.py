@@ -0,0 +1,162 @@
+import bisect
+import re
+
+from collections import defaultdict
+from pathlib import Path
+
+import pandas as pd
+
+from midas.util import get_data_directory_path
+
+# primary separators between the drugs of a regimen
+SEPARATOR_PATTERN = re.compile(r"(?:/|,|;|\+|&|\band\b|\bwith\b)", flags=re.IGNORECASE)
+PARENTHETICAL_PATTERN = re.compile(r"\([^)]*\)")
+# hyphen variants, used to split regimens like 'Cytarabine-Daunorubicin-Etoposide' as a fallback
+HYPHEN_PATTERN = re.compile(r"[-–—]")
+STOPWORDS_PATTERN = re.compile(r"\b(?:regimen|combination|combo|therapy|therapies)\b", flags=re.IGNORECASE)
+NON_TOKEN_CHARACTERS_PATTERN = re.compile(r"[^a-z0-9+\-\s]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+DEFAULT_MIN_SIMILARITY = 0.6
+# shorter tokens are too ambiguous for prefix matches
+MIN_PREFIX_LENGTH = 5
+
+
+def get_civic_therapies_path() -> Path:
+    return get_data_directory_path() / "CIViC" / "civic_therapies.csv"
+
+def split_therapy(therapy: str) -> list:
+    """
+    Split a therapy string into drug names on / , ; + & and/with, ignoring parenthetical annotations.
+    If that leaves a single name, try splitting it on hyphens instead.
+    """
+    therapy = str(therapy)
+    tokens = [token.strip(" .") for token in SEPARATOR_PATTERN.split(PARENTHETICAL_PATTERN.sub("", therapy))]
+    tokens = [token for token in tokens if token]
+    if len(tokens) >= 2:
+        return tokens
+    hyphen_tokens = [token.strip(" .") for token in HYPHEN_PATTERN.split(tokens[0] if tokens else therapy)]
+    hyphen_tokens = [token for token in hyphen_tokens if token]
+    return hyphen_tokens if len(hyphen_tokens) >= 2 else tokens
+
+def canonicalize_token(token: str) -> str:
+    """Lowercase, remove stopwords and punctuation other than + and -, collapse whitespace. May return ''."""
+    token = STOPWORDS_PATTERN.sub(" ", token.strip()).lower()
+    return WHITESPACE_PATTERN.sub(" ", NON_TOKEN_CHARACTERS_PATTERN.sub("", token)).strip()
+
+def get_canonical_tokens(therapy) -> list:
+    if pd.isna(therapy) or str(therapy).strip() == "":
+        return []
+    canonical_tokens = [canonicalize_token(token) for token in split_therapy(therapy)]
+    return [token for token in canonical_tokens if token]
+
+def get_trigrams(token: str) -> set:
+    padded_token = f"  {token} "
+    return {padded_token[i:i + 3] for i in range(len(padded_token) - 2)}
+
+
+class TherapyResolver:
+    """
+    Resolves CIViC therapy strings to NCIT identifiers using the CIViC therapies export (columns therapy and ncitId).
+
+    A therapy string is split into drug names once and each name is canonicalized (order-insensitive, hyphen-aware).
+    Multi-drug regimens resolve to a single combination NCIT id when CIViC has one, otherwise to the NCIT ids of the
+    individual drugs. With fuzzy, drug names without an exact match fall back to a unique prefix match or the most
+    similar known name by trigram similarity. That can attach the wrong drug, so it's off unless asked for.
+    Results are memoized per therapy string, CIViC repeats the same regimens a lot.
+    """
+    def __init__(self, therapies: pd.DataFrame, fuzzy: bool = False, min_similarity: float = DEFAULT_MIN_SIMILARITY):
+        if "therapy" not in therapies.columns or "ncitId" not in therapies.columns:
+            raise ValueError("The therapies file must contain columns: 'therapy' and 'ncitId'")
+        self.fuzzy = fuzzy
+        self.min_similarity = min_similarity
+        self.combo_ids = {}
+        self.token_ids = {}
+        for therapy, ncit_id in zip(therapies["therapy"], therapies["ncitId"]):
+            combo_key = tuple(sorted(set(get_canonical_tokens(therapy))))
+            if not combo_key or pd.isna(ncit_id):
+                continue
+            # the first occurrence of a name wins
+            if len(combo_key) == 1:
+                self.token_ids.setdefault(combo_key[0], str(ncit_id))
+            else:
+                self.combo_ids.setdefault(combo_key, str(ncit_id))
+
+        # every known drug name, including the ones that only occur in combinations, can be a fuzzy match
+        self.known_token_set = set(self.token_ids) | {token for combo_key in self.combo_ids for token in combo_key}
+        self.known_tokens = sorted(self.known_token_set)
+        self.trigram_index = defaultdict(list)
+        for token in self.known_tokens:
+            for trigram in get_trigrams(token):
+                self.trigram_index[trigram].append(token)
+        self.resolved_therapies = {}
+        self.resolved_tokens = {}
+
+    @classmethod
+    def from_csv(cls, therapies_path=None, **kwargs):
+        therapies_path = therapies_path or get_civic_therapies_path()
+        return cls(pd.read_csv(therapies_path, usecols=["therapy", "ncitId"], dtype="string"), **kwargs)
+
+    def find_prefix_match(self, token: str) -> str | None:
+        # a truncated name matches when exactly one known name starts with it
+        if len(token) < MIN_PREFIX_LENGTH:
+            return None
+        position = bisect.bisect_left(self.known_tokens, token)
+        matches = self.known_tokens[position:position + 2]
+        matches = [match for match in matches if match.startswith(token)]
+        return matches[0] if len(matches) == 1 else None
+
+    def find_similar_token(self, token: str) -> str | None:
+        trigrams = get_trigrams(token)
+        shared_trigram_counts = defaultdict(int)
+        for trigram in trigrams:
+            for candidate in self.trigram_index.get(trigram, ()):
+                shared_trigram_counts[candidate] += 1
+        best_token, best_similarity = None, self.min_similarity
+        for candidate, shared_count in shared_trigram_counts.items():
+            similarity = shared_count / (len(trigrams) + len(get_trigrams(candidate)) - shared_count)
+            if similarity > best_similarity or (similarity == best_similarity and best_token is not None
+                                                and candidate < best_token):
+                best_token, best_similarity = candidate, similarity
+        return best_token
+
+    def resolve_token(self, token: str) -> str:
+        """Return the known drug name for a canonical token, or the token itself if there is no match."""
+        if not self.fuzzy or token in self.known_token_set:
+            return token
+        resolved_token = self.resolved_tokens.get(token)
+        if resolved_token is None:
+            resolved_token = self.find_prefix_match(token) or self.find_similar_token(token) or token
+            self.resolved_tokens[token] = resolved_token
+        return resolved_token
+
+    def resolve(self, therapy) -> tuple:
+        """Return (combination NCIT id or None, list of per-drug NCIT ids) for a therapy string."""
+        if pd.isna(therapy):
+            return None, []
+        resolution = self.resolved_therapies.get(therapy)
+        if resolution is None:
+            tokens = [self.resolve_token(token) for token in get_canonical_tokens(therapy)]
+            combo_key = tuple(sorted(set(tokens)))
+            combo_id = self.combo_ids.get(combo_key) if len(combo_key) >= 2 else None
+            token_ids = list(dict.fromkeys(self.token_ids[token] for token in tokens if token in self.token_ids))
+            resolution = (combo_id, token_ids)
+            self.resolved_therapies[therapy] = resolution
+        return resolution
+
+    def resolve_ncit_ids(self, therapy) -> list:
+        """The preferred NCIT ids for a therapy: the combination id if there is one, otherwise the per-drug ids."""
+        combo_id, token_ids = self.resolve(therapy)
+        return [combo_id] if combo_id else token_ids
+
+    def resolve_column(self, therapies: pd.Series) -> pd.DataFrame:
+        """Resolve a column of therapy strings into ncit_combo_id, ncit_token_ids and ncit_ids columns."""
+        unique_therapies = therapies.dropna().unique()
+        resolutions = [self.resolve(therapy) for therapy in unique_therapies]
+        combo_ids = dict(zip(unique_therapies, [combo_id for combo_id, _ in resolutions]))
+        token_ids = dict(zip(unique_therapies, [",".join(ids) if ids else None for _, ids in resolutions]))
+        resolved = pd.DataFrame({"ncit_combo_id": therapies.map(combo_ids).astype("string"),
+                                 "ncit_token_ids": therapies.map(token_ids).astype("string")},
+                                index=therapies.index)
+        resolved["ncit_ids"] = resolved["ncit_combo_id"].fillna(resolved["ncit_token_ids"])
+        return resolved
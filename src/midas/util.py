@@ -1,31 +1,54 @@
+import os
+
 from pathlib import Path
 
 from orion.kgx_file_writer import KGXFileWriter
 
+from midas.dedup import DedupKGXFileWriter
+
+
+# the data directories can be moved, e.g. the benchmarks build synthetic graphs in their own workspace
+DATA_DIRECTORY_VARIABLE = "MIDAS_DATA_DIR"
+DATA_OUTPUT_DIRECTORY_VARIABLE = "MIDAS_DATA_OUTPUT_DIR"
+
+
+# the source data committed to the repository
+REPOSITORY_DATA_DIRECTORY = Path(__file__).parent.parent.parent / "data"
+
 
 def get_data_directory_path():
-    output_dir = Path(__file__).parent.parent.parent / "data"
-    output_dir.mkdir(exist_ok=True)
+    output_dir = Path(os.environ.get(DATA_DIRECTORY_VARIABLE) or REPOSITORY_DATA_DIRECTORY)
+    output_dir.mkdir(parents=True, exist_ok=True)
     return output_dir
 
 def get_data_output_directory_path():
-    output_dir = Path(__file__).parent.parent.parent / "data_output"
-    output_dir.mkdir(exist_ok=True)
+    output_dir = Path(os.environ.get(DATA_OUTPUT_DIRECTORY_VARIABLE) or
+                      Path(__file__).parent.parent.parent / "data_output")
+    output_dir.mkdir(parents=True, exist_ok=True)
     return output_dir
 
 def get_kg_output_directory_path():
-    output_dir = Path(__file__).parent.parent.parent / "data_output" / "kgs"
-    output_dir.mkdir(exist_ok=True)
+    output_dir = get_data_output_directory_path() / "kgs"
+    output_dir.mkdir(parents=True, exist_ok=True)
     return output_dir
 
-def get_kgx_output_file_writer(source_name: str) -> KGXFileWriter:
+def get_source_kgx_files(source: str) -> list:
+    source_dir = get_kg_output_directory_path() / source
+    return [source_dir / f"{source}_nodes.jsonl", source_dir / f"{source}_edges.jsonl"]
+
+def get_source_normalized_files(source: str) -> list:
+    source_dir = get_kg_output_directory_path() / source
+    return [source_dir / f"{source}_normalized_nodes.jsonl", source_dir / f"{source}_normalized_edges.jsonl"]
+
+def get_kgx_output_file_writer(source_name: str, max_buffered_nodes: int = None) -> DedupKGXFileWriter:
     output_dir = get_kg_output_directory_path() / source_name
     output_dir.mkdir(exist_ok=True)
     output_nodes_path = output_dir / f"{source_name}_nodes.jsonl"
     output_edges_path = output_dir / f"{source_name}_edges.jsonl"
     kgx_file_writer = KGXFileWriter(nodes_output_file_path=str(output_nodes_path),
                                     edges_output_file_path=str(output_edges_path))
-    return kgx_file_writer
+    # converters write the same nodes many times, merge them so each node is written once
+    return DedupKGXFileWriter(kgx_file_writer, max_buffered_nodes=max_buffered_nodes, spill_dir=str(output_dir))
 
 def format_hgvsg(hgvsg, spdi):
     if hgvsg.startswith("NC_"):
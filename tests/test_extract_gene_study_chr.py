@@ -0,0 +1,28 @@
+import importlib.util
+import io
+import json
+
+from pathlib import Path
+
+import pytest
+
+EXTRACTOR_PATH = Path(__file__).parent.parent / "scripts" / "cbioportal" / "2_process" / "extract_gene_study_chr.py"
+
+
+def load_extractor():
+    spec = importlib.util.spec_from_file_location("extract_gene_study_chr", EXTRACTOR_PATH)
+    extractor = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(extractor)
+    return extractor
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 7, 64])
+def test_iterate_json_array_splits_multibyte_characters(read_size):
+    extractor = load_extractor()
+    # the stdlib fallback is the reader without ijson
+    extractor.ijson = None
+    records = [{"studyId": "café_tcga", "chr": "17", "entrezGeneId": 7157, "note": "ß–🧬"},
+               {"studyId": "naïve_study", "chr": "X", "entrezGeneId": 672, "note": "日本語"}]
+    data = json.dumps(records, ensure_ascii=False).encode("utf-8")
+    assert list(extractor.iterate_json_array(io.BytesIO(data), read_size=read_size)) == records
+
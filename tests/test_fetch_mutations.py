@@ -0,0 +1,102 @@
+import asyncio
+import importlib.util
+import json
+import threading
+
+from pathlib import Path
+
+import pytest
+
+DOWNLOADER_PATH = Path(__file__).parent.parent / "scripts" / "cbioportal" / "1_download" / "fetch_mutations.py"
+
+STUDIES = {
+    "study_a": {
+        "molecular-profiles": [{"molecularProfileId": "study_a_mutations",
+                                "molecularAlterationType": "MUTATION_EXTENDED"},
+                               {"molecularProfileId": "study_a_cna",
+                                "molecularAlterationType": "COPY_NUMBER_ALTERATION"}],
+        "sample-lists": [{"sampleListId": "study_a_sequenced", "category": "all_cases_with_mutation_data"},
+                         {"sampleListId": "study_a_all", "category": "all_cases_in_study"}]
+    },
+    # no categorized sample lists, the downloader falls back to the conventional names
+    "study_b": {
+        "molecular-profiles": [{"molecularProfileId": "study_b_mutations",
+                                "molecularAlterationType": "MUTATION_EXTENDED"}],
+        "sample-lists": [{"sampleListId": "study_b_all"}, {"sampleListId": "study_b_custom"}]
+    }
+}
+MUTATIONS = {
+    ("study_a_mutations", "study_a_sequenced"): [{"entrezGeneId": 7157, "chr": "17", "studyId": "study_a"}],
+    ("study_a_mutations", "study_a_all"): [{"entrezGeneId": 7157, "chr": "17", "studyId": "study_a"}],
+    ("study_a_cna", "study_a_sequenced"): [{"entrezGeneId": 672, "chr": "17", "studyId": "study_a"}],
+    ("study_b_mutations", "study_b_all"): [{"entrezGeneId": 672, "chr": "17", "studyId": "study_b"}],
+    ("study_b_mutations", "study_b_custom"): [{"entrezGeneId": 672, "chr": "17", "studyId": "study_b"}]
+}
+EXPECTED_FILES = ["study_a_mutations_study_a_sequenced.json", "study_b_mutations_study_b_all.json"]
+
+
+def load_downloader():
+    spec = importlib.util.spec_from_file_location("fetch_mutations", DOWNLOADER_PATH)
+    downloader = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(downloader)
+    return downloader
+
+
+@pytest.fixture
+def stand_in():
+    fetch_mutations = load_downloader()
+    server = fetch_mutations.serve_cbioportal_stand_in(STUDIES, MUTATIONS, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield fetch_mutations, server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def download(fetch_mutations, server, output_dir: Path) -> dict:
+    downloader = fetch_mutations.CBioPortalDownloader(output_dir,
+                                                      base_url=f"http://127.0.0.1:{server.server_port}",
+                                                      workers=4,
+                                                      requests_per_second=1000)
+    return asyncio.run(downloader.run())
+
+
+def get_mutation_requests(server) -> list:
+    return sorted(request for request in server.RequestHandlerClass.requests if "/mutations" in request[0])
+
+
+def test_only_mutation_profiles_and_sequenced_sample_lists_are_downloaded(stand_in, tmp_path):
+    fetch_mutations, server = stand_in
+    counts = download(fetch_mutations, server, tmp_path)
+    assert counts["downloaded"] == 2 and counts["failed"] == 0
+    assert get_mutation_requests(server) == [
+        ("/molecular-profiles/study_a_mutations/mutations?sampleListId=study_a_sequenced", 200),
+        ("/molecular-profiles/study_b_mutations/mutations?sampleListId=study_b_all", 200)]
+    assert sorted(path.name for path in (tmp_path / "mutations").iterdir()) == EXPECTED_FILES
+    with open(tmp_path / "mutations" / EXPECTED_FILES[0]) as mutations_file:
+        assert json.load(mutations_file) == MUTATIONS[("study_a_mutations", "study_a_sequenced")]
+
+
+def test_rerun_revalidates_and_skips_unchanged_files(stand_in, tmp_path):
+    fetch_mutations, server = stand_in
+    download(fetch_mutations, server, tmp_path)
+    server.RequestHandlerClass.requests.clear()
+    counts = download(fetch_mutations, server, tmp_path)
+    assert counts["downloaded"] == 0 and counts["not_modified"] == 2
+    assert [status for _, status in get_mutation_requests(server)] == [304, 304]
+
+
+def test_leftover_part_file_is_downloaded_again(stand_in, tmp_path):
+    fetch_mutations, server = stand_in
+    download(fetch_mutations, server, tmp_path)
+    # a download that was killed mid transfer leaves only the .part file
+    output_path = tmp_path / "mutations" / EXPECTED_FILES[0]
+    output_path.unlink()
+    output_path.with_name(output_path.name + ".part").write_text('[{"entrezGeneId": 71')
+    server.RequestHandlerClass.requests.clear()
+    counts = download(fetch_mutations, server, tmp_path)
+    assert counts["downloaded"] == 1 and counts["not_modified"] == 1
+    assert sorted(path.name for path in (tmp_path / "mutations").iterdir()) == EXPECTED_FILES
+    with open(output_path) as mutations_file:
+        assert json.load(mutations_file) == MUTATIONS[("study_a_mutations", "study_a_sequenced")]
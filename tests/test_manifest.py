@@ -0,0 +1,12 @@
+from midas import convert_data, neptune_csv
+from midas.manifest import get_module_source_files
+
+
+def get_source_file_names(module) -> set:
+    return {source_file.name for source_file in get_module_source_files(module)}
+
+
+def test_stage_inputs_include_the_imported_helper_modules():
+    assert {"convert_data.py", "therapy_resolver.py", "chunking.py", "dedup.py", "util.py"} <= \
+        get_source_file_names(convert_data)
+    assert {"neptune_csv.py", "columnar.py"} <= get_source_file_names(neptune_csv)
@@ -0,0 +1,40 @@
+from robokop_genetics.genetics_normalization import GeneticsNormalizer
+from robokop_genetics.services.clingen import ClinGenSynonymizationResult
+
+from midas.norm_cache import NormalizationCache, VariantNormalizationCache
+
+VARIANT_ID = "CAID:CA000001"
+
+
+class ClinGenStandIn:
+    """Answers batch lookups with a request error during an outage, with the variant afterwards."""
+    def __init__(self):
+        self.outage = True
+        self.looked_up = []
+
+    def get_batch_of_synonyms(self, curies: list) -> list:
+        self.looked_up.extend(curies)
+        if self.outage:
+            return [ClinGenSynonymizationResult(success=False, error_type="RequestException",
+                                                error_message="Connection refused") for _ in curies]
+        return [ClinGenSynonymizationResult(success=True, id=curie, name=curie, equivalent_identifiers=[curie])
+                for curie in curies]
+
+
+def test_failed_variant_lookups_are_looked_up_again(tmp_path):
+    clingen = ClinGenStandIn()
+    with NormalizationCache(tmp_path / "normalization_cache.sqlite") as normalization_cache:
+        for _ in range(2):
+            # every build creates its own normalizer on the shared cache
+            genetics_normalizer = GeneticsNormalizer(use_cache=False)
+            genetics_normalizer.sequence_variant_node_types = ["biolink:SequenceVariant"]
+            genetics_normalizer.clingen = clingen
+            genetics_normalizer.cache = VariantNormalizationCache(normalization_cache, "variants:test")
+            normalizations = genetics_normalizer.normalize_variants([VARIANT_ID])
+            clingen.outage = False
+        assert clingen.looked_up == [VARIANT_ID, VARIANT_ID]
+        assert normalizations[VARIANT_ID][0]["id"] == VARIANT_ID
+
+        # the successful lookup is cached
+        genetics_normalizer.normalize_variants([VARIANT_ID])
+        assert clingen.looked_up == [VARIANT_ID, VARIANT_ID]
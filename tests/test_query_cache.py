@@ -0,0 +1,31 @@
+from midas.query_cache import GraphVersionError, GraphVersionTracker, LocalGraphVersionStore
+
+
+class FlakyVersionStore:
+    def __init__(self, version_store):
+        self.version_store = version_store
+        self.reachable = True
+
+    def get_version(self):
+        if not self.reachable:
+            raise GraphVersionError("unreachable")
+        return self.version_store.get_version()
+
+
+def test_tracker_keeps_the_last_version_when_the_store_is_unreachable(tmp_path):
+    version_store = LocalGraphVersionStore(tmp_path / "graph_version")
+    version_store.set_version("1")
+    flaky_store = FlakyVersionStore(version_store)
+    version_tracker = GraphVersionTracker(flaky_store)
+    assert not version_tracker.check()
+    assert version_tracker.graph_version == "1"
+
+    flaky_store.reachable = False
+    assert not version_tracker.check(force=True)
+    assert version_tracker.graph_version == "1"
+
+    flaky_store.reachable = True
+    assert not version_tracker.check(force=True)
+    version_store.set_version("2")
+    assert version_tracker.check(force=True)
+    assert version_tracker.graph_version == "2"